@@ -0,0 +1,204 @@
+import asyncio
+import hashlib
+import json
+import os
+from collections import OrderedDict
+
+from utils.evaluation_cache import normalize_answer
+
+
+def row_id(row):
+    """Stable id of an input row: its own "id", else a hash of (student, question_number, answer)."""
+    if row.get("id") is not None:
+        return str(row["id"])
+    digest = hashlib.sha256()
+    for part in (row.get("student"), row.get("question_number"), row.get("answer")):
+        digest.update(str(part).encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()[:20]
+
+
+def parse_rows(lines):
+    """Parse JSONL input lines; malformed lines become error rows instead of aborting the run."""
+    rows = []
+    for line_number, line in enumerate(lines, start=1):
+        row = _parse_row(line, line_number)
+        if row is not None:
+            rows.append(row)
+    return rows
+
+
+async def aparse_rows(lines):
+    """parse_rows() over an async iterable of lines, yielding rows as the lines arrive."""
+    line_number = 0
+    async for line in lines:
+        line_number += 1
+        row = _parse_row(line, line_number)
+        if row is not None:
+            yield row
+
+
+async def split_lines(chunks):
+    """Lines of an async stream of byte chunks (e.g. a request body), as they complete."""
+    partial = b""
+    async for chunk in chunks:
+        *lines, partial = (partial + chunk).split(b"\n")
+        for line in lines:
+            yield line
+    if partial:
+        yield partial
+
+
+def _parse_row(line, line_number):
+    if isinstance(line, bytes):
+        line = line.decode("utf-8")
+    if not line.strip():
+        return None
+    try:
+        row = json.loads(line)
+        if not isinstance(row, dict):
+            raise ValueError("row is not a JSON object")
+    except ValueError as err:
+        row = {"line": line_number, "error": f"Invalid JSON: {err}"}
+    return row
+
+
+class BatchCheckpoint:
+    """
+    Append-only JSONL of finished results. Rows whose id is already in it
+    (without an error) are skipped when a run is resumed. A line cut short by
+    a crash is dropped on open, so appends always start on a fresh line.
+    """
+
+    def __init__(self, path, fsync_every=50):
+        self.path = path
+        self.fsync_every = fsync_every
+        self.done = set()
+        self._pending_sync = 0
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        if os.path.exists(path):
+            self._load()
+        self._file = open(path, "a", encoding="utf-8")
+
+    def _load(self):
+        with open(self.path, "rb") as f:
+            data = f.read()
+        complete = data[:data.rfind(b"\n") + 1]
+        if len(complete) != len(data):
+            with open(self.path, "r+b") as f:
+                f.truncate(len(complete))
+
+        for line in complete.splitlines():
+            try:
+                result = json.loads(line)
+            except ValueError:
+                continue
+            if result.get("row_id") and not result.get("error"):
+                self.done.add(result["row_id"])
+
+    def append(self, result):
+        self._file.write(json.dumps(result) + "\n")
+        self._file.flush()
+        if not result.get("error"):
+            self.done.add(result["row_id"])
+        self._pending_sync += 1
+        if self._pending_sync >= self.fsync_every:
+            os.fsync(self._file.fileno())
+            self._pending_sync = 0
+
+    def close(self):
+        if not self._file.closed:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._file.close()
+
+
+class BatchGrader:
+    """
+    Grades many (student, question_number, answer) rows against one session.
+    Identical answers to the same question (after normalisation) are graded
+    once and the result is shared. At most `concurrency` gradings are in
+    flight, never more than the process-wide LLM gate admits. Results are
+    yielded as soon as they are ready, in completion order, and appended to
+    the checkpoint if one is given.
+    """
+
+    def __init__(self, session, concurrency=8, reflect=False, checkpoint=None):
+        from utils.llm_client import get_llm_gate
+
+        self.session = session
+        # More would only queue at the gate, each holding an answer in memory
+        self.concurrency = max(1, min(concurrency, get_llm_gate().max_concurrency))
+        self.reflect = reflect
+        self.checkpoint = checkpoint
+        self.stats = {"rows": 0, "skipped": 0, "graded": 0, "deduplicated": 0, "errors": 0}
+
+    async def grade(self, rows):
+        groups = OrderedDict()
+        invalid = []
+
+        for row in rows:
+            self.stats["rows"] += 1
+            if "error" in row:
+                invalid.append((row, row["error"]))
+                continue
+            row = dict(row, row_id=row_id(row))
+            if self.checkpoint and row["row_id"] in self.checkpoint.done:
+                self.stats["skipped"] += 1
+                continue
+            try:
+                question_number = int(row["question_number"])
+                answer = str(row["answer"])
+            except (KeyError, TypeError, ValueError):
+                invalid.append((row, "Each row needs 'student', 'question_number' and 'answer'."))
+                continue
+            groups.setdefault((question_number, normalize_answer(answer)), []).append(row)
+
+        for row, error in invalid:
+            yield self._emit(self._result(row, error=error))
+
+        # `concurrency` workers take groups one at a time, so a big batch never has a task per group
+        remaining = iter(groups.items())
+        finished = asyncio.Queue()
+
+        async def worker():
+            for (question_number, _), members in remaining:
+                try:
+                    graded = await self.session.agrade(question_number, str(members[0]["answer"]), reflect=self.reflect)
+                    finished.put_nowait((members, graded, None))
+                except Exception as err:
+                    finished.put_nowait((members, None, f"{type(err).__name__}: {err}"))
+
+        workers = [asyncio.create_task(worker()) for _ in range(min(self.concurrency, len(groups)))]
+        try:
+            for _ in range(len(groups)):
+                members, graded, error = await finished.get()
+                self.stats["graded"] += 1
+                self.stats["deduplicated"] += len(members) - 1
+                for row in members:
+                    yield self._emit(self._result(row, graded, error))
+        finally:
+            for task in workers:
+                task.cancel()
+
+    def _result(self, row, graded=None, error=None):
+        result = {
+            "row_id": row.get("row_id"),
+            "student": row.get("student"),
+            "question_number": row.get("question_number"),
+            "answer": row.get("answer"),
+        }
+        if "line" in row:
+            result["line"] = row["line"]
+        if error:
+            self.stats["errors"] += 1
+            result["error"] = error
+        else:
+            result.update(graded)
+        return result
+
+    def _emit(self, result):
+        if self.checkpoint and result.get("row_id"):
+            self.checkpoint.append(result)
+        return result
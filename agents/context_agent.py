@@ -1,32 +1,130 @@
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_chroma import Chroma
-from langchain_community.document_loaders import PyPDFLoader
-from langchain_huggingface import HuggingFaceEmbeddings
+import asyncio
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from contextlib import nullcontext
+import numpy as np
+from langchain_core.documents import Document
 from utils.openai_config import get_openai_llm
+from utils.pdf_loader import load_pdf_documents
+from utils import index_registry
+from utils.embedding_service import get_embedding_service
+from utils.flat_index import FlatVectorStore, normalize_rows
+from utils.single_flight import SingleFlight
+from utils.telemetry import record_cache, traced
+
+# Stay under the vector store's per-call limit on upserts and deletes
+INDEX_BATCH_SIZE = 1000
+# "chroma" (default) or "flat" (NumPy, memory-mapped)
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "chroma")
+
+# (index, notes hash, backend, embedding, top_k, questions digest) -> retrieved chunks per question,
+# shared by every session in the process built on the same notes and questions
+CONTEXT_CACHE_SIZE = int(os.getenv("CONTEXT_CACHE_SIZE", "64"))
+_context_cache = OrderedDict()
+_context_cache_lock = threading.Lock()
+_context_builds = SingleFlight("context_batches")
+
 
 class ContextAgent:
-    def __init__(self, material_pdf_path, persist_directory):
+    def __init__(self, material_pdf_path, persist_directory, backend=None):
         self.material_pdf_path = material_pdf_path
         self.persist_directory = persist_directory
+        self.backend = backend or VECTOR_BACKEND
+        if self.backend not in ("chroma", "flat"):
+            raise ValueError(f"Unknown vector backend: {self.backend}")
         self.vectorstore = None
+        # Hash of the notes the index was built from; set by ingest_and_index()
+        self.notes_hash = None
         self.llm = get_openai_llm()
-        self.embedding = HuggingFaceEmbeddings(model_name="intfloat/e5-base-v2")
+        self.embedding = get_embedding_service()
 
-    def ingest_and_index(self):
-        loader = PyPDFLoader(self.material_pdf_path)
-        pages = loader.load()
+    @traced("context_agent.ingest_and_index")
+    def ingest_and_index(self, seed_directory=None):
+        """
+        Build the notes index for this persist directory at most once.
+        If an index built from the same notes already exists it is opened as is.
+        Otherwise the index is synced incrementally: chunks are keyed by a hash
+        of their content, so only new or edited chunks are embedded, vectors of
+        removed chunks are deleted, and unchanged vectors are kept. Re-ingestion
+        never duplicates vectors. A new, empty index is first seeded from
+        `seed_directory` (the index of the notes' previous version), so edited
+        notes only embed their edited chunks. Returns True if the index was changed.
+        """
+        notes_hash = self.notes_hash = index_registry.file_sha256(self.material_pdf_path)
+        embedding = self.embedding.identity
+        ready = index_registry.is_ready(self.persist_directory, notes_hash, self.backend, embedding)
+        record_cache("index", ready)
+        if ready:
+            self.get_vectorstore()
+            return False
 
-        splitter = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=50)
-        docs = splitter.split_documents(pages)
+        with index_registry.index_lock(self.persist_directory):
+            # Another worker may have finished indexing while we waited for the lock
+            if index_registry.is_ready(self.persist_directory, notes_hash, self.backend, embedding):
+                self.get_vectorstore()
+                return False
 
-        self.vectorstore = Chroma.from_documents(
-            documents=docs,
-            embedding=self.embedding,
-            persist_directory=self.persist_directory
-        )
+            if seed_directory and index_registry.seed_index(self.persist_directory, seed_directory, self.backend):
+                print(f"Seeded {self.persist_directory} from {seed_directory}")
+
+            from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+            pages = load_pdf_documents(self.material_pdf_path)
+
+            splitter = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=50)
+            docs = splitter.split_documents(pages)
+
+            ids = chunk_ids(docs)
+            vectorstore = self.get_vectorstore()
+
+            existing = set(vectorstore.get(include=[])["ids"])
+            manifest = index_registry.read_manifest(self.persist_directory)
+            if existing and (manifest or {}).get("embedding") != embedding:
+                # Vectors from another model: chunk ids still match, but every vector must be redone
+                print(f"Re-embedding {self.persist_directory}: index was built with {(manifest or {}).get('embedding')}")
+                self._drop_all(vectorstore, existing)
+                existing = set()
+            wanted = set(ids)
+            stale = [chunk_id for chunk_id in existing if chunk_id not in wanted]
+            added = [(chunk_id, doc) for chunk_id, doc in zip(ids, docs) if chunk_id not in existing]
+
+            # The flat store writes a whole snapshot per save; have it save once for all batches
+            with vectorstore.bulk() if self.backend == "flat" else nullcontext():
+                for start in range(0, len(stale), INDEX_BATCH_SIZE):
+                    vectorstore.delete(ids=stale[start:start + INDEX_BATCH_SIZE])
+                for start in range(0, len(added), INDEX_BATCH_SIZE):
+                    batch = added[start:start + INDEX_BATCH_SIZE]
+                    vectorstore.add_documents([doc for _, doc in batch], ids=[chunk_id for chunk_id, _ in batch])
+
+            index_registry.write_manifest(self.persist_directory, {
+                "notes_hash": notes_hash,
+                "backend": self.backend,
+                "embedding": embedding,
+                "chunk_count": len(docs),
+            })
+            print(
+                f"Indexed {self.persist_directory}: {len(added)} chunks embedded, "
+                f"{len(stale)} removed, {len(docs) - len(added)} unchanged"
+            )
+            return bool(added or stale)
+
+    def _drop_all(self, vectorstore, ids):
+        ids = list(ids)
+        with vectorstore.bulk() if self.backend == "flat" else nullcontext():
+            for start in range(0, len(ids), INDEX_BATCH_SIZE):
+                vectorstore.delete(ids=ids[start:start + INDEX_BATCH_SIZE])
 
     def get_vectorstore(self):
+        if not self.vectorstore and self.backend == "flat":
+            self.vectorstore = FlatVectorStore(
+                os.path.join(self.persist_directory, "flat"),
+                self.embedding
+            )
         if not self.vectorstore:
+            # chromadb is slow to import; only pay for it when a Chroma index is opened
+            from langchain_chroma import Chroma
             self.vectorstore = Chroma(
                 persist_directory=self.persist_directory,
                 embedding_function=self.embedding
@@ -34,6 +132,87 @@ class ContextAgent:
         # print("Vector store output: \n",self.vectorstore)
         return self.vectorstore
 
+    @traced("context_agent.retrieve_context")
     def retrieve_context(self, query, top_k=3):
         vectorstore = self.get_vectorstore()
         return vectorstore.similarity_search(query, k=top_k)
+
+    @traced("context_agent.retrieve_context_batch")
+    def retrieve_context_batch(self, queries, top_k=3):
+        """
+        Top-k chunks for many queries at once: the queries are embedded in one
+        batch and scored against every stored chunk with a single cosine
+        similarity matrix product, instead of one vector store search per query.
+        """
+        if not queries:
+            return []
+
+        stored = self.get_vectorstore().get(include=["embeddings", "documents", "metadatas"])
+        if not stored["ids"]:
+            return [[] for _ in queries]
+
+        chunk_matrix = normalize_rows(np.asarray(stored["embeddings"], dtype=np.float32))
+        query_matrix = normalize_rows(np.asarray(self.embedding.embed_queries(list(queries)), dtype=np.float32))
+
+        scores = query_matrix @ chunk_matrix.T
+        k = min(top_k, scores.shape[1])
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        order = np.argsort(-np.take_along_axis(scores, top, axis=1), axis=1)
+        top = np.take_along_axis(top, order, axis=1)
+
+        return [
+            [
+                Document(page_content=stored["documents"][i], metadata=stored["metadatas"][i] or {})
+                for i in row
+            ]
+            for row in top
+        ]
+
+    def shared_context_batch(self, queries, top_k=3):
+        """
+        retrieve_context_batch(), computed once per notes index and question
+        set and shared by every session in the process. Needs ingest_and_index()
+        to have run; without a notes hash it just retrieves.
+        """
+        if self.notes_hash is None:
+            return self.retrieve_context_batch(queries, top_k)
+
+        queries = list(queries)
+        digest = hashlib.sha256("\0".join(queries).encode("utf-8")).hexdigest()
+        key = (
+            os.path.abspath(self.persist_directory), self.notes_hash, self.backend,
+            self.embedding.identity, top_k, digest,
+        )
+        with _context_cache_lock:
+            if key in _context_cache:
+                _context_cache.move_to_end(key)
+                record_cache("context", True)
+                return _context_cache[key]
+        record_cache("context", False)
+
+        # Sessions built at the same time wait for one scan instead of each running their own
+        docs = _context_builds.do(key, self.retrieve_context_batch, queries, top_k)
+        with _context_cache_lock:
+            _context_cache[key] = docs
+            while len(_context_cache) > CONTEXT_CACHE_SIZE:
+                _context_cache.popitem(last=False)
+        return docs
+
+    async def aingest_and_index(self, seed_directory=None):
+        # PDF parsing and embedding are CPU bound; keep them off the event loop
+        return await asyncio.to_thread(self.ingest_and_index, seed_directory)
+
+    async def aretrieve_context(self, query, top_k=3):
+        return await asyncio.to_thread(self.retrieve_context, query, top_k)
+
+
+def chunk_ids(docs):
+    """Content-derived chunk ids; repeated identical chunks get an occurrence suffix."""
+    seen = {}
+    ids = []
+    for doc in docs:
+        digest = hashlib.sha256(doc.page_content.encode("utf-8")).hexdigest()[:32]
+        count = seen.get(digest, 0)
+        seen[digest] = count + 1
+        ids.append(digest if count == 0 else f"{digest}-{count}")
+    return ids
@@ -1,11 +1,29 @@
+import asyncio
 import os
 import re
+from concurrent.futures import ThreadPoolExecutor
+from utils.artifact_cache import get_artifact_cache, llm_model_name
 from utils.openai_config import get_openai_llm
 from utils.accuracy_parser import extract_accuracy_score
 from utils.pdf_loader import load_pdf_text
+from utils.pre_scorer import AMBIGUOUS, get_pre_scorer
+from utils.prompt_budget import get_prompt_assembler
+from utils.single_flight import ainvoke_once, invoke_once
+from utils.telemetry import traced
+
+ANSWER_EXTRACTION_PROMPT = (
+    "You are a helpful assistant. Extract all numbered answers from the following text. "
+    "Each answer must be complete and self-contained. If an answer spans multiple lines, merge it into a single line. "
+    "Example:\n\n"
+    "Input:\n1. Android Inc. was founded in 2003 by Andy Rubin, Rich Miner, Nick Sears, and Chris White.\n"
+    "The company initially aimed to develop an advanced OS for cameras.\n\n"
+    "Output:\n1. Android Inc. was founded in 2003 by Andy Rubin, Rich Miner, Nick Sears, and Chris White. The company initially aimed to develop an advanced OS for cameras.\n\n"
+    "Now process the following text:\n{text}\n\nAnswers:"
+)
+
 
 class EvaluationAgent:
-    def __init__(self, prompt_path, answers_pdf_path, notes_context):
+    def __init__(self, prompt_path, answers_pdf_path, notes_context, reference_answers=None, pre_scorer=None):
         # Load evaluation prompt template
         with open(prompt_path, "r") as file:
             self.prompt_template = file.read()
@@ -13,31 +31,30 @@ class EvaluationAgent:
         self.llm = get_openai_llm()
 
         self.reference_answers = {}
-        if os.path.exists(answers_pdf_path):
+        if reference_answers is not None:
+            self.reference_answers = dict(reference_answers)
+        elif os.path.exists(answers_pdf_path):
             print(f"Found {answers_pdf_path}. Parsing reference answers...")
-            full_text = load_pdf_text(answers_pdf_path)
-            self.reference_answers = self.parse_answers(full_text)
+            # Same file, prompt and model: reuse the answers parsed before, without an LLM call
+            parsed = get_artifact_cache().get_or_create(
+                "reference_answers", answers_pdf_path, ANSWER_EXTRACTION_PROMPT, llm_model_name(self.llm),
+                lambda: list(self.parse_answers(load_pdf_text(answers_pdf_path)).items())
+            )
+            self.reference_answers = {int(number): answer for number, answer in parsed}
         else:
             print(f"{answers_pdf_path} not found! Reference answers will be generated on-the-fly.")
 
         self.notes_context = notes_context
+        self.prompt_assembler = get_prompt_assembler()
+        self.pre_scorer = pre_scorer or get_pre_scorer()
 
+    @traced("evaluation_agent.parse_answers")
     def parse_answers(self, text):
         """
         Use Llama3 to robustly extract numbered answers.
         Merges multi-line answers into single lines.
         """
-        prompt = (
-            "You are a helpful assistant. Extract all numbered answers from the following text. "
-            "Each answer must be complete and self-contained. If an answer spans multiple lines, merge it into a single line. "
-            "Example:\n\n"
-            "Input:\n1. Android Inc. was founded in 2003 by Andy Rubin, Rich Miner, Nick Sears, and Chris White.\n"
-            "The company initially aimed to develop an advanced OS for cameras.\n\n"
-            "Output:\n1. Android Inc. was founded in 2003 by Andy Rubin, Rich Miner, Nick Sears, and Chris White. The company initially aimed to develop an advanced OS for cameras.\n\n"
-            f"Now process the following text:\n{text}\n\nAnswers:"
-        )
-
-        extracted = self.llm.invoke(prompt).content
+        extracted = invoke_once(self.llm, ANSWER_EXTRACTION_PROMPT.format(text=text))
 
         # Parse: match lines starting with number dot space
         pattern = re.compile(r"^\s*(\d+)\.\s+(.+)")
@@ -64,49 +81,151 @@ class EvaluationAgent:
 
         return answers
 
+    @traced("evaluation_agent.evaluate")
     def evaluate(self, question_number, question_text, user_answer, similar_docs):
         """
         Evaluate user's answer against the reference answer.
         If reference answer is missing, generate it dynamically.
         """
+        reference_answer = self.reference_answer(question_number, question_text, similar_docs)
+
+        # Shortcut: exact match
+        if user_answer.strip().lower() == reference_answer.strip().lower():
+            return "Feedback: Perfect match! Your answer is exactly correct.", 100, reference_answer
+
+        # Clear-cut answers (near-verbatim, empty, off-topic) are graded locally; only ambiguous ones go to the LLM
+        pre_score = self.pre_scorer.score(user_answer, reference_answer)
+        if pre_score.decision != AMBIGUOUS:
+            return f"Feedback: {pre_score.feedback}", pre_score.accuracy, reference_answer
+
+        prompt = self._evaluation_prompt(question_text, user_answer, reference_answer, similar_docs)
+        response = invoke_once(self.llm, prompt)
+
+        feedback, accuracy = self._parse_evaluation(response)
+        return feedback, accuracy, reference_answer
+
+    @traced("evaluation_agent.evaluate")
+    async def aevaluate(self, question_number, question_text, user_answer, similar_docs):
+        """Async variant of evaluate(); LLM calls go through ainvoke."""
+        reference_answer = await self.areference_answer(question_number, question_text, similar_docs)
+
+        if user_answer.strip().lower() == reference_answer.strip().lower():
+            return "Feedback: Perfect match! Your answer is exactly correct.", 100, reference_answer
+
+        pre_score = await asyncio.to_thread(self.pre_scorer.score, user_answer, reference_answer)
+        if pre_score.decision != AMBIGUOUS:
+            return f"Feedback: {pre_score.feedback}", pre_score.accuracy, reference_answer
+
+        prompt = self._evaluation_prompt(question_text, user_answer, reference_answer, similar_docs)
+        response = await ainvoke_once(self.llm, prompt)
+
+        feedback, accuracy = self._parse_evaluation(response)
+        return feedback, accuracy, reference_answer
+
+    def reference_answer(self, question_number, question_text, similar_docs):
+        """The reference answer for a question, generated dynamically (and kept) if there is none."""
         reference_answer = self.reference_answers.get(question_number, "")
 
         if not reference_answer:
             print(f"No reference answer found for Q{question_number}. Generating dynamically...")
-            context_text = "\n\n".join(doc.page_content for doc in similar_docs)
-            gen_prompt = (
-                f"Generate a complete and factual answer for the following question using only the given context:\n\n"
-                f"Question: {question_text}\n\n"
-                f"Context:\n{context_text}\n\n"
-                f"Answer:"
-            )
-            reference_answer = self.llm.invoke(gen_prompt).content.strip()
+            gen_prompt = self._reference_prompt(question_text, similar_docs)
+            reference_answer = invoke_once(self.llm, gen_prompt).strip()
             self.reference_answers[question_number] = reference_answer
-            # print(f"Generated Reference Answer: {reference_answer}")
+        return reference_answer
 
-        # Shortcut: exact match
-        if user_answer.strip().lower() == reference_answer.strip().lower():
-            return "Feedback: Perfect match! Your answer is exactly correct.", 100
+    async def areference_answer(self, question_number, question_text, similar_docs):
+        """Async variant of reference_answer()."""
+        reference_answer = self.reference_answers.get(question_number, "")
 
-        context_text = "\n\n".join(doc.page_content for doc in similar_docs)
+        if not reference_answer:
+            print(f"No reference answer found for Q{question_number}. Generating dynamically...")
+            gen_prompt = self._reference_prompt(question_text, similar_docs)
+            reference_answer = (await ainvoke_once(self.llm, gen_prompt)).strip()
+            self.reference_answers[question_number] = reference_answer
+        return reference_answer
+
+    @traced("evaluation_agent.generate_reference_answers")
+    async def agenerate_reference_answers(self, questions, similar_docs, max_concurrency=4):
+        """
+        Generate every missing reference answer up front instead of on first submit.
+        `questions` are (number, text) pairs and `similar_docs` the retrieved context
+        for each, in the same order. At most `max_concurrency` LLM calls run at once.
+        Failed generations are left missing and fall back to on-the-fly generation.
+        Returns the question numbers that were generated.
+        """
+        missing = self._missing_references(questions, similar_docs, max_concurrency)
+        semaphore = asyncio.Semaphore(max(1, max_concurrency))
+
+        async def generate(number, text, docs):
+            async with semaphore:
+                response = await ainvoke_once(self.llm, self._reference_prompt(text, docs))
+            self.reference_answers[number] = response.strip()
+
+        results = await asyncio.gather(*[generate(*item) for item in missing], return_exceptions=True)
+        return self._generated_references(missing, results)
+
+    @traced("evaluation_agent.generate_reference_answers")
+    def generate_reference_answers(self, questions, similar_docs, max_concurrency=4):
+        """Thread-pool variant of agenerate_reference_answers() for ingestion stages and session builds."""
+        missing = self._missing_references(questions, similar_docs, max_concurrency)
+        if not missing:
+            return []
+
+        def generate(number, text, docs):
+            self.reference_answers[number] = invoke_once(self.llm, self._reference_prompt(text, docs)).strip()
+
+        with ThreadPoolExecutor(max_workers=max(1, max_concurrency)) as pool:
+            futures = [pool.submit(generate, *item) for item in missing]
+            results = [future.exception() for future in futures]
+        return self._generated_references(missing, results)
+
+    def _missing_references(self, questions, similar_docs, max_concurrency):
+        missing = [
+            (number, text, docs)
+            for (number, text), docs in zip(questions, similar_docs)
+            if not self.reference_answers.get(number)
+        ]
+        if missing:
+            print(f"Generating {len(missing)} missing reference answers ({max_concurrency} at a time)...")
+        return missing
+
+    @staticmethod
+    def _generated_references(missing, results):
+        generated = []
+        for (number, _, _), result in zip(missing, results):
+            if isinstance(result, Exception):
+                print(f"❌ Reference answer generation failed for Q{number}: {result}")
+            else:
+                generated.append(number)
+        return generated
+
+    def _reference_prompt(self, question_text, similar_docs):
+        _, context_text = self.prompt_assembler.fit(
+            "", [doc.page_content for doc in similar_docs], label="reference"
+        )
+        return (
+            f"Generate a complete and factual answer for the following question using only the given context:\n\n"
+            f"Question: {question_text}\n\n"
+            f"Context:\n{context_text}\n\n"
+            f"Answer:"
+        )
+
+    def _evaluation_prompt(self, question_text, user_answer, reference_answer, similar_docs):
+        notes_context, context_text = self.prompt_assembler.fit(
+            self.notes_context, [doc.page_content for doc in similar_docs], label="evaluate"
+        )
 
         # Fill prompt
-        prompt = self.prompt_template.format(
+        return self.prompt_template.format(
             question=question_text,
             user_answer=user_answer,
             expected_answers=reference_answer,
-            notes_context=self.notes_context,
+            notes_context=notes_context,
             similar_context=context_text
         )
 
-        # print("\n=== EVAL PROMPT ===\n")
-        # print(prompt)
-
-        response = self.llm.invoke(prompt).content
-
-        # print("\n=== LLM RESPONSE ===\n")
-        # print(response)
-
+    @staticmethod
+    def _parse_evaluation(response):
         # Parse feedback and accuracy
         feedback = None
         for line in response.splitlines():
@@ -123,24 +242,53 @@ class EvaluationAgent:
         if feedback is None:
             feedback = response  # fallback
 
-        return feedback, accuracy,reference_answer
+        return feedback, accuracy
 
-    def generate_direct_hint(self, question: str, similar_context: str,
+    @traced("evaluation_agent.generate_direct_hint")
+    def generate_direct_hint(self, question: str, similar_context: str | list[str],
                              hint_prompt_path="prompts/hint_prompt.txt") -> str:
         try:
-            with open(hint_prompt_path, "r") as file:
-                prompt_template = file.read()
+            prompt = self._hint_prompt(question, similar_context, hint_prompt_path)
+            return invoke_once(self.llm, prompt).strip()
 
-            prompt = prompt_template.format(
-                question=question,
-                notes_context=self.notes_context,
-                similar_context=similar_context
-            )
+        except Exception as err:
+            print(f"❌ Failed to generate direct hint: {err}")
+            return "⚠️ Failed to generate hint due to internal error."
 
-            result = self.llm.invoke(prompt)
-            return getattr(result, "content", str(result)).strip()
+    @traced("evaluation_agent.generate_direct_hint")
+    async def agenerate_direct_hint(self, question: str, similar_context: str | list[str],
+                                    hint_prompt_path="prompts/hint_prompt.txt") -> str:
+        try:
+            prompt = self._hint_prompt(question, similar_context, hint_prompt_path)
+            return (await ainvoke_once(self.llm, prompt)).strip()
 
         except Exception as err:
             print(f"❌ Failed to generate direct hint: {err}")
             return "⚠️ Failed to generate hint due to internal error."
 
+    @traced("evaluation_agent.generate_direct_hint")
+    async def astream_direct_hint(self, question: str, similar_context: str | list[str],
+                                  hint_prompt_path="prompts/hint_prompt.txt"):
+        """Yield the hint text token by token as the LLM produces it."""
+        try:
+            prompt = self._hint_prompt(question, similar_context, hint_prompt_path)
+            async for chunk in self.llm.astream(prompt):
+                if chunk.content:
+                    yield chunk.content
+
+        except Exception as err:
+            print(f"❌ Failed to stream direct hint: {err}")
+            yield "⚠️ Failed to generate hint due to internal error."
+
+    def _hint_prompt(self, question, similar_context, hint_prompt_path):
+        with open(hint_prompt_path, "r") as file:
+            prompt_template = file.read()
+
+        notes_context, similar_context = self.prompt_assembler.fit(
+            self.notes_context, similar_context, label="hint"
+        )
+        return prompt_template.format(
+            question=question,
+            notes_context=notes_context,
+            similar_context=similar_context
+        )
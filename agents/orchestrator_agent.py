@@ -33,8 +33,7 @@ class OrchestratorAgent:
 
                 # print("Top k=3: ",context_docs)
 
-                reference_answer = self.e_agent.reference_answers.get(question_number, "")
-                raw_feedback, accuracy = self.e_agent.evaluate(
+                raw_feedback, accuracy, reference_answer = self.e_agent.evaluate(
                     question_number,
                     question_text,
                     user_answer,
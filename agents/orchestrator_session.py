@@ -1,14 +1,63 @@
 from agents.orchestrator_agent import OrchestratorAgent
+from utils.evaluation_cache import get_evaluation_cache, version_key
+from utils.pre_scorer import ACCEPT_FEEDBACK, is_local_feedback
+import asyncio
 import uuid
 
+PERFECT_REFLECTION = "Great job — your answer fully addresses the question and shows solid understanding. Keep it up!"
+
+
 class OrchestratorSession:
-    def __init__(self, orchestrator: OrchestratorAgent, session_id=None, user_id=None):
+    def __init__(self, orchestrator: OrchestratorAgent, session_id=None, user_id=None, evaluation_cache=None):
         self.orchestrator = orchestrator
+        self.evaluation_cache = evaluation_cache or get_evaluation_cache()
         self.session_id = session_id or str(uuid.uuid4())
         self.user_id = user_id or str(uuid.uuid4())
         self.current_index = 0
         self.results = []
         self.waiting_for_retry = False
+        # question index -> retrieved context docs, fixed once the questions are parsed
+        self.context_docs = {}
+        self._precompute_context()
+
+    def to_state(self):
+        return {
+            "current_index": self.current_index,
+            "results": self.results,
+            "waiting_for_retry": self.waiting_for_retry
+        }
+
+    def restore_state(self, state):
+        self.current_index = state["current_index"]
+        self.results = list(state["results"])
+        self.waiting_for_retry = state["waiting_for_retry"]
+
+    def _precompute_context(self):
+        q = self.orchestrator.q_agent
+        questions = [q.get_question(i) for i in range(q.total_questions())]
+        try:
+            for index, docs in enumerate(self.orchestrator.c_agent.shared_context_batch(questions)):
+                self.context_docs[index] = docs
+        except Exception as err:
+            print(f"Context precompute failed, falling back to per-question retrieval: {err}")
+
+    def prepare_reference_answers(self, max_concurrency=4):
+        """Generate all missing reference answers now, so no graded answer waits on one."""
+        q = self.orchestrator.q_agent
+        docs = [self._context_for(i) for i in range(q.total_questions())]
+        return self.orchestrator.e_agent.generate_reference_answers(q.questions, docs, max_concurrency)
+
+    def _context_for(self, index):
+        if index not in self.context_docs:
+            question_text = self.orchestrator.q_agent.get_question(index)
+            self.context_docs[index] = self.orchestrator.c_agent.retrieve_context(question_text)
+        return self.context_docs[index]
+
+    async def _acontext_for(self, index):
+        if index not in self.context_docs:
+            question_text = self.orchestrator.q_agent.get_question(index)
+            self.context_docs[index] = await self.orchestrator.c_agent.aretrieve_context(question_text)
+        return self.context_docs[index]
 
     def get_current_question(self):
         if self.current_index >= self.orchestrator.q_agent.total_questions():
@@ -22,23 +71,301 @@ class OrchestratorSession:
         return self.current_index >= self.orchestrator.q_agent.total_questions()
 
     def get_final_summary(self):
+        return self.orchestrator.r_agent.generate_final_summary(**self._summary_inputs())
+
+    async def aget_final_summary(self):
+        return await self.orchestrator.r_agent.agenerate_final_summary(**self._summary_inputs())
+
+    def _summary_inputs(self):
         avg_accuracy = sum(r["accuracy"] for r in self.results) / len(self.results) if self.results else 0
         low_scores = [r for r in self.results if r["accuracy"] < 80]
 
-        final_summary = self.orchestrator.r_agent.generate_final_summary(
-            avg_accuracy=avg_accuracy,
-            weak_points=[r["question"] for r in low_scores],
-            notes_context=self.orchestrator.e_agent.notes_context
+        return {
+            "avg_accuracy": avg_accuracy,
+            "weak_points": [r["question"] for r in low_scores],
+            "notes_context": self.orchestrator.e_agent.notes_context
+        }
+
+    def process_answer(self, user_answer: str):
+        e = self.orchestrator.e_agent
+        r = self.orchestrator.r_agent
+
+        response = self._handle_control(user_answer)
+        if response is not None:
+            return response
+
+        # --- 2.5. Hint request ---
+        if user_answer == "[GET_HINT_ONLY]":
+            try:
+                question_text = self.orchestrator.q_agent.get_question(self.current_index)
+                context_docs = self._context_for(self.current_index)
+
+                if not context_docs:
+                    return self._hint_response("⚠️ No relevant material found to generate a hint.")
+
+                hint = e.generate_direct_hint(question_text, self._doc_texts(context_docs))
+                return self._hint_response(hint)
+
+            except Exception as err:
+                print(f"❌ [GET_HINT_ONLY] failed: {err}")
+                return self._hint_response("⚠️ Failed to generate hint due to internal error.")
+
+        # --- 3. Regular answer ---
+        question_text, question_number = self._current_question_ref()
+        context_docs = self._context_for(self.current_index)
+        # The reference answer is part of the cache scope, so settle it before the first lookup
+        e.reference_answer(question_number, question_text, context_docs)
+        cached, vector = self.evaluation_cache.lookup(self._cache_scope(question_number), user_answer)
+
+        if cached is not None:
+            accuracy, feedback, reflection = cached["accuracy"], cached["feedback"], cached["reflection"]
+        else:
+            raw_feedback, accuracy, reference_answer = e.evaluate(
+                question_number, question_text, user_answer, context_docs
+            )
+            accuracy, feedback = self._normalize_evaluation(raw_feedback, accuracy)
+
+            if accuracy == 100 or feedback == ACCEPT_FEEDBACK:
+                reflection = PERFECT_REFLECTION
+            else:
+                reflection = r.reflect_evaluation(
+                    question=question_text,
+                    user_answer=user_answer,
+                    expected_answers=reference_answer,
+                    notes_context=e.notes_context,
+                    similar_context=self._doc_texts(context_docs),
+                    feedback=feedback
+                )
+
+            self.evaluation_cache.store(
+                self._cache_scope(question_number), user_answer,
+                {"accuracy": accuracy, "feedback": feedback, "reflection": reflection}, vector
+            )
+
+        response = self._record_result(question_text, user_answer, accuracy, feedback, reflection)
+        if response["complete"]:
+            response["final_summary"] = self.get_final_summary()
+
+        return response
+
+    async def aprocess_answer(self, user_answer: str):
+        """Async variant of process_answer(); never blocks the event loop."""
+        e = self.orchestrator.e_agent
+        r = self.orchestrator.r_agent
+
+        response = self._handle_control(user_answer)
+        if response is not None:
+            return response
+
+        if user_answer == "[GET_HINT_ONLY]":
+            try:
+                question_text = self.orchestrator.q_agent.get_question(self.current_index)
+                context_docs = await self._acontext_for(self.current_index)
+
+                if not context_docs:
+                    return self._hint_response("⚠️ No relevant material found to generate a hint.")
+
+                hint = await e.agenerate_direct_hint(question_text, self._doc_texts(context_docs))
+                return self._hint_response(hint)
+
+            except Exception as err:
+                print(f"❌ [GET_HINT_ONLY] failed: {err}")
+                return self._hint_response("⚠️ Failed to generate hint due to internal error.")
+
+        question_text, question_number = self._current_question_ref()
+        context_docs = await self._acontext_for(self.current_index)
+        await e.areference_answer(question_number, question_text, context_docs)
+        cached, vector = await asyncio.to_thread(
+            self.evaluation_cache.lookup, self._cache_scope(question_number), user_answer
         )
 
-        return final_summary
+        if cached is not None:
+            accuracy, feedback, reflection = cached["accuracy"], cached["feedback"], cached["reflection"]
+        else:
+            raw_feedback, accuracy, reference_answer = await e.aevaluate(
+                question_number, question_text, user_answer, context_docs
+            )
+            accuracy, feedback = self._normalize_evaluation(raw_feedback, accuracy)
 
-    def process_answer(self, user_answer: str):
-        q = self.orchestrator.q_agent
-        c = self.orchestrator.c_agent
+            if accuracy == 100 or feedback == ACCEPT_FEEDBACK:
+                reflection = PERFECT_REFLECTION
+            else:
+                reflection = await r.areflect_evaluation(
+                    question=question_text,
+                    user_answer=user_answer,
+                    expected_answers=reference_answer,
+                    notes_context=e.notes_context,
+                    similar_context=self._doc_texts(context_docs),
+                    feedback=feedback
+                )
+
+            await asyncio.to_thread(
+                self.evaluation_cache.store, self._cache_scope(question_number), user_answer,
+                {"accuracy": accuracy, "feedback": feedback, "reflection": reflection}, vector
+            )
+
+        response = self._record_result(question_text, user_answer, accuracy, feedback, reflection)
+        if response["complete"]:
+            response["final_summary"] = await self.aget_final_summary()
+
+        return response
+
+    async def astream_answer(self, user_answer: str):
+        """
+        Streaming variant of aprocess_answer(). Yields (event, data) pairs:
+        "score" as soon as the evaluation is done, "token" for each piece of
+        reflection or hint text, and a final "done" carrying the same payload
+        aprocess_answer() would return.
+        """
         e = self.orchestrator.e_agent
         r = self.orchestrator.r_agent
 
+        response = self._handle_control(user_answer)
+        if response is not None:
+            yield "done", response
+            return
+
+        if user_answer == "[GET_HINT_ONLY]":
+            question_text = self.orchestrator.q_agent.get_question(self.current_index)
+            try:
+                context_docs = await self._acontext_for(self.current_index)
+            except Exception as err:
+                print(f"❌ [GET_HINT_ONLY] failed: {err}")
+                yield "done", self._hint_response("⚠️ Failed to generate hint due to internal error.")
+                return
+
+            if not context_docs:
+                yield "done", self._hint_response("⚠️ No relevant material found to generate a hint.")
+                return
+
+            hint = []
+            async for token in e.astream_direct_hint(question_text, self._doc_texts(context_docs)):
+                hint.append(token)
+                yield "token", token
+            yield "done", self._hint_response("".join(hint).strip())
+            return
+
+        question_text, question_number = self._current_question_ref()
+        context_docs = await self._acontext_for(self.current_index)
+        await e.areference_answer(question_number, question_text, context_docs)
+        cached, vector = await asyncio.to_thread(
+            self.evaluation_cache.lookup, self._cache_scope(question_number), user_answer
+        )
+
+        if cached is not None:
+            accuracy, feedback, reflection = cached["accuracy"], cached["feedback"], cached["reflection"]
+            yield "score", {"accuracy": accuracy, "feedback": feedback}
+            yield "token", reflection
+        else:
+            raw_feedback, accuracy, reference_answer = await e.aevaluate(
+                question_number, question_text, user_answer, context_docs
+            )
+            accuracy, feedback = self._normalize_evaluation(raw_feedback, accuracy)
+            yield "score", {"accuracy": accuracy, "feedback": feedback}
+
+            if accuracy == 100 or feedback == ACCEPT_FEEDBACK:
+                reflection = PERFECT_REFLECTION
+                yield "token", reflection
+            else:
+                tokens = []
+                async for token in r.astream_reflect_evaluation(
+                    question=question_text,
+                    user_answer=user_answer,
+                    expected_answers=reference_answer,
+                    notes_context=e.notes_context,
+                    similar_context=self._doc_texts(context_docs),
+                    feedback=feedback
+                ):
+                    tokens.append(token)
+                    yield "token", token
+                reflection = "".join(tokens)
+
+            await asyncio.to_thread(
+                self.evaluation_cache.store, self._cache_scope(question_number), user_answer,
+                {"accuracy": accuracy, "feedback": feedback, "reflection": reflection}, vector
+            )
+
+        response = self._record_result(question_text, user_answer, accuracy, feedback, reflection)
+        if response["complete"]:
+            response["final_summary"] = await self.aget_final_summary()
+
+        yield "done", response
+
+    async def agrade(self, question_number, user_answer, reflect=False):
+        """
+        Grade one answer to any question without touching this session's progress
+        (batch grading). Shares the evaluation cache with the chat path; the
+        reflection is only generated, and the result only cached, with reflect=True.
+        """
+        e = self.orchestrator.e_agent
+        index = self._index_of(question_number)
+        if index is None:
+            raise KeyError(f"Unknown question number: {question_number}")
+        question_text = self.orchestrator.q_agent.get_question(index)
+        context_docs = await self._acontext_for(index)
+        await e.areference_answer(question_number, question_text, context_docs)
+
+        scope = self._cache_scope(question_number)
+        cached, vector = await asyncio.to_thread(self.evaluation_cache.lookup, scope, user_answer)
+        if cached is not None:
+            return {
+                "question": question_text,
+                "accuracy": cached["accuracy"],
+                "feedback": cached["feedback"],
+                "reflection": cached["reflection"] if reflect else None,
+                "reference_answer": e.reference_answers.get(question_number, ""),
+                "graded_by": "cache",
+            }
+
+        raw_feedback, accuracy, reference_answer = await e.aevaluate(
+            question_number, question_text, user_answer, context_docs
+        )
+        accuracy, feedback = self._normalize_evaluation(raw_feedback, accuracy)
+
+        if raw_feedback.startswith("Feedback: Perfect match!"):
+            graded_by = "exact_match"
+        elif is_local_feedback(feedback):
+            graded_by = "prescore"
+        else:
+            graded_by = "llm"
+
+        reflection = None
+        if reflect:
+            if accuracy == 100 or feedback == ACCEPT_FEEDBACK:
+                reflection = PERFECT_REFLECTION
+            else:
+                reflection = await self.orchestrator.r_agent.areflect_evaluation(
+                    question=question_text,
+                    user_answer=user_answer,
+                    expected_answers=reference_answer,
+                    notes_context=e.notes_context,
+                    similar_context=self._doc_texts(context_docs),
+                    feedback=feedback
+                )
+            await asyncio.to_thread(
+                self.evaluation_cache.store, scope, user_answer,
+                {"accuracy": accuracy, "feedback": feedback, "reflection": reflection}, vector
+            )
+
+        return {
+            "question": question_text,
+            "accuracy": accuracy,
+            "feedback": feedback,
+            "reflection": reflection,
+            "reference_answer": reference_answer,
+            "graded_by": graded_by,
+        }
+
+    def _index_of(self, question_number):
+        for index, (number, _) in enumerate(self.orchestrator.q_agent.questions):
+            if number == question_number:
+                return index
+        return None
+
+    def _handle_control(self, user_answer):
+        """Responses for control messages that need no grading; None for anything else."""
+        q = self.orchestrator.q_agent
+
         # --- 0. Start session ---
         if user_answer == "[START_SESSION]":
             return {
@@ -72,65 +399,45 @@ class OrchestratorSession:
                 "retry": False
             }
 
-        # --- 2.5. Hint request ---
-        if user_answer == "[GET_HINT_ONLY]":
-            try:
-                question_text = q.get_question(self.current_index)
-                context_docs = c.retrieve_context(question_text)
+        return None
 
-                if not context_docs:
-                    return {
-                        "message": "⚠️ No relevant material found to generate a hint.",
-                        "index": self.current_index,
-                        "question": None,
-                        "complete": False,
-                        "retry": True
-                    }
-
-                similar_context = "\n\n".join(getattr(doc, "page_content", "") for doc in context_docs)
-                hint = e.generate_direct_hint(question_text, similar_context)
-
-                return {
-                    "message": hint,
-                    "index": self.current_index,
-                    "question": None,
-                    "complete": False,
-                    "retry": True
-                }
+    def _hint_response(self, message):
+        return {
+            "message": message,
+            "index": self.current_index,
+            "question": None,
+            "complete": False,
+            "retry": True
+        }
 
-            except Exception as err:
-                print(f"❌ [GET_HINT_ONLY] failed: {err}")
-                return {
-                    "message": "⚠️ Failed to generate hint due to internal error.",
-                    "index": self.current_index,
-                    "question": None,
-                    "complete": False,
-                    "retry": True
-                }
+    def _cache_scope(self, question_number):
+        """Cache scope of a question's grades; None (not cached) while it has no reference answer."""
+        e = self.orchestrator.e_agent
+        reference_answer = e.reference_answers.get(question_number, "")
+        if not reference_answer:
+            return None
+        version = version_key(
+            reference_answer,
+            e.prompt_template,
+            self.orchestrator.r_agent.prompt_template
+        )
+        return self.session_id, question_number, version
 
-        # --- 3. Regular answer ---
-        question_text = q.get_question(self.current_index)
-        question_number = q.get_question_number(self.current_index)
-        context_docs = c.retrieve_context(question_text)
+    def _current_question_ref(self):
+        q = self.orchestrator.q_agent
+        return q.get_question(self.current_index), q.get_question_number(self.current_index)
 
-        raw_feedback, accuracy, reference_answer = e.evaluate(
-            question_number, question_text, user_answer, context_docs
-        )
+    @staticmethod
+    def _doc_texts(context_docs):
+        return [getattr(doc, "page_content", "") for doc in context_docs]
+
+    @staticmethod
+    def _normalize_evaluation(raw_feedback, accuracy):
         accuracy = min(max(int(accuracy), 0), 100) if accuracy is not None else 0
         feedback = raw_feedback.split("Feedback:")[-1].strip() if "Feedback:" in raw_feedback else raw_feedback
+        return accuracy, feedback
 
-        if accuracy == 100:
-            reflection = "Great job — your answer fully addresses the question and shows solid understanding. Keep it up!"
-        else:
-            reflection = r.reflect_evaluation(
-                question=question_text,
-                user_answer=user_answer,
-                expected_answers=reference_answer,
-                notes_context=e.notes_context,
-                similar_context="\n\n".join(getattr(doc, "page_content", "") for doc in context_docs),
-                feedback=feedback
-            )
-
+    def _record_result(self, question_text, user_answer, accuracy, feedback, reflection):
         self.results.append({
             "question": question_text,
             "user_answer": user_answer,
@@ -145,17 +452,12 @@ class OrchestratorSession:
             self.waiting_for_retry = True
 
         next_question = self.get_current_question()
-        done = self.current_index >= q.total_questions()
+        done = self.current_index >= self.orchestrator.q_agent.total_questions()
 
-        response = {
+        return {
             "message": f"Accuracy: {accuracy}%<br/>Hint:<br/>{reflection}",
             "index": self.current_index,
             "question": next_question,
             "complete": done,
             "retry": self.waiting_for_retry
         }
-
-        if done:
-            response["final_summary"] = self.get_final_summary()
-
-        return response
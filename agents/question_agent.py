@@ -1,35 +1,54 @@
 import re
+from utils.artifact_cache import get_artifact_cache, llm_model_name
 from utils.pdf_loader import load_pdf_text
 from utils.openai_config import get_openai_llm
+from utils.single_flight import invoke_once
+from utils.telemetry import traced
+
+QUESTION_EXTRACTION_PROMPT = (
+    "You are a helpful assistant. Extract all clear and complete questions "
+    "from the text below. Ignore headings or explanations. "
+    "Return ONLY the questions as a numbered list (1., 2., 3., etc). "
+    "Each question must start with its number and a dot.\n\n"
+    "{text}\n\n"
+    "Questions:"
+)
+
 
 class QuestionAgent:
-    def __init__(self, question_pdf_path):
-        raw_text = load_pdf_text(question_pdf_path)
+    @traced("question_agent.init")
+    def __init__(self, question_pdf_path, questions=None):
         self.llm = get_openai_llm()
 
-        prompt = (
-            "You are a helpful assistant. Extract all clear and complete questions "
-            "from the text below. Ignore headings or explanations. "
-            "Return ONLY the questions as a numbered list (1., 2., 3., etc). "
-            "Each question must start with its number and a dot.\n\n"
-            f"{raw_text}\n\n"
-            "Questions:"
+        # Already extracted (e.g. rehydrated from the session store): skip the PDF and the LLM
+        if questions is not None:
+            self.questions = [(int(number), text) for number, text in questions]
+            return
+
+        # Same file, prompt and model: same questions in the same order, without an LLM call
+        extracted = get_artifact_cache().get_or_create(
+            "questions", question_pdf_path, QUESTION_EXTRACTION_PROMPT, llm_model_name(self.llm),
+            lambda: self.extract_questions(load_pdf_text(question_pdf_path))
         )
+        self.questions = [(int(number), text) for number, text in extracted]
 
-        extracted = self.llm.invoke(prompt).content
+    def extract_questions(self, raw_text):
+        # Identical uploads being ingested at the same time share one extraction call
+        extracted = invoke_once(self.llm, QUESTION_EXTRACTION_PROMPT.format(text=raw_text))
 
         # Strict regex: match only lines starting with number + dot + space
         pattern = re.compile(r"^\s*(\d+)\.\s+(.+)")
 
-        self.questions = []
+        questions = []
         for line in extracted.splitlines():
             match = pattern.match(line)
             if match:
                 number = int(match.group(1))
                 text = match.group(2).strip()
-                self.questions.append( (number, text) )
+                questions.append( (number, text) )
             else:
                 print(f"Skipping non-matching line: {line}")
+        return questions
 
     def get_question(self, index):
         return self.questions[index][1] if index < len(self.questions) else None
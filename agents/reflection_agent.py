@@ -1,13 +1,47 @@
 from utils.openai_config import get_openai_llm
+from utils.prompt_budget import get_prompt_assembler
+from utils.single_flight import ainvoke_once, invoke_once
+from utils.telemetry import traced
 
 class ReflectionAgent:
     def __init__(self, prompt_path):
         with open(prompt_path, "r") as file:
             self.prompt_template = file.read()
         self.llm = get_openai_llm()
+        self.prompt_assembler = get_prompt_assembler()
 
+    @traced("reflection_agent.reflect_evaluation")
     def reflect_evaluation(self, question, user_answer, expected_answers, notes_context, similar_context, feedback):
-        prompt = self.prompt_template.format(
+        prompt = self._reflection_prompt(question, user_answer, expected_answers, notes_context, similar_context, feedback)
+        return invoke_once(self.llm, prompt)
+
+    @traced("reflection_agent.reflect_evaluation")
+    async def areflect_evaluation(self, question, user_answer, expected_answers, notes_context, similar_context, feedback):
+        prompt = self._reflection_prompt(question, user_answer, expected_answers, notes_context, similar_context, feedback)
+        return await ainvoke_once(self.llm, prompt)
+
+    @traced("reflection_agent.reflect_evaluation")
+    async def astream_reflect_evaluation(self, question, user_answer, expected_answers, notes_context, similar_context, feedback):
+        """Yield the reflection text token by token as the LLM produces it."""
+        prompt = self._reflection_prompt(question, user_answer, expected_answers, notes_context, similar_context, feedback)
+        async for chunk in self.llm.astream(prompt):
+            if chunk.content:
+                yield chunk.content
+
+    @traced("reflection_agent.generate_final_summary")
+    def generate_final_summary(self, avg_accuracy, weak_points, notes_context):
+        prompt = self._summary_prompt(avg_accuracy, weak_points, notes_context)
+        return self.llm.invoke(prompt).content
+
+    @traced("reflection_agent.generate_final_summary")
+    async def agenerate_final_summary(self, avg_accuracy, weak_points, notes_context):
+        prompt = self._summary_prompt(avg_accuracy, weak_points, notes_context)
+        return (await self.llm.ainvoke(prompt)).content
+
+    def _reflection_prompt(self, question, user_answer, expected_answers, notes_context, similar_context, feedback):
+        # similar_context may be the retrieved chunk texts or an already joined string
+        notes_context, similar_context = self.prompt_assembler.fit(notes_context, similar_context, label="reflect")
+        return self.prompt_template.format(
             question=question,
             user_answer=user_answer,
             expected_answers=expected_answers,
@@ -15,10 +49,9 @@ class ReflectionAgent:
             similar_context=similar_context,
             feedback=feedback
         )
-        return self.llm.invoke(prompt).content
 
-    def generate_final_summary(self, avg_accuracy, weak_points, notes_context):
-        prompt = (
+    def _summary_prompt(self, avg_accuracy, weak_points, notes_context):
+        return (
             "You are an educational assistant. Given the average accuracy and the list of weak topics, "
             "give the student an encouraging final summary, with concrete study advice, in under 100 words. "
             "Mention any specific topics to review if provided.\n\n"
@@ -27,4 +60,3 @@ class ReflectionAgent:
             f"Lecture Notes Context: {notes_context}\n\n"
             "Your summary:"
         )
-        return self.llm.invoke(prompt).content
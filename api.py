@@ -1,8 +1,15 @@
-from fastapi import FastAPI, File, UploadFile
+import time
+_import_started = time.perf_counter()
+
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel
-import shutil, os
+from contextlib import asynccontextmanager
+import asyncio
+import json
+import os
+from uuid import uuid4
 
 from agents.question_agent import QuestionAgent
 from agents.context_agent import ContextAgent
@@ -10,17 +17,85 @@ from agents.evaluation_agent import EvaluationAgent
 from agents.reflection_agent import ReflectionAgent
 from agents.orchestrator_agent import OrchestratorAgent
 from agents.orchestrator_session import OrchestratorSession
+from agents.batch_grader import BatchCheckpoint, BatchGrader, aparse_rows, split_lines
 from fastapi.responses import PlainTextResponse
 
 from utils.session_manager import get_or_create_user_and_session
+from utils import index_registry
+from utils.embedding_service import get_embedding_service
+from utils.artifact_cache import get_artifact_cache
+from utils.blob_store import UploadTooLarge, get_blob_store
+from utils.evaluation_cache import get_evaluation_cache
+from utils.openai_config import get_openai_llm
+from utils.single_flight import llm_calls, session_builds
+from utils.session_store import SessionStore, create_session_backend
+from utils.ingestion import IngestionJob, IngestionManager, Stage, DONE, PENDING, RUNNING
+from utils.upload_stream import StreamingUploadParser, UploadError
+from utils.pdf_loader import PDF_CACHE_DIR
+from utils.session_gc import SessionGC
+from utils.telemetry import HTTP_DURATION, STARTUP_SECONDS, configure_tracing, render_prometheus, span
+
+# Heavy libraries (chromadb, langchain_openai, sentence-transformers/torch) are imported
+# on first use; keep this number down: python -m benchmarks.import_time
+IMPORT_SECONDS = time.perf_counter() - _import_started
+STARTUP_SECONDS.set(round(IMPORT_SECONDS, 4), phase="import")
 
 # ==== Config ====
 UPLOAD_DIR = "data"
 CHROMA_DIR = "./chroma_db"
+UPLOAD_FIELDS = ("notes", "questions", "answers")
+# Enforced per file while the upload streams in
+UPLOAD_MAX_FILE_BYTES = int(float(os.getenv("UPLOAD_MAX_FILE_MB", "50")) * 1024 * 1024)
+UPLOAD_OVERHEAD_BYTES = 64 * 1024
 EVAL_PROMPT = "prompts/evaluation_prompt.txt"
 REFLECT_PROMPT = "prompts/reflection_prompt.txt"
+INGESTION_WAIT_SECONDS = float(os.getenv("INGESTION_WAIT_SECONDS", "120"))
+# "eager": generate missing reference answers for all questions at ingestion, shared by
+# every student; "lazy": generate each one when it is first needed for grading
+REFERENCE_ANSWER_MODE = os.getenv("REFERENCE_ANSWER_MODE", "eager")
+REFERENCE_GENERATION_CONCURRENCY = int(os.getenv("REFERENCE_GENERATION_CONCURRENCY", "4"))
+# Startup warm-up: load the LLM client and embedding model, open the most recent session indexes
+WARMUP_ON_STARTUP = os.getenv("WARMUP_ON_STARTUP", "1") == "1"
+WARMUP_INDEXES = int(os.getenv("WARMUP_INDEXES", "8"))
+# Batch grading: results of each job are appended here, so a rerun with the same job_id resumes
+BATCH_CHECKPOINT_DIR = os.getenv("BATCH_CHECKPOINT_DIR", "state/batch")
+BATCH_GRADING_CONCURRENCY = int(os.getenv("BATCH_GRADING_CONCURRENCY", "8"))
+BATCH_RESULTS_CHUNK_BYTES = 64 * 1024
+# Session lifecycle: sessions unused for this many days are deleted (0 keeps them until deleted)
+SESSION_RETENTION_DAYS = float(os.getenv("SESSION_RETENTION_DAYS", "0"))
+# Background GC of deleted/expired sessions' files and unreferenced shared files, paced by I/O
+GC_INTERVAL_SECONDS = float(os.getenv("GC_INTERVAL_SECONDS", "300"))
+GC_GRACE_SECONDS = float(os.getenv("GC_GRACE_SECONDS", "3600"))
+GC_MAX_MB_PER_SECOND = float(os.getenv("GC_MAX_MB_PER_SECOND", "50"))
+GC_MAX_FILES_PER_SECOND = float(os.getenv("GC_MAX_FILES_PER_SECOND", "500"))
+
+warmup_job = None
+gc_wake = None
+
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app):
+    global warmup_job, gc_wake
+    if WARMUP_ON_STARTUP:
+        # Runs in the background: the port opens at once and /ready reports when warm
+        warmup_job = IngestionJob("warmup", _warmup_stages(), on_update=None)
+        warmup_job.future.add_done_callback(lambda _: _record_warmup_timings(warmup_job))
+        warmup_job.start(ingestion_manager.executor)
+
+    gc_task = None
+    if GC_INTERVAL_SECONDS > 0:
+        gc_wake = asyncio.Event()
+        gc_task = asyncio.create_task(_gc_loop(gc_wake))
+    yield
+    if gc_task is not None:
+        session_gc.stop()
+        gc_task.cancel()
+    from utils.llm_client import aclose_http_clients
+    await aclose_http_clients()
+
+
+app = FastAPI(lifespan=lifespan)
+configure_tracing()
 
 app.add_middleware(
     CORSMiddleware,
@@ -30,8 +105,49 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# ==== In-Memory Session Store ====
-chat_session = {}
+@app.middleware("http")
+async def record_request_latency(request: Request, call_next):
+    started = time.perf_counter()
+    response = await call_next(request)
+    route = request.scope.get("route")
+    HTTP_DURATION.observe(
+        time.perf_counter() - started,
+        route=getattr(route, "path", "unmatched"),
+        method=request.method
+    )
+    return response
+
+
+# ==== Session Store (LRU + idle TTL in memory, shared backend on disk) ====
+# The backend is shared by every worker process, so `uvicorn api:app --workers N` is safe
+session_store = SessionStore(
+    create_session_backend(),
+    capacity=int(os.getenv("SESSION_CACHE_CAPACITY", "256")),
+    idle_ttl_seconds=float(os.getenv("SESSION_IDLE_TTL_SECONDS", "1800"))
+)
+
+# ==== Session Lifecycle (delete, expiry, background GC of files) ====
+session_gc = SessionGC(
+    session_store,
+    get_blob_store(),
+    index_path=lambda session_id: _index_path(session_id),
+    upload_dir=UPLOAD_DIR,
+    index_dir="chroma_db",
+    batch_dir=BATCH_CHECKPOINT_DIR,
+    pdf_cache_dir=PDF_CACHE_DIR,
+    artifact_cache=get_artifact_cache(),
+    idle_ttl_seconds=SESSION_RETENTION_DAYS * 86400,
+    grace_seconds=GC_GRACE_SECONDS,
+    bytes_per_second=GC_MAX_MB_PER_SECOND * 1024 * 1024,
+    files_per_second=GC_MAX_FILES_PER_SECOND
+)
+# session_id -> when this worker last recorded use of it; limits writes to one a minute
+_last_touched = {}
+SESSION_TOUCH_INTERVAL_SECONDS = 60
+
+# ==== Background Ingestion ====
+# Status goes to the shared backend so every worker can report it
+ingestion_manager = IngestionManager(on_update=session_store.save_job_status)
 
 class ChatRequest(BaseModel):
     user_id: str | None = None
@@ -41,69 +157,303 @@ class ChatRequest(BaseModel):
 
 # ==== Upload Route ====
 @app.post("/upload/{session_id}")
-async def upload_and_initialize(
-    session_id: str,
-    notes: UploadFile = File(...),
-    questions: UploadFile = File(...),
-    answers: UploadFile | None = File(None)
-):
-    user_dir = f"data/{session_id}"
-    chroma_dir = f"chroma_db/{session_id}"
-    os.makedirs(user_dir, exist_ok=True)
+async def upload_and_initialize(session_id: str, request: Request, ttl_seconds: float | None = None):
+    """
+    multipart/form-data with "notes" and "questions" PDFs and an optional "answers" PDF.
+    With ttl_seconds the session and its files are deleted that long after the upload.
+    """
+    content_length = int(request.headers.get("content-length") or 0)
+    if content_length > UPLOAD_MAX_FILE_BYTES * len(UPLOAD_FIELDS) + UPLOAD_OVERHEAD_BYTES:
+        return JSONResponse(content={"status": "error", "message": "Upload is too large."}, status_code=413)
+
+    blob_store = get_blob_store()
+    try:
+        # Streamed into the blob store as it arrives; identical files are stored once
+        files = await StreamingUploadParser(blob_store, UPLOAD_FIELDS, UPLOAD_MAX_FILE_BYTES).parse(
+            request.headers.get("content-type"), request.stream()
+        )
+    except UploadTooLarge as e:
+        return JSONResponse(content={"status": "error", "message": str(e)}, status_code=413)
+    except UploadError as e:
+        return JSONResponse(content={"status": "error", "message": str(e)}, status_code=400)
+
+    missing = [name for name in ("notes", "questions") if name not in files]
+    if missing:
+        return JSONResponse(
+            content={"status": "error", "message": f"Missing file(s): {', '.join(missing)}."}, status_code=400
+        )
 
     try:
-        with open(f"{user_dir}/notes.pdf", "wb") as f:
-            shutil.copyfileobj(notes.file, f)
-        with open(f"{user_dir}/questions.pdf", "wb") as f:
-            shutil.copyfileobj(questions.file, f)
-        if answers:
-            with open(f"{user_dir}/answers.pdf", "wb") as f:
-                shutil.copyfileobj(answers.file, f)
-
-        return JSONResponse(content={"status": "success", "message": "Files uploaded successfully."})
+        refs = {name: file["sha256"] for name, file in files.items()}
+        # Edited notes get a new index; it starts from a copy of the one they replace
+        previous_index = await asyncio.to_thread(_index_path, session_id)
+        await asyncio.to_thread(blob_store.set_refs, session_id, refs, f"{UPLOAD_DIR}/{session_id}")
+        await asyncio.to_thread(session_store.touch_session, session_id)
+        if ttl_seconds is not None:
+            await asyncio.to_thread(session_store.set_session_expiry, session_id, time.time() + ttl_seconds)
+
+        await asyncio.to_thread(_restart_ingestion, session_id, previous_index)
+
+        return JSONResponse(content={
+            "status": "success",
+            "message": "Files uploaded successfully. Ingestion started.",
+            "status_url": f"/upload/{session_id}/status",
+            "files": files
+        })
     except Exception as e:
         return JSONResponse(content={"status": "error", "message": str(e)}, status_code=500)
 
 
+@app.get("/upload/{session_id}/status")
+async def upload_status(session_id: str):
+    job = ingestion_manager.get(session_id)
+    status = job.status() if job else await asyncio.to_thread(session_store.load_job_status, session_id)
+    if status is None:
+        return JSONResponse(content={"status": "error", "message": "No ingestion job for this session."}, status_code=404)
+    return status
+
+
+def _restart_ingestion(session_id, seed_index=None):
+    """
+    Replace the session's ingestion with a new job. Old artifacts no longer
+    match the files, so they go, and the new job's status is stored in the
+    same locked step: a superseded job (here or in another worker) then
+    finds a different job_id and does not save its artifacts. A new notes
+    index is seeded from `seed_index`, the index the session used before.
+    """
+    job_id = uuid4().hex
+    job = ingestion_manager.new_job(session_id, _ingestion_stages(session_id, job_id, seed_index), job_id)
+    with session_store.lock(f"artifacts:{session_id}"):
+        session_store.delete_artifacts(session_id)
+        session_store.save_job_status(session_id, job.status())
+    return ingestion_manager.submit(job)
+
+
+def _index_path(session_id):
+    """Sessions with identical notes share one vector index, keyed by the notes' content hash."""
+    notes_digest = get_blob_store().refs(session_id).get("notes")
+    if notes_digest:
+        return index_registry.notes_index_path(notes_digest)
+    return f"chroma_db/{session_id}"
+
+
+def build_session(session_id, user_id, artifacts=None):
+    """
+    Construct the agents for one user. Blocking: PDF parsing, embedding and LLM extraction.
+    With stored artifacts (questions, reference answers, notes context) no LLM extraction runs.
+    """
+    base_path = f"data/{session_id}"
+    chroma_path = (artifacts or {}).get("index_path") or _index_path(session_id)
+
+    question_agent = QuestionAgent(
+        f"{base_path}/questions.pdf",
+        questions=artifacts["questions"] if artifacts else None
+    )
+    context_agent = ContextAgent(f"{base_path}/notes.pdf", chroma_path)
+    context_agent.ingest_and_index()
+    if artifacts:
+        notes_context = artifacts["notes_context"]
+    else:
+        with span("context_agent.summary_lookup"):
+            summary_docs = context_agent.get_vectorstore().similarity_search("summary")
+        notes_context = summary_docs[0].page_content if summary_docs else ""
+
+    evaluation_agent = EvaluationAgent(
+        EVAL_PROMPT, f"{base_path}/answers.pdf", notes_context,
+        reference_answers=artifacts["reference_answers"] if artifacts else None
+    )
+    reflection_agent = ReflectionAgent(REFLECT_PROMPT)
+
+    orchestrator = OrchestratorAgent(question_agent, context_agent, evaluation_agent, reflection_agent)
+    return OrchestratorSession(orchestrator, session_id=session_id, user_id=user_id)
+
+
+def _ingestion_stages(session_id, job_id, seed_index=None):
+    """
+    Upload-time pipeline. questions, answers and index are independent and run
+    in parallel; summary needs the index; references fills in any reference
+    answers answers.pdf lacks; artifacts stores everything for /chat, unless
+    job `job_id` has been replaced by a newer upload meanwhile.
+    """
+    base_path = f"data/{session_id}"
+    chroma_path = _index_path(session_id)
+    answers_path = f"{base_path}/answers.pdf"
+
+    def extract_questions(results):
+        return QuestionAgent(f"{base_path}/questions.pdf").questions
+
+    def parse_reference_answers(results):
+        if not os.path.exists(answers_path):
+            return None
+        return EvaluationAgent(EVAL_PROMPT, answers_path, notes_context="").reference_answers
+
+    def build_index(results):
+        context_agent = ContextAgent(f"{base_path}/notes.pdf", chroma_path)
+        context_agent.ingest_and_index(seed_directory=seed_index)
+        return context_agent
+
+    def generate_reference_answers(results):
+        if REFERENCE_ANSWER_MODE != "eager":
+            return None
+        questions = results["questions"]
+        evaluation_agent = EvaluationAgent(
+            EVAL_PROMPT, answers_path, notes_context="",
+            reference_answers=results.get("answers") or {}
+        )
+        if all(evaluation_agent.reference_answers.get(number) for number, _ in questions):
+            return None
+        similar_docs = results["index"].shared_context_batch([text for _, text in questions])
+        evaluation_agent.generate_reference_answers(questions, similar_docs, REFERENCE_GENERATION_CONCURRENCY)
+        return evaluation_agent.reference_answers
+
+    def lookup_summary(results):
+        with span("context_agent.summary_lookup"):
+            summary_docs = results["index"].get_vectorstore().similarity_search("summary")
+        return summary_docs[0].page_content if summary_docs else ""
+
+    def save_artifacts(results):
+        with session_store.lock(f"artifacts:{session_id}"):
+            status = session_store.load_job_status(session_id)
+            if status is not None and status.get("job_id") != job_id:
+                print(f"Ingestion {job_id} for {session_id} was superseded; not saving its artifacts")
+                return None
+            session_store.save_artifacts(
+                session_id,
+                results["questions"],
+                results.get("references") or results.get("answers") or {},
+                results["summary"],
+                index_path=chroma_path
+            )
+        return True
+
+    return [
+        Stage("questions", extract_questions),
+        Stage("answers", parse_reference_answers),
+        Stage("index", build_index),
+        Stage("summary", lookup_summary, depends_on=["index"]),
+        Stage("references", generate_reference_answers, depends_on=["questions", "answers", "index"]),
+        Stage("artifacts", save_artifacts, depends_on=["questions", "answers", "summary", "references"]),
+    ]
+
+
+def _warmup_stages():
+    """
+    Startup warm-up. The LLM client and the embedding model (including its first
+    forward pass) load in parallel; then the most recently used session indexes
+    are opened so their first queries hit warm storage.
+    """
+    def load_llm_client(results):
+        get_openai_llm()
+        return True
+
+    def load_embedding_model(results):
+        get_embedding_service().embed_query("warm-up")
+        return True
+
+    def open_indexes(results):
+        opened = 0
+        for session_id, index_path in session_store.recent_artifacts(WARMUP_INDEXES):
+            if not index_path or not os.path.isdir(index_path):
+                continue
+            # Only warms caches: an index that fails to open is rebuilt by its session, not a reason to stay unready
+            try:
+                ContextAgent(f"data/{session_id}/notes.pdf", index_path).retrieve_context("warm-up", top_k=1)
+            except Exception as err:
+                print(f"Warm-up could not open {index_path}: {err}")
+                continue
+            opened += 1
+        return opened or None
+
+    return [
+        Stage("llm_client", load_llm_client),
+        Stage("embedding_model", load_embedding_model),
+        Stage("indexes", open_indexes, depends_on=["embedding_model"]),
+    ]
+
+
+def _record_warmup_timings(job):
+    for name, stage in job.status()["stages"].items():
+        if stage["seconds"] is not None:
+            STARTUP_SECONDS.set(stage["seconds"], phase=f"warmup.{name}")
+
+
+async def _wait_for_ingestion(session_id):
+    """If an upload is still being ingested (here or in another worker), wait for it."""
+    if await ingestion_manager.wait(session_id, timeout=INGESTION_WAIT_SECONDS) is not None:
+        return
+
+    deadline = asyncio.get_running_loop().time() + INGESTION_WAIT_SECONDS
+    while asyncio.get_running_loop().time() < deadline:
+        status = await asyncio.to_thread(session_store.load_job_status, session_id)
+        if not status or status["state"] not in (PENDING, RUNNING):
+            return
+        await asyncio.sleep(0.5)
+
+
+def _load_or_build_session(session_id, user_id, session_key):
+    with span("session.load_or_build", session_id=session_id):
+        return _load_or_build_session_unmetered(session_id, user_id, session_key)
+
+
+def _load_or_build_session_unmetered(session_id, user_id, session_key):
+    session = None
+    artifacts = session_store.load_artifacts(session_id)
+
+    if artifacts is None:
+        built = {}
+
+        def extract_artifacts():
+            # Only one worker extracts the artifacts; the others wait and reuse them
+            with session_store.lock(f"artifacts:{session_id}"):
+                stored = session_store.load_artifacts(session_id)
+                if stored is not None:
+                    return stored
+                built["session"] = build_session(session_id, user_id)
+                if REFERENCE_ANSWER_MODE == "eager":
+                    built["session"].prepare_reference_answers(REFERENCE_GENERATION_CONCURRENCY)
+                orchestrator = built["session"].orchestrator
+                session_store.save_artifacts(
+                    session_id,
+                    orchestrator.q_agent.questions,
+                    orchestrator.e_agent.reference_answers,
+                    orchestrator.e_agent.notes_context,
+                    index_path=orchestrator.c_agent.persist_directory
+                )
+                return session_store.load_artifacts(session_id)
+
+        # Concurrent first requests in this worker share one extraction
+        artifacts = session_builds.do(("artifacts", session_id), extract_artifacts)
+        session = built.get("session")
+
+    if session is None:
+        session = build_session(session_id, user_id, artifacts)
+
+    state = session_store.load_state(session_key)
+    if state:
+        session.restore_state(state)
+    return session
+
+
 # ==== Chat Route ====
 @app.post("/chat/{session_id}")
 async def chat_with_orchestrator(session_id: str, req: ChatRequest):
-    user_id = req.user_id
     answer = req.user_answer
     index = req.question_index
 
     # Generate a unique key per user per session
-    session_id, user_id, unique_session_key = get_or_create_user_and_session(session_id, user_id)
-
-    # Create session if not exists
-    if unique_session_key not in chat_session:
-        base_path = f"data/{session_id}"
-        chroma_path = f"chroma_db/{session_id}"
-
-        question_agent = QuestionAgent(f"{base_path}/questions.pdf")
-        context_agent = ContextAgent(f"{base_path}/notes.pdf", chroma_path)
-        context_agent.ingest_and_index()
-        summary_docs = context_agent.get_vectorstore().similarity_search("summary")
-        notes_context = summary_docs[0].page_content if summary_docs else ""
-
-        evaluation_agent = EvaluationAgent(EVAL_PROMPT, f"{base_path}/answers.pdf", notes_context)
-        reflection_agent = ReflectionAgent(REFLECT_PROMPT)
+    session_id, user_id, unique_session_key = get_or_create_user_and_session(session_id, req.user_id)
 
-        orchestrator = OrchestratorAgent(question_agent, context_agent, evaluation_agent, reflection_agent)
-        chat_session[unique_session_key] = OrchestratorSession(orchestrator, session_id=session_id, user_id=user_id)
+    # One request per user at a time, across all workers; the session is loaded once, under the lock
+    async with session_store.alock(unique_session_key):
+        session = await _get_session(session_id, user_id, unique_session_key)
 
-    session = chat_session[unique_session_key]
+        # Handle start of session
+        if index == 0 and answer.strip() == "":
+            return _start_payload(session)
 
-    # Handle start of session
-    if index == 0 and answer.strip() == "":
-        return {
-            "question": session.get_current_question(),
-            "index": 0,
-            "total_questions": session.get_total_questions()
-        }
-
-    # Evaluate answer
-    result = session.process_answer(answer)
+        # Evaluate answer
+        result = await session.aprocess_answer(answer)
+        await asyncio.to_thread(session_store.save, unique_session_key, session)
 
     result["index"] = session.current_index
     result["total_questions"] = session.get_total_questions()
@@ -114,10 +464,299 @@ async def chat_with_orchestrator(session_id: str, req: ChatRequest):
     return result
 
 
+# ==== Streaming Chat Route (SSE) ====
+@app.post("/chat/{session_id}/stream")
+async def chat_with_orchestrator_stream(session_id: str, req: ChatRequest):
+    session_id, user_id, unique_session_key = get_or_create_user_and_session(session_id, req.user_id)
+
+    async def event_stream():
+        async with session_store.alock(unique_session_key):
+            session = await _get_session(session_id, user_id, unique_session_key)
+
+            if req.question_index == 0 and req.user_answer.strip() == "":
+                yield _sse("done", _start_payload(session))
+                return
+
+            try:
+                async for event, data in session.astream_answer(req.user_answer):
+                    if event == "done":
+                        await asyncio.to_thread(session_store.save, unique_session_key, session)
+                        data["index"] = session.current_index
+                        data["total_questions"] = session.get_total_questions()
+                        if session.is_complete():
+                            data["complete"] = True
+                    yield _sse(event, data)
+            except Exception as err:
+                print(f"❌ Streaming chat failed: {err}")
+                yield _sse("error", {"message": str(err)})
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+# ==== Batch Grading Route (NDJSON) ====
+@app.post("/grade/{session_id}/batch")
+async def grade_batch(session_id: str, request: Request, job_id: str | None = None,
+                      reflect: bool = False, concurrency: int = BATCH_GRADING_CONCURRENCY):
+    """
+    Grade a JSONL body of {"student", "question_number", "answer"} rows (optional "id").
+    The body is parsed line by line as it arrives, so the raw bytes are never
+    held whole, but every parsed row is read before grading starts. Results
+    stream back as JSONL in completion order. Rerunning with the same job_id
+    skips rows that were already graded. Concurrency is capped at the LLM gate's.
+    """
+    # Read before responding: the streaming response listens on the same channel for disconnects,
+    # and a client that only reads the response after sending its body would deadlock a full-duplex exchange
+    rows = [row async for row in aparse_rows(split_lines(request.stream()))]
+    job_id = job_id or uuid4().hex
+    checkpoint_path = _batch_checkpoint_path(session_id, job_id)
+    if checkpoint_path is None:
+        return JSONResponse(status_code=400, content={"error": "Invalid job_id."})
+
+    # Shared by all batch jobs of the session; agrade never changes session progress.
+    # Batch requests take no per-user lock, so concurrent ones share one build here.
+    session_key = f"{session_id}_batch"
+    session = await session_builds.ado(("session", session_key), _get_session, session_id, "batch", session_key)
+
+    async def result_stream():
+        checkpoint = await asyncio.to_thread(BatchCheckpoint, checkpoint_path)
+        grader = BatchGrader(session, concurrency=concurrency, reflect=reflect, checkpoint=checkpoint)
+        try:
+            async for result in grader.grade(rows):
+                yield json.dumps(result) + "\n"
+            yield json.dumps({"job_id": job_id, "stats": grader.stats}) + "\n"
+        finally:
+            checkpoint.close()
+            # Reference answers generated for the batch serve later chats and batches too
+            await asyncio.to_thread(session_store.share_reference_answers, session)
+
+    return StreamingResponse(
+        result_stream(),
+        media_type="application/x-ndjson",
+        headers={"X-Batch-Job-Id": job_id, "Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@app.get("/grade/{session_id}/batch/{job_id}")
+async def batch_results(session_id: str, job_id: str):
+    """All results recorded so far for a batch job, as JSONL."""
+    checkpoint_path = _batch_checkpoint_path(session_id, job_id)
+    if checkpoint_path is None or not os.path.exists(checkpoint_path):
+        return JSONResponse(status_code=404, content={"error": "Unknown batch job."})
+    # Up to the size it has now: a running job keeps appending to it
+    size = os.path.getsize(checkpoint_path)
+
+    async def content():
+        with open(checkpoint_path, "rb") as f:
+            left = size
+            while left > 0:
+                chunk = await asyncio.to_thread(f.read, min(left, BATCH_RESULTS_CHUNK_BYTES))
+                if not chunk:
+                    break
+                left -= len(chunk)
+                yield chunk
+
+    return StreamingResponse(content(), media_type="application/x-ndjson")
+
+
+def _batch_checkpoint_path(session_id, job_id):
+    if not (_is_safe_name(session_id) and _is_safe_name(job_id)):
+        return None
+    return os.path.join(BATCH_CHECKPOINT_DIR, session_id, f"{job_id}.jsonl")
+
+
+async def _get_session(session_id, user_id, session_key):
+    """
+    The live session for session_key, rebuilt if this process has none. Chat
+    routes call it under the per-user alock, which already serialises
+    duplicate requests (double clicks, client retries) for one user.
+    """
+    # Live in this process: pick up whatever other workers saved since
+    session = session_store.get(session_key)
+    if session is not None and await asyncio.to_thread(session_store.refresh, session_key, session):
+        await _touch_session(session_id)
+        return session
+
+    # Rehydrate from the store (or build) if not live in this process
+    await _wait_for_ingestion(session_id)
+    session = await asyncio.to_thread(_load_or_build_session, session_id, user_id, session_key)
+    session_store.put(session_key, session)
+    await _touch_session(session_id)
+    return session
+
+
+async def _touch_session(session_id):
+    """Record use of the session (idle expiry counts from it), at most once a minute per worker."""
+    now = time.monotonic()
+    if now - _last_touched.get(session_id, float("-inf")) < SESSION_TOUCH_INTERVAL_SECONDS:
+        return
+    _last_touched[session_id] = now
+    await asyncio.to_thread(session_store.touch_session, session_id)
+
+
+def _start_payload(session):
+    return {
+        "question": session.get_current_question(),
+        "index": 0,
+        "total_questions": session.get_total_questions()
+    }
+
+
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
 
 @app.get("/clear-all", response_class=PlainTextResponse)
 async def clear_all_sessions_and_data():
-    chat_session.clear()
-    shutil.rmtree("data", ignore_errors=True)
-    shutil.rmtree("chroma_db", ignore_errors=True)
-    return "All uploaded data and Chroma vector stores have been cleared."
\ No newline at end of file
+    await asyncio.to_thread(session_store.clear)
+    ingestion_manager.forget()
+    index_registry.forget()
+    get_evaluation_cache().invalidate()
+    _last_touched.clear()
+    # Renames only; the background GC deletes the files at its own pace
+    await asyncio.to_thread(session_gc.trash_everything)
+    _wake_gc()
+    return "All uploaded data and Chroma vector stores have been cleared."
+
+
+# ==== Session Lifecycle Routes ====
+@app.delete("/sessions/{session_id}")
+async def delete_session(session_id: str):
+    """Delete a session at once; its files are removed by the background GC."""
+    if not _is_safe_name(session_id):
+        return JSONResponse(status_code=400, content={"error": "Invalid session id."})
+    known = await asyncio.to_thread(_session_exists, session_id)
+    if not known:
+        return JSONResponse(status_code=404, content={"error": "Unknown session."})
+
+    await asyncio.to_thread(session_gc.retire, session_id)
+    ingestion_manager.forget(session_id)
+    get_evaluation_cache().invalidate(session_id)
+    _last_touched.pop(session_id, None)
+    _wake_gc()
+    return {"status": "success", "session_id": session_id}
+
+
+@app.post("/sessions/{session_id}/expiry")
+async def set_session_expiry(session_id: str, ttl_seconds: float | None = None):
+    """Delete the session ttl_seconds from now; without ttl_seconds the expiry is removed."""
+    if not _is_safe_name(session_id) or not await asyncio.to_thread(_session_exists, session_id):
+        return JSONResponse(status_code=404, content={"error": "Unknown session."})
+    expires_at = time.time() + ttl_seconds if ttl_seconds is not None else None
+    await asyncio.to_thread(session_store.set_session_expiry, session_id, expires_at)
+    return {"status": "success", "session_id": session_id, "expires_at": expires_at}
+
+
+@app.get("/sessions/{session_id}/usage")
+async def session_usage(session_id: str):
+    if not _is_safe_name(session_id) or not await asyncio.to_thread(_session_exists, session_id):
+        return JSONResponse(status_code=404, content={"error": "Unknown session."})
+    return await asyncio.to_thread(session_gc.usage, session_id)
+
+
+@app.get("/stats/disk")
+async def disk_stats():
+    return await asyncio.to_thread(session_gc.disk_usage)
+
+
+def _session_exists(session_id):
+    return (
+        os.path.isdir(os.path.join(UPLOAD_DIR, session_id))
+        or bool(get_blob_store().refs(session_id))
+        or session_store.load_session(session_id) is not None
+    )
+
+
+def _is_safe_name(name):
+    return bool(name) and os.path.basename(name) == name and not name.startswith(".")
+
+
+def _wake_gc():
+    if gc_wake is not None:
+        gc_wake.set()
+
+
+async def _gc_loop(wake):
+    while True:
+        try:
+            await asyncio.wait_for(wake.wait(), GC_INTERVAL_SECONDS)
+        except asyncio.TimeoutError:
+            pass
+        wake.clear()
+
+        # One worker collects at a time; the others skip this round
+        release = await asyncio.to_thread(session_store.try_lock, "session-gc")
+        if release is None:
+            continue
+        try:
+            await asyncio.to_thread(session_gc.collect)
+        except Exception as err:
+            print(f"❌ Session GC failed: {err}")
+        finally:
+            await asyncio.to_thread(release)
+
+
+@app.get("/ready")
+async def readiness():
+    """
+    Readiness probe: 200 once the startup warm-up has succeeded (or is off).
+    503 while it runs, and also if it failed (no API key, model that does not
+    load), with the warm-up's error in the body.
+    """
+    warmup = warmup_job.status() if warmup_job else None
+    ready = warmup is None or warmup["state"] == DONE
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content={"ready": ready, "import_seconds": round(IMPORT_SECONDS, 4), "warmup": warmup}
+    )
+
+
+@app.get("/stats/embeddings")
+async def embedding_stats():
+    return get_embedding_service().stats()
+
+
+@app.get("/stats/llm")
+async def llm_stats():
+    from utils.llm_client import get_llm_gate
+    return get_llm_gate().stats()
+
+
+@app.get("/stats/single-flight")
+async def single_flight_stats():
+    return {"llm_calls": llm_calls.stats(), "session_builds": session_builds.stats()}
+
+
+@app.get("/stats/evaluation-cache")
+async def evaluation_cache_stats():
+    return get_evaluation_cache().stats()
+
+
+@app.post("/cache/{session_id}/invalidate")
+async def invalidate_evaluation_cache(session_id: str, question_number: int | None = None):
+    # Call after changing reference answers or prompt templates for a session
+    get_evaluation_cache().invalidate(session_id, question_number)
+    return {"status": "success", "session_id": session_id, "question_number": question_number}
+
+
+@app.post("/artifacts/{session_id}/invalidate")
+async def invalidate_artifacts(session_id: str):
+    """
+    Forget the questions and reference answers extracted from this session's
+    files (for every session using the same files); the next session build
+    extracts them again. Run after changing the model or a bad extraction.
+    """
+    paths = [os.path.join(UPLOAD_DIR, session_id, name) for name in ("questions.pdf", "answers.pdf")]
+    paths = [path for path in paths if os.path.exists(path)]
+    removed = await asyncio.to_thread(get_artifact_cache().invalidate_files, paths) if paths else 0
+    await asyncio.to_thread(session_store.delete_artifacts, session_id)
+    return {"status": "success", "session_id": session_id, "removed": removed}
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    # Per-process metrics in Prometheus text format; scrape each worker
+    return PlainTextResponse(render_prometheus(), media_type="text/plain; version=0.0.4")
@@ -0,0 +1,160 @@
+"""
+Calibration report for the local pre-scorer (utils/pre_scorer.py).
+
+    python -m benchmarks.calibrate_prescorer --input graded.jsonl [--grade] [--output report.json]
+
+Each input row needs "question", "reference_answer" and "user_answer", plus
+the LLM grade as "llm_accuracy". Rows of a batch grading run also work: there
+the grade is "accuracy", and rows the pre-scorer graded have no LLM grade.
+Rows without one are skipped, unless --grade is given: then they are graded
+now by the evaluation prompt, with the pre-scorer off.
+
+The report gives the share of answers the current thresholds grade locally
+(the LLM calls saved) and how often those local pass/fail decisions agree
+with the LLM. A threshold sweep shows the same trade-off for other accept
+and reject cosine values.
+"""
+import argparse
+import asyncio
+import json
+import sys
+
+import numpy as np
+
+PASS_MARK = 80
+
+
+def load_rows(path):
+    rows = []
+    with open(path) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            row = json.loads(line)
+            if row.get("llm_accuracy") is None and row.get("graded_by", "llm") == "llm":
+                row["llm_accuracy"] = row.get("accuracy")
+            rows.append(row)
+    return rows
+
+
+async def grade_missing(rows, concurrency):
+    from agents.evaluation_agent import EvaluationAgent
+    from utils.pre_scorer import PreScorer
+
+    agent = EvaluationAgent(
+        "prompts/evaluation_prompt.txt", answers_pdf_path="", notes_context="",
+        reference_answers={}, pre_scorer=PreScorer(embedding=None, enabled=False)
+    )
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def grade(index, row):
+        agent.reference_answers[index] = row["reference_answer"]
+        async with semaphore:
+            _, accuracy, _ = await agent.aevaluate(index, row["question"], row["user_answer"], [])
+        row["llm_accuracy"] = accuracy
+
+    await asyncio.gather(*[grade(i, row) for i, row in enumerate(rows) if row.get("llm_accuracy") is None])
+
+
+def summarize(decisions, llm_accuracies, local_accuracies):
+    local = [i for i, decision in enumerate(decisions) if decision != "ambiguous"]
+    accepts = [i for i in local if decisions[i] == "accept"]
+    rejects = [i for i in local if decisions[i] == "reject"]
+    llm_pass = [accuracy > PASS_MARK for accuracy in llm_accuracies]
+
+    agree = [i for i in accepts if llm_pass[i]] + [i for i in rejects if not llm_pass[i]]
+    errors = [abs(local_accuracies[i] - llm_accuracies[i]) for i in local if local_accuracies[i] is not None]
+    return {
+        "rows": len(decisions),
+        "graded_locally": len(local),
+        "local_share": round(len(local) / len(decisions), 4) if decisions else 0.0,
+        "accepted": len(accepts),
+        "rejected": len(rejects),
+        "pass_fail_agreement": round(len(agree) / len(local), 4) if local else None,
+        "accept_precision": round(sum(llm_pass[i] for i in accepts) / len(accepts), 4) if accepts else None,
+        "reject_precision": round(sum(not llm_pass[i] for i in rejects) / len(rejects), 4) if rejects else None,
+        "mean_abs_accuracy_error": round(float(np.mean(errors)), 2) if errors else None,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--input", required=True)
+    parser.add_argument("--grade", action="store_true", help="LLM-grade rows that have no llm_accuracy")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--rows-output", help="write per-row signals and decisions as JSONL")
+    parser.add_argument("--output")
+    args = parser.parse_args(argv)
+
+    from utils.pre_scorer import conflicting_terms, get_pre_scorer, key_terms
+
+    rows = load_rows(args.input)
+    if args.grade:
+        asyncio.run(grade_missing(rows, args.concurrency))
+    rows = [row for row in rows if row.get("llm_accuracy") is not None]
+    if not rows:
+        print("No rows with an LLM grade; pass --grade to grade them now.", file=sys.stderr)
+        return 1
+
+    scorer = get_pre_scorer()
+    # Off by default (PRESCORE_ENABLED); this report is how to decide whether to turn it on
+    scorer.enabled = True
+    scores = [scorer.score(row["user_answer"], row["reference_answer"]) for row in rows]
+    llm_accuracies = [int(row["llm_accuracy"]) for row in rows]
+
+    report = {
+        "thresholds": {
+            "accept_cosine": scorer.accept_cosine,
+            "accept_coverage": scorer.accept_coverage,
+            "reject_cosine": scorer.reject_cosine,
+            "reject_coverage": scorer.reject_coverage,
+        },
+        "current": summarize([s.decision for s in scores], llm_accuracies, [s.accuracy for s in scores]),
+        "sweep": {"accept_cosine": [], "reject_cosine": []},
+    }
+
+    # Re-decide from the recorded signals for other thresholds; empty answers are always rejects
+    signals = [
+        (
+            s.cosine, s.coverage,
+            key_terms(row["reference_answer"]) - key_terms(row["user_answer"]),
+            conflicting_terms(row["user_answer"], row["reference_answer"]),
+            not key_terms(row["user_answer"]),
+        )
+        for s, row in zip(scores, rows)
+    ]
+    original = (scorer.accept_cosine, scorer.reject_cosine)
+    for name, values in (("accept_cosine", np.arange(0.85, 1.0, 0.01)), ("reject_cosine", np.arange(0.60, 0.86, 0.01))):
+        for value in values:
+            setattr(scorer, name, round(float(value), 2))
+            decisions = []
+            local_accuracies = []
+            for cosine, coverage, missing, conflicts, empty in signals:
+                if empty:
+                    decisions.append("reject")
+                    local_accuracies.append(0)
+                    continue
+                decided = scorer.decide(cosine, coverage, missing, conflicts)
+                decisions.append(decided.decision)
+                local_accuracies.append(decided.accuracy)
+            summary = summarize(decisions, llm_accuracies, local_accuracies)
+            report["sweep"][name].append({name: round(float(value), 2), **{
+                key: summary[key] for key in ("local_share", "pass_fail_agreement", "accept_precision", "reject_precision")
+            }})
+        scorer.accept_cosine, scorer.reject_cosine = original
+
+    if args.rows_output:
+        with open(args.rows_output, "w") as f:
+            for row, s in zip(rows, scores):
+                f.write(json.dumps({**row, "prescore": s.as_dict()}) + "\n")
+
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
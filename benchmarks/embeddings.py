@@ -0,0 +1,158 @@
+"""
+Embedding backend benchmark: throughput and retrieval agreement.
+
+    python -m benchmarks.embeddings --backends huggingface,onnx,onnx-int8 --threads 4
+    python -m benchmarks.embeddings --pdf data/<session>/notes.pdf --backends huggingface,onnx
+
+The notes (synthetic by default) are split exactly as ContextAgent splits
+them. Every backend embeds the same chunks and queries. The report covers
+load time, chunk throughput and per-query latency. Agreement with the first
+backend is reported as top-1 match rate, recall@k of its top-k chunks, and
+the mean cosine between the two backends' vectors for the same text.
+"""
+import argparse
+import json
+import sys
+import time
+
+import numpy as np
+
+
+def build_backend(name, args):
+    if name == "huggingface":
+        from langchain_huggingface import HuggingFaceEmbeddings
+        return HuggingFaceEmbeddings(model_name=args.model)
+    if name in ("onnx", "onnx-int8"):
+        from utils.onnx_embeddings import OnnxE5Embeddings
+        return OnnxE5Embeddings(
+            model_dir=args.onnx_dir,
+            batch_size=args.batch_size,
+            intra_op_threads=args.threads,
+            quantize=name == "onnx-int8",
+            # Same inputs as the huggingface backend, so the two sets of vectors are comparable
+            query_prefix="",
+            passage_prefix="",
+        )
+    if name == "fake":
+        from utils.fake_models import FakeEmbeddings
+        return FakeEmbeddings()
+    raise ValueError(f"Unknown backend: {name}")
+
+
+def load_corpus(args):
+    from langchain_core.documents import Document
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+    if args.pdf:
+        from utils.pdf_loader import load_pdf_documents
+        pages = load_pdf_documents(args.pdf)
+    else:
+        from benchmarks.fixtures import notes_pages
+        pages = [Document(page_content="\n".join(lines)) for lines in notes_pages(args.pages)]
+
+    splitter = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=50)
+    chunks = [doc.page_content for doc in splitter.split_documents(pages)]
+
+    if args.pdf:
+        # First sentence of evenly spaced chunks stands in for student questions
+        step = max(1, len(chunks) // args.queries)
+        queries = [chunks[i].split(". ")[0] for i in range(0, len(chunks), step)][:args.queries]
+    else:
+        from benchmarks.fixtures import question_lines
+        queries = [line.split(". ", 1)[1] for line in question_lines(args.queries)]
+    return chunks, queries
+
+
+def run_backend(name, args, chunks, queries):
+    started = time.perf_counter()
+    backend = build_backend(name, args)
+    backend.embed_query("warm-up")
+    load_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    chunk_vectors = np.asarray(backend.embed_documents(chunks), dtype=np.float32)
+    embed_seconds = time.perf_counter() - started
+
+    query_vectors = []
+    started = time.perf_counter()
+    for query in queries:
+        query_vectors.append(backend.embed_query(query))
+    query_seconds = time.perf_counter() - started
+    query_vectors = np.asarray(query_vectors, dtype=np.float32)
+
+    return {
+        "load_seconds": round(load_seconds, 3),
+        "chunks": len(chunks),
+        "embed_seconds": round(embed_seconds, 3),
+        "chunks_per_second": round(len(chunks) / embed_seconds, 1) if embed_seconds else None,
+        "query_latency_ms": round(1000 * query_seconds / max(1, len(queries)), 2),
+    }, chunk_vectors, query_vectors
+
+
+def top_k(chunk_vectors, query_vectors, k):
+    from utils.flat_index import normalize_rows
+    scores = normalize_rows(query_vectors) @ normalize_rows(chunk_vectors).T
+    return np.argsort(-scores, axis=1)[:, :k]
+
+
+def agreement(reference, candidate, k):
+    ref_chunks, ref_queries = reference
+    chunks, queries = candidate
+    ref_top = top_k(ref_chunks, ref_queries, k)
+    top = top_k(chunks, queries, k)
+
+    result = {
+        "top1_match": round(float(np.mean(ref_top[:, 0] == top[:, 0])), 4),
+        f"recall_at_{k}": round(float(np.mean([len(set(a) & set(b)) / k for a, b in zip(ref_top, top)])), 4),
+    }
+    if ref_chunks.shape == chunks.shape:
+        from utils.flat_index import normalize_rows
+        cosines = np.sum(normalize_rows(ref_chunks) * normalize_rows(chunks), axis=1)
+        result["mean_vector_cosine"] = round(float(np.mean(cosines)), 5)
+        result["min_vector_cosine"] = round(float(np.min(cosines)), 5)
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backends", default="huggingface,onnx", help="comma separated; the first is the reference")
+    parser.add_argument("--model", default="intfloat/e5-base-v2")
+    parser.add_argument("--onnx-dir", default="models/e5-base-v2")
+    parser.add_argument("--threads", type=int, default=0, help="ONNX intra-op threads (0 = all cores)")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--pdf", help="benchmark on real notes instead of synthetic ones")
+    parser.add_argument("--pages", type=int, default=40)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--top-k", type=int, default=3)
+    parser.add_argument("--output")
+    args = parser.parse_args(argv)
+
+    chunks, queries = load_corpus(args)
+    report = {"chunks": len(chunks), "queries": len(queries), "backends": {}}
+    vectors = {}
+
+    names = [name.strip() for name in args.backends.split(",") if name.strip()]
+    for name in names:
+        try:
+            stats, chunk_vectors, query_vectors = run_backend(name, args, chunks, queries)
+        except Exception as err:
+            print(f"Backend {name} unavailable: {err}", file=sys.stderr)
+            report["backends"][name] = {"error": str(err)}
+            continue
+        vectors[name] = (chunk_vectors, query_vectors)
+        report["backends"][name] = stats
+
+    reference = next((name for name in names if name in vectors), None)
+    for name in names:
+        if name in vectors and name != reference:
+            report["backends"][name]["agreement_with_" + reference] = agreement(vectors[reference], vectors[name], args.top_k)
+
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+
+
+if __name__ == "__main__":
+    main()
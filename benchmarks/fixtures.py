@@ -0,0 +1,92 @@
+"""Synthetic course material (notes, questions, answers) written as plain text PDFs."""
+import os
+
+TOPICS = [
+    ("Android Inc.", "was founded in 2003 by Andy Rubin, Rich Miner, Nick Sears and Chris White"),
+    ("Google", "acquired Android Inc. in 2005 for an estimated 50 million dollars"),
+    ("the Open Handset Alliance", "was announced in 2007 to develop open standards for mobile devices"),
+    ("the first Android phone", "was the HTC Dream, released in 2008"),
+    ("the Dalvik virtual machine", "ran Android applications before being replaced by ART"),
+    ("the Android runtime ART", "uses ahead-of-time compilation to improve app performance"),
+    ("an Activity", "represents a single screen with a user interface"),
+    ("an Intent", "is a messaging object used to request an action from another component"),
+    ("a Content Provider", "manages access to a structured set of shared data"),
+    ("the Android manifest", "declares components, permissions and hardware requirements of an app"),
+]
+
+
+def notes_pages(page_count):
+    pages = []
+    for page in range(page_count):
+        lines = [f"Lecture notes, page {page + 1}"]
+        for i in range(12):
+            subject, fact = TOPICS[(page + i) % len(TOPICS)]
+            lines.append(f"Section {page + 1}.{i + 1}: {subject} {fact}.")
+        pages.append(lines)
+    pages[-1].append("Summary: Android grew from a startup into the most widely used mobile platform.")
+    return pages
+
+
+def question_lines(count):
+    return [f"{i + 1}. What do you know about {TOPICS[i % len(TOPICS)][0]}?" for i in range(count)]
+
+
+def answer_lines(count):
+    return [f"{i + 1}. {TOPICS[i % len(TOPICS)][0].capitalize()} {TOPICS[i % len(TOPICS)][1]}." for i in range(count)]
+
+
+def write_text_pdf(path, pages):
+    """Write a minimal PDF with one text line per entry; enough for pypdf text extraction."""
+    objects = []
+
+    def add(body):
+        objects.append(body)
+        return len(objects)
+
+    font_id = add(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+    pages_id = add(None)  # filled in once the page ids are known
+    page_ids = []
+    for lines in pages:
+        text = ["BT", "/F1 10 Tf", "12 TL", "40 800 Td"]
+        for line in lines:
+            escaped = line.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+            text.append(f"({escaped}) Tj T*")
+        text.append("ET")
+        stream = "\n".join(text).encode("latin-1", "replace")
+        content_id = add(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        page_ids.append(add(
+            f"<< /Type /Page /Parent {pages_id} 0 R /MediaBox [0 0 595 842] "
+            f"/Resources << /Font << /F1 {font_id} 0 R >> >> /Contents {content_id} 0 R >>".encode()
+        ))
+    kids = " ".join(f"{page_id} 0 R" for page_id in page_ids)
+    objects[pages_id - 1] = f"<< /Type /Pages /Kids [{kids}] /Count {len(page_ids)} >>".encode()
+    catalog_id = add(f"<< /Type /Catalog /Pages {pages_id} 0 R >>".encode())
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref_at = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for offset in offsets:
+        out += b"%010d 00000 n \n" % offset
+    out += b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, catalog_id, xref_at)
+
+    with open(path, "wb") as f:
+        f.write(out)
+
+
+def write_course(directory, notes_page_count=20, question_count=10, with_answers=True):
+    """Write notes.pdf, questions.pdf and (optionally) answers.pdf; returns their paths."""
+    os.makedirs(directory, exist_ok=True)
+    paths = {
+        "notes": os.path.join(directory, "notes.pdf"),
+        "questions": os.path.join(directory, "questions.pdf"),
+    }
+    write_text_pdf(paths["notes"], notes_pages(notes_page_count))
+    write_text_pdf(paths["questions"], [["Exam questions"] + question_lines(question_count)])
+    if with_answers:
+        paths["answers"] = os.path.join(directory, "answers.pdf")
+        write_text_pdf(paths["answers"], [["Model answers"] + answer_lines(question_count)])
+    return paths
@@ -0,0 +1,82 @@
+"""
+Import-time check for the API module:
+
+    python -m benchmarks.import_time --max-seconds 1.0
+
+Imports `api` in fresh interpreters under `python -X importtime` (best of
+--runs), reports the total, the slowest modules and whether any heavy
+dependency that should load lazily was pulled in at import. Exits with 1 if
+the budget is exceeded or a heavy module was imported.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Loaded on first use or during warm-up, never by `import api`
+HEAVY_MODULES = ("torch", "transformers", "sentence_transformers", "chromadb", "langchain_openai", "onnxruntime")
+
+
+def measure_once(module):
+    env = dict(os.environ, LLM_BACKEND=os.getenv("LLM_BACKEND", "fake"))
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=REPO_ROOT, env=env, capture_output=True, text=True
+    )
+    if completed.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{completed.stderr[-2000:]}")
+
+    modules = {}
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        try:
+            _, cumulative, name = line[len("import time:"):].split("|")
+            modules[name.strip()] = int(cumulative) / 1e6
+        except ValueError:
+            continue  # header line
+    return modules
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", default="api")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--max-seconds", type=float, help="fail if the import takes longer")
+    args = parser.parse_args(argv)
+
+    best = None
+    for _ in range(max(1, args.runs)):
+        modules = measure_once(args.module)
+        if best is None or modules.get(args.module, 0) < best.get(args.module, 0):
+            best = modules
+
+    total = best.get(args.module, 0.0)
+    heavy = sorted(name for name in best if name.split(".")[0] in HEAVY_MODULES and "." not in name)
+    slowest = sorted(
+        ((name, seconds) for name, seconds in best.items() if name != args.module),
+        key=lambda item: item[1], reverse=True
+    )[:args.top]
+
+    report = {
+        "module": args.module,
+        "import_seconds": round(total, 4),
+        "heavy_modules_loaded": heavy,
+        "slowest": [{"module": name, "cumulative_seconds": round(seconds, 4)} for name, seconds in slowest],
+    }
+    print(json.dumps(report, indent=2))
+
+    over_budget = args.max_seconds is not None and total > args.max_seconds
+    if over_budget:
+        print(f"Import of {args.module} took {total:.3f}s, budget is {args.max_seconds:.3f}s", file=sys.stderr)
+    if heavy:
+        print(f"Heavy modules imported eagerly: {', '.join(heavy)}", file=sys.stderr)
+    return 1 if over_budget or heavy else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,234 @@
+"""
+Offline benchmark and load test for the FastAPI app.
+
+Runs entirely on the deterministic fake LLM and fake embeddings, so no
+network or API key is needed:
+
+    python -m benchmarks.run --students 50 --questions 10 --output results.json
+
+Measures upload + background ingestion time, per-student first-request
+(session build/rehydration) latency, /chat p50/p95/p99 latency and
+throughput with N concurrent simulated students. Results are printed (and
+optionally written) as JSON so runs can be compared.
+
+The in-process ASGI transport buffers response bodies, so --stream
+time-to-first-event is only meaningful against a live server started with
+the fake backends (LLM_BACKEND=fake EMBEDDING_BACKEND=fake uvicorn api:app)
+and passed via --base-url.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--students", type=int, default=20, help="concurrent simulated students")
+    parser.add_argument("--questions", type=int, default=10)
+    parser.add_argument("--notes-pages", type=int, default=30)
+    parser.add_argument("--no-answers", action="store_true", help="upload without answers.pdf")
+    parser.add_argument("--llm-latency-ms", type=float, default=200.0)
+    parser.add_argument("--llm-tokens-per-second", type=float, default=100.0)
+    parser.add_argument("--embedding-latency-ms", type=float, default=1.0, help="per text")
+    parser.add_argument("--vector-backend", choices=["flat", "chroma"], default="flat")
+    parser.add_argument("--stream", action="store_true", help="use the SSE /chat endpoint")
+    parser.add_argument("--base-url", help="benchmark a running server instead of the in-process app")
+    parser.add_argument("--output", help="also write the JSON results here")
+    return parser.parse_args(argv)
+
+
+def configure_environment(args, workdir):
+    # Must run before the app is imported: modules read these at import time
+    os.environ.update({
+        "LLM_BACKEND": "fake",
+        "EMBEDDING_BACKEND": "fake",
+        "FAKE_LLM_LATENCY_MS": str(args.llm_latency_ms),
+        "FAKE_LLM_TOKENS_PER_SECOND": str(args.llm_tokens_per_second),
+        "FAKE_EMBEDDING_LATENCY_MS": str(args.embedding_latency_ms),
+        "VECTOR_BACKEND": args.vector_backend,
+        "SESSION_DB_PATH": os.path.join(workdir, "state", "sessions.db"),
+        "PDF_TEXT_CACHE_DIR": os.path.join(workdir, "state", "pdf_text"),
+        "ARTIFACT_CACHE_DIR": os.path.join(workdir, "state", "artifacts"),
+        "BLOB_STORE_DIR": os.path.join(workdir, "state", "blobs"),
+    })
+    os.symlink(os.path.join(REPO_ROOT, "prompts"), os.path.join(workdir, "prompts"))
+    os.chdir(workdir)
+    if REPO_ROOT not in sys.path:
+        sys.path.insert(0, REPO_ROOT)
+
+
+def summarize(values):
+    if not values:
+        return {"count": 0}
+    ordered = sorted(values)
+
+    def pct(p):
+        return round(ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))], 4)
+
+    return {
+        "count": len(ordered),
+        "mean": round(sum(ordered) / len(ordered), 4),
+        "p50": pct(50),
+        "p95": pct(95),
+        "p99": pct(99),
+        "max": round(ordered[-1], 4),
+    }
+
+
+async def upload_course(client, session_id, paths):
+    files = {name: (os.path.basename(path), open(path, "rb"), "application/pdf") for name, path in paths.items()}
+    started = time.perf_counter()
+    try:
+        response = await client.post(f"/upload/{session_id}", files=files)
+    finally:
+        for _, handle, _ in files.values():
+            handle.close()
+    response.raise_for_status()
+    upload_seconds = time.perf_counter() - started
+
+    while True:
+        status = (await client.get(f"/upload/{session_id}/status")).json()
+        if status["state"] not in ("pending", "running"):
+            break
+        await asyncio.sleep(0.05)
+
+    return {
+        "upload_seconds": round(upload_seconds, 4),
+        "ingestion_seconds": round(time.perf_counter() - started, 4),
+        "ingestion_state": status["state"],
+        "stages": {name: stage["seconds"] for name, stage in status["stages"].items()},
+    }
+
+
+async def chat(client, session_id, payload, stream):
+    started = time.perf_counter()
+    if not stream:
+        response = await client.post(f"/chat/{session_id}", json=payload)
+        response.raise_for_status()
+        return response.json(), time.perf_counter() - started, None
+
+    first_event = None
+    result = None
+    async with client.stream("POST", f"/chat/{session_id}/stream", json=payload) as response:
+        response.raise_for_status()
+        event = None
+        async for line in response.aiter_lines():
+            if line.startswith("event:"):
+                event = line[len("event:"):].strip()
+                if first_event is None:
+                    first_event = time.perf_counter() - started
+            elif line.startswith("data:") and event == "done":
+                result = json.loads(line[len("data:"):])
+    return result, time.perf_counter() - started, first_event
+
+
+async def simulate_student(client, session_id, student, answers, stream, samples):
+    user_id = f"student-{student}"
+    result, elapsed, _ = await chat(client, session_id, {"user_id": user_id, "user_answer": "", "question_index": 0}, stream)
+    samples["first_request"].append(elapsed)
+
+    index = 0
+    for _ in range(len(answers) * 3):
+        if result.get("complete") or index >= len(answers):
+            break
+        # Alternate correct, partially correct and weak answers, like a real class
+        variant = (student + index) % 3
+        if variant == 0:
+            answer = answers[index]
+        elif variant == 1:
+            answer = answers[index].split(" by ")[0]
+        else:
+            answer = "I am not sure."
+
+        result, elapsed, first_event = await chat(
+            client, session_id, {"user_id": user_id, "user_answer": answer, "question_index": index}, stream
+        )
+        samples["chat"].append(elapsed)
+        if first_event is not None:
+            samples["time_to_first_event"].append(first_event)
+
+        if result.get("retry"):
+            result, elapsed, _ = await chat(
+                client, session_id, {"user_id": user_id, "user_answer": "[NEXT_QUESTION]", "question_index": index}, stream
+            )
+            samples["navigation"].append(elapsed)
+        index = result.get("index", index + 1)
+
+
+async def run(args):
+    import httpx
+    from benchmarks.fixtures import answer_lines, write_course
+
+    import_seconds = None
+    if args.base_url:
+        client_args = {"base_url": args.base_url}
+    else:
+        import_started = time.perf_counter()
+        import api
+        import_seconds = round(time.perf_counter() - import_started, 4)
+        client_args = {"transport": httpx.ASGITransport(app=api.app), "base_url": "http://bench"}
+
+    paths = write_course("course", args.notes_pages, args.questions, with_answers=not args.no_answers)
+    answers = [line.split(". ", 1)[1] for line in answer_lines(args.questions)]
+
+    async with httpx.AsyncClient(timeout=None, **client_args) as client:
+        session_build = await upload_course(client, "bench", paths)
+
+        samples = {"first_request": [], "chat": [], "navigation": [], "time_to_first_event": []}
+        started = time.perf_counter()
+        await asyncio.gather(*[
+            simulate_student(client, "bench", student, answers, args.stream, samples)
+            for student in range(args.students)
+        ])
+        wall = time.perf_counter() - started
+
+        embedding_stats = (await client.get("/stats/embeddings")).json()
+        cache_stats = (await client.get("/stats/evaluation-cache")).json()
+
+    requests = len(samples["first_request"]) + len(samples["chat"]) + len(samples["navigation"])
+    return {
+        "config": {k: v for k, v in vars(args).items() if k != "output"},
+        "environment": {"python": platform.python_version(), "platform": platform.platform()},
+        "import_seconds": import_seconds,
+        "session_build": session_build,
+        "first_request_latency": summarize(samples["first_request"]),
+        "chat_latency": summarize(samples["chat"]),
+        "navigation_latency": summarize(samples["navigation"]),
+        "time_to_first_event": summarize(samples["time_to_first_event"]),
+        "load": {
+            "students": args.students,
+            "requests": requests,
+            "wall_seconds": round(wall, 4),
+            "throughput_rps": round(requests / wall, 2) if wall else None,
+        },
+        "embedding_service": embedding_stats,
+        "evaluation_cache": cache_stats,
+    }
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.output:
+        args.output = os.path.abspath(args.output)
+
+    with tempfile.TemporaryDirectory(prefix="cognix-bench-") as workdir:
+        configure_environment(args, workdir)
+        results = asyncio.run(run(args))
+        os.chdir(REPO_ROOT)
+
+    text = json.dumps(results, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+
+
+if __name__ == "__main__":
+    main()
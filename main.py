@@ -5,14 +5,16 @@ from agents.evaluation_agent import EvaluationAgent
 from agents.reflection_agent import ReflectionAgent
 from agents.orchestrator_agent import OrchestratorAgent
 from agents.orchestrator_session import OrchestratorSession
+from utils import index_registry
 from uuid import uuid4
 
 def create_orchestrator_session(session_id: str, user_id: str | None = None):
     base_path = f"data/{session_id}"
-    chroma_dir = f"chroma_db/{session_id}"
 
     question_path = f"{base_path}/questions.pdf"
     material_path = f"{base_path}/notes.pdf"
+    # The same notes index the server uses for these notes
+    chroma_dir = index_registry.notes_index_path(index_registry.file_sha256(material_path))
     answer_path = f"{base_path}/answers.pdf"
     eval_prompt_path = "prompts/evaluation_prompt.txt"
     reflect_prompt_path = "prompts/reflection_prompt.txt"
@@ -29,3 +31,49 @@ def create_orchestrator_session(session_id: str, user_id: str | None = None):
 
     return OrchestratorSession(orchestrator, session_id=session_id, user_id=user_id or str(uuid4()))
 
+
+
+async def grade_file(session, input_path, output_path, concurrency=8, reflect=False):
+    """Grade a JSONL file of answers; output_path is also the checkpoint a rerun resumes from."""
+    from agents.batch_grader import BatchCheckpoint, BatchGrader, parse_rows
+
+    with open(input_path, encoding="utf-8") as f:
+        rows = parse_rows(f)
+
+    checkpoint = BatchCheckpoint(output_path)
+    grader = BatchGrader(session, concurrency=concurrency, reflect=reflect, checkpoint=checkpoint)
+    try:
+        async for result in grader.grade(rows):
+            if result.get("error"):
+                print(f"❌ {result.get('student')} Q{result.get('question_number')}: {result['error']}")
+    finally:
+        checkpoint.close()
+    return grader.stats
+
+
+def main(argv=None):
+    import argparse
+    import asyncio
+    import os
+
+    parser = argparse.ArgumentParser(description="Grade a session's student answers in bulk.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    grade = commands.add_parser("grade", help="grade a JSONL file of {student, question_number, answer} rows")
+    grade.add_argument("--session", required=True, help="session id under data/")
+    grade.add_argument("--input", required=True)
+    grade.add_argument("--output", required=True, help="results JSONL; rerun with the same file to resume")
+    grade.add_argument("--concurrency", type=int, default=8)
+    grade.add_argument("--reflect", action="store_true", help="also generate reflections (one more LLM call per answer)")
+    grade.add_argument("--restart", action="store_true", help="discard earlier results in --output")
+    args = parser.parse_args(argv)
+
+    if args.restart and os.path.exists(args.output):
+        os.remove(args.output)
+
+    session = create_orchestrator_session(args.session, user_id="batch")
+    stats = asyncio.run(grade_file(session, args.input, args.output, args.concurrency, args.reflect))
+    print(f"✅ Graded {args.input} into {args.output}: {stats}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+"""
+On-disk cache of artifacts the LLM derives from uploaded files: the question
+list extracted from questions.pdf and the reference answers parsed from
+answers.pdf. Entries are keyed by (kind, file sha256, prompt sha256, model),
+so the same file uploaded to any session, by any worker, after any restart
+gets the same result without an LLM call. A changed prompt or model simply
+stops matching old entries.
+
+    python -m utils.artifact_cache list
+    python -m utils.artifact_cache invalidate [--file data/<session>/questions.pdf] [--kind questions] [--all]
+"""
+import argparse
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from filelock import FileLock
+
+from utils.index_registry import file_sha256
+from utils.telemetry import record_cache
+
+ARTIFACT_CACHE_DIR = os.getenv("ARTIFACT_CACHE_DIR", "state/artifacts")
+MEMO_SIZE = 64
+
+
+def prompt_sha256(prompt_template):
+    return hashlib.sha256(prompt_template.encode("utf-8")).hexdigest()
+
+
+def llm_model_name(llm):
+    return getattr(llm, "model_name", None) or type(llm).__name__
+
+
+class ArtifactCache:
+    def __init__(self, directory=ARTIFACT_CACHE_DIR):
+        self.directory = directory
+        # cache key -> value, for entries read or written recently in this process
+        self._memo = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_create(self, kind, path, prompt_template, model, create):
+        """
+        Cached value for (kind, file content, prompt template, model), or
+        create() once if there is none. create() must return something JSON
+        serialisable; empty results are returned but not cached, so a failed
+        extraction is retried next time.
+        """
+        file_hash = file_sha256(path)
+        prompt_hash = prompt_sha256(prompt_template)
+        key = hashlib.sha256(f"{kind}\0{file_hash}\0{prompt_hash}\0{model}".encode("utf-8")).hexdigest()
+
+        with self._lock:
+            if key in self._memo:
+                self._memo.move_to_end(key)
+                record_cache("artifacts", True)
+                return self._memo[key]
+
+        entry_path = os.path.join(self.directory, kind, f"{key}.json")
+        entry = _read_entry(entry_path)
+        record_cache("artifacts", entry is not None)
+        if entry is None:
+            os.makedirs(os.path.dirname(entry_path), exist_ok=True)
+            # Concurrent callers for the same file wait here and then hit the cache
+            with FileLock(f"{entry_path}.lock"):
+                entry = _read_entry(entry_path)
+                if entry is None:
+                    value = create()
+                    if not value:
+                        return value
+                    entry = {
+                        "kind": kind,
+                        "file_sha256": file_hash,
+                        "prompt_sha256": prompt_hash,
+                        "model": model,
+                        "source": path,
+                        "created_at": time.time(),
+                        "value": value,
+                    }
+                    tmp_path = f"{entry_path}.tmp"
+                    with open(tmp_path, "w") as f:
+                        json.dump(entry, f)
+                    os.replace(tmp_path, entry_path)
+
+        with self._lock:
+            self._memo[key] = entry["value"]
+            while len(self._memo) > MEMO_SIZE:
+                self._memo.popitem(last=False)
+        return entry["value"]
+
+    def entries(self, kind=None):
+        """Metadata of every cached entry (without the values)."""
+        found = []
+        for entry_path in self._entry_paths(kind):
+            entry = _read_entry(entry_path)
+            if entry is not None:
+                entry.pop("value", None)
+                entry["key"] = os.path.basename(entry_path)[:-len(".json")]
+                found.append(entry)
+        return found
+
+    def invalidate(self, kind=None, file_hashes=None):
+        """
+        Remove entries of `kind` (all kinds if None) for the given file hashes
+        (all files if None). Returns the number of entries removed.
+        """
+        removed = 0
+        for entry_path in self._entry_paths(kind):
+            if file_hashes is not None:
+                entry = _read_entry(entry_path)
+                if entry is not None and entry["file_sha256"] not in file_hashes:
+                    continue
+            try:
+                os.remove(entry_path)
+                removed += 1
+            except FileNotFoundError:
+                pass
+            try:
+                os.remove(f"{entry_path}.lock")
+            except FileNotFoundError:
+                pass
+
+        # Cheap to rebuild from disk; keeps the memo from serving removed entries
+        with self._lock:
+            self._memo.clear()
+        return removed
+
+    def invalidate_files(self, paths, kind=None):
+        return self.invalidate(kind, {file_sha256(path) for path in paths})
+
+    def _entry_paths(self, kind):
+        kinds = [kind] if kind else (os.listdir(self.directory) if os.path.isdir(self.directory) else [])
+        for name in kinds:
+            kind_dir = os.path.join(self.directory, name)
+            if os.path.isdir(kind_dir):
+                for file_name in sorted(os.listdir(kind_dir)):
+                    if file_name.endswith(".json"):
+                        yield os.path.join(kind_dir, file_name)
+
+
+def _read_entry(entry_path):
+    if not os.path.exists(entry_path):
+        return None
+    try:
+        with open(entry_path, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+_artifact_cache = None
+_artifact_cache_lock = threading.Lock()
+
+
+def get_artifact_cache():
+    global _artifact_cache
+    if _artifact_cache is None:
+        with _artifact_cache_lock:
+            if _artifact_cache is None:
+                _artifact_cache = ArtifactCache()
+    return _artifact_cache
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+    listing = commands.add_parser("list", help="show cached artifacts")
+    listing.add_argument("--kind")
+    invalidate = commands.add_parser("invalidate", help="remove cached artifacts so they are extracted again")
+    invalidate.add_argument("--file", action="append", default=[], help="only entries for this file's content (repeatable)")
+    invalidate.add_argument("--kind", help="only this kind (questions, reference_answers)")
+    invalidate.add_argument("--all", action="store_true", help="required when no --file is given")
+    args = parser.parse_args(argv)
+
+    cache = get_artifact_cache()
+    if args.command == "list":
+        for entry in cache.entries(args.kind):
+            print(json.dumps(entry))
+        return
+
+    if not args.file and not args.all:
+        parser.error("invalidate needs --file or --all")
+    removed = cache.invalidate_files(args.file, args.kind) if args.file else cache.invalidate(args.kind)
+    print(f"Removed {removed} cached artifact(s) from {cache.directory}")
+
+
+if __name__ == "__main__":
+    main()
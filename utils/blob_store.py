@@ -0,0 +1,175 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+from collections import Counter
+
+BLOB_STORE_DIR = os.getenv("BLOB_STORE_DIR", "state/blobs")
+
+
+class UploadTooLarge(ValueError):
+    pass
+
+
+class BlobWriter:
+    """
+    Temporary file that is hashed while it is written. commit() moves it to
+    its content address; if that blob already exists the copy is dropped.
+    """
+
+    def __init__(self, store, max_bytes=None):
+        self.store = store
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._digest = hashlib.sha256()
+        os.makedirs(store.tmp_dir, exist_ok=True)
+        fd, self._tmp_path = tempfile.mkstemp(dir=store.tmp_dir)
+        self._file = os.fdopen(fd, "wb")
+
+    def check_size(self, size):
+        if self.max_bytes is not None and size > self.max_bytes:
+            raise UploadTooLarge(f"File exceeds the {self.max_bytes / (1024 * 1024):g} MB upload limit.")
+
+    def write(self, data):
+        self.check_size(self.size + len(data))
+        self.size += len(data)
+        self._digest.update(data)
+        self._file.write(data)
+
+    def commit(self):
+        """Store the blob; returns its sha256."""
+        self._file.close()
+        digest = self._digest.hexdigest()
+        path = self.store.path(digest)
+        if os.path.exists(path):
+            os.remove(self._tmp_path)
+            # Fresh mtime keeps the GC grace period from collecting it before it is referenced
+            os.utime(path)
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # mkstemp creates 0600 files; blobs are read like any other upload
+            os.chmod(self._tmp_path, 0o644)
+            os.replace(self._tmp_path, path)
+        return digest
+
+    def abort(self):
+        self._file.close()
+        try:
+            os.remove(self._tmp_path)
+        except FileNotFoundError:
+            pass
+
+
+class BlobStore:
+    """
+    Content-addressed file store. Each upload is kept once under its sha256,
+    however many sessions use it; a session holds named references
+    ({"notes": digest, ...}) and sees its files through hard links under
+    data/<session_id>/, so path-based code is unchanged. Anything keyed by
+    content hash (parsed PDF text, extracted artifacts, the notes index) is
+    then shared by every session with the same file.
+    """
+
+    def __init__(self, directory=BLOB_STORE_DIR):
+        self.directory = directory
+        self.tmp_dir = os.path.join(directory, "tmp")
+        self.refs_dir = os.path.join(directory, "refs")
+        self._lock = threading.Lock()
+
+    def path(self, digest):
+        return os.path.join(self.directory, digest[:2], digest)
+
+    def writer(self, max_bytes=None):
+        return BlobWriter(self, max_bytes)
+
+    def refs(self, session_id):
+        path = os.path.join(self.refs_dir, f"{session_id}.json")
+        if not os.path.exists(path):
+            return {}
+        try:
+            with open(path, "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def set_refs(self, session_id, refs, link_dir=None):
+        """
+        Replace the session's references with `refs` (name -> digest). With
+        link_dir, <link_dir>/<name>.pdf is pointed at each blob and files for
+        names no longer referenced are removed.
+        """
+        with self._lock:
+            if link_dir is not None:
+                os.makedirs(link_dir, exist_ok=True)
+                for name, digest in refs.items():
+                    self._link(self.path(digest), os.path.join(link_dir, f"{name}.pdf"))
+                for name in set(self.refs(session_id)) - set(refs):
+                    try:
+                        os.remove(os.path.join(link_dir, f"{name}.pdf"))
+                    except FileNotFoundError:
+                        pass
+
+            os.makedirs(self.refs_dir, exist_ok=True)
+            path = os.path.join(self.refs_dir, f"{session_id}.json")
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(refs, f)
+            os.replace(tmp_path, path)
+
+    def delete_refs(self, session_id):
+        with self._lock:
+            try:
+                os.remove(os.path.join(self.refs_dir, f"{session_id}.json"))
+            except FileNotFoundError:
+                pass
+
+    def sessions(self):
+        if not os.path.isdir(self.refs_dir):
+            return []
+        return [name[:-len(".json")] for name in os.listdir(self.refs_dir) if name.endswith(".json")]
+
+    def refcounts(self):
+        """digest -> number of sessions referencing it; blobs missing here are garbage."""
+        counts = Counter()
+        for session_id in self.sessions():
+            counts.update(set(self.refs(session_id).values()))
+        return counts
+
+    def blob_digests(self):
+        """Digests of all stored blobs."""
+        if not os.path.isdir(self.directory):
+            return
+        for prefix in os.listdir(self.directory):
+            prefix_dir = os.path.join(self.directory, prefix)
+            if len(prefix) == 2 and os.path.isdir(prefix_dir):
+                yield from os.listdir(prefix_dir)
+
+    @staticmethod
+    def _link(source, target):
+        # Never write through an existing link: that would change the shared blob
+        tmp_path = f"{target}.tmp"
+        try:
+            os.remove(tmp_path)
+        except FileNotFoundError:
+            pass
+        try:
+            os.link(source, tmp_path)
+        except OSError:
+            # Different filesystem (or no hard links): fall back to a copy
+            shutil.copyfile(source, tmp_path)
+        os.replace(tmp_path, target)
+
+
+_blob_store = None
+_blob_store_lock = threading.Lock()
+
+
+def get_blob_store():
+    global _blob_store
+    if _blob_store is None:
+        with _blob_store_lock:
+            if _blob_store is None:
+                _blob_store = BlobStore()
+    return _blob_store
@@ -0,0 +1,186 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from langchain_core.embeddings import Embeddings
+
+DEFAULT_MODEL = "intfloat/e5-base-v2"
+
+
+class BatchingEmbeddings(Embeddings):
+    """
+    Embeddings wrapper that owns a single model and coalesces concurrent
+    embed_documents / embed_query calls from different requests into one
+    forward pass, executed on a dedicated worker thread. Queries and
+    documents are kept apart within a batch, for models (e5 over ONNX) that
+    prefix the two differently. `identity` names what produces the vectors;
+    indexes built under another identity are rebuilt.
+    """
+
+    def __init__(self, model_factory, max_batch_size=64, max_wait_ms=5.0, identity="unknown"):
+        self._model_factory = model_factory
+        self._model = None
+        self.identity = identity
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+
+        self._queue = queue.Queue()
+        self._worker = None
+        self._start_lock = threading.Lock()
+
+        self._stats_lock = threading.Lock()
+        self._requests = 0
+        self._texts = 0
+        self._batches = 0
+        self._max_batch = 0
+        self._last_batch = 0
+
+    @property
+    def model(self):
+        if self._model is None:
+            with self._start_lock:
+                if self._model is None:
+                    self._model = self._model_factory()
+        return self._model
+
+    def embed_documents(self, texts):
+        texts = list(texts)
+        if not texts:
+            return []
+        return self._submit(texts, query=False).result()
+
+    def embed_queries(self, texts):
+        """Many queries at once (batched retrieval, answer comparisons)."""
+        texts = list(texts)
+        if not texts:
+            return []
+        return self._submit(texts, query=True).result()
+
+    def embed_query(self, text):
+        return self.embed_queries([text])[0]
+
+    def _submit(self, texts, query):
+        self._ensure_worker()
+        future = Future()
+        self._queue.put((texts, future, query))
+        return future
+
+    def _ensure_worker(self):
+        if self._worker is not None and self._worker.is_alive():
+            return
+        with self._start_lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+                self._worker.start()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            size = len(batch[0][0])
+            deadline = time.monotonic() + self.max_wait
+
+            # Keep collecting callers until the batch is full or the wait window closes
+            while size < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                batch.append(item)
+                size += len(item[0])
+
+            self._process(batch, size)
+
+    def _process(self, batch, size):
+        for query in (False, True):
+            group = [(texts, future) for texts, future, is_query in batch if is_query == query]
+            if group:
+                self._process_group(group, query)
+
+        with self._stats_lock:
+            self._requests += len(batch)
+            self._texts += size
+            self._batches += 1
+            self._max_batch = max(self._max_batch, size)
+            self._last_batch = size
+
+    def _process_group(self, group, query):
+        all_texts = [text for texts, _ in group for text in texts]
+        # Models without a separate query encoding embed queries as documents
+        embed = getattr(self.model, "embed_queries", None) if query else None
+        try:
+            vectors = (embed or self.model.embed_documents)(all_texts)
+        except Exception as err:
+            for _, future in group:
+                future.set_exception(err)
+            return
+
+        offset = 0
+        for texts, future in group:
+            future.set_result(vectors[offset:offset + len(texts)])
+            offset += len(texts)
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                "queue_depth": self._queue.qsize(),
+                "requests": self._requests,
+                "texts": self._texts,
+                "batches": self._batches,
+                "avg_batch_size": round(self._texts / self._batches, 2) if self._batches else 0,
+                "max_batch_size_seen": self._max_batch,
+                "last_batch_size": self._last_batch,
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait * 1000,
+                "model_loaded": self._model is not None,
+            }
+
+
+_service = None
+_service_lock = threading.Lock()
+
+
+def _model_factory():
+    # EMBEDDING_BACKEND=fake gives deterministic offline embeddings for benchmarks
+    if os.getenv("EMBEDDING_BACKEND", "huggingface") == "fake":
+        from utils.fake_models import FakeEmbeddings
+        return lambda: FakeEmbeddings(latency_ms_per_text=float(os.getenv("FAKE_EMBEDDING_LATENCY_MS", "0")))
+
+    # EMBEDDING_BACKEND=onnx runs e5 through ONNX Runtime on CPU (see utils/onnx_embeddings.py)
+    if os.getenv("EMBEDDING_BACKEND", "huggingface") == "onnx":
+        from utils.onnx_embeddings import OnnxE5Embeddings
+        return OnnxE5Embeddings.from_env
+
+    from langchain_huggingface import HuggingFaceEmbeddings
+    model_name = os.getenv("EMBEDDING_MODEL", DEFAULT_MODEL)
+    return lambda: HuggingFaceEmbeddings(model_name=model_name)
+
+
+def _model_identity():
+    """Backend and model the vectors come from, without loading the model."""
+    backend = os.getenv("EMBEDDING_BACKEND", "huggingface")
+    if backend == "fake":
+        return "fake"
+    if backend == "onnx":
+        from utils.onnx_embeddings import OnnxE5Embeddings
+        return OnnxE5Embeddings.identity_from_env()
+    return f"huggingface:{os.getenv('EMBEDDING_MODEL', DEFAULT_MODEL)}"
+
+
+def get_embedding_service():
+    """Process-wide embedding service shared by every ContextAgent."""
+    global _service
+    if _service is None:
+        with _service_lock:
+            if _service is None:
+                _service = BatchingEmbeddings(
+                    model_factory=_model_factory(),
+                    max_batch_size=int(os.getenv("EMBEDDING_MAX_BATCH_SIZE", "64")),
+                    max_wait_ms=float(os.getenv("EMBEDDING_MAX_WAIT_MS", "5")),
+                    identity=_model_identity(),
+                )
+    return _service
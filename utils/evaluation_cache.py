@@ -0,0 +1,227 @@
+import hashlib
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from utils.embedding_service import get_embedding_service
+from utils.telemetry import record_cache
+
+_PUNCTUATION = re.compile(r"[^\w\s]")
+_WHITESPACE = re.compile(r"\s+")
+_CONTRACTED_NOT = re.compile(r"n['’]t\b", re.IGNORECASE)
+
+NEGATIONS = frozenset("no not never none nor neither nothing nobody nowhere cannot without".split())
+
+
+def normalize_answer(text):
+    text = _PUNCTUATION.sub(" ", (text or "").lower())
+    return _WHITESPACE.sub(" ", text).strip()
+
+
+def critical_terms(text):
+    """
+    Numbers and negations in an answer. Embeddings barely tell "is" from
+    "is not" or 1914 from 1918, so answers that differ in these must never
+    be treated as near-duplicates.
+    """
+    return frozenset(word for word in answer_words(text) if word in NEGATIONS or any(ch.isdigit() for ch in word))
+
+
+def answer_words(text):
+    """Normalized words of an answer, with n't contractions spelled out as "not"."""
+    return normalize_answer(_CONTRACTED_NOT.sub(" not", text or "")).split()
+
+
+def version_key(*parts):
+    """
+    Hash of everything a cached grade depends on (reference answer, prompt
+    templates). Folding it into the scope means edited references or
+    prompts simply stop matching old entries.
+    """
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update((part or "").encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()[:16]
+
+
+class _Entry:
+    __slots__ = ("value", "vector", "terms", "size", "expires_at")
+
+    def __init__(self, value, vector, terms, size, expires_at):
+        self.value = value
+        self.vector = vector
+        self.terms = terms
+        self.size = size
+        self.expires_at = expires_at
+
+
+class EvaluationCache:
+    """
+    Cache of graded answers (feedback, accuracy, reflection) per scope, where a
+    scope is (session_id, question_number, version). A lookup first tries the
+    exact normalized answer, then the most similar cached answer in the same
+    scope whose embedding cosine similarity is above similarity_threshold and
+    whose numbers and negations (critical_terms) are exactly the same. A
+    scope of None is never cached. Entries are evicted LRU-first past max_entries / max_bytes, and expire
+    after ttl_seconds.
+    """
+
+    def __init__(self, embedding, similarity_threshold=0.97, max_entries=5000,
+                 max_bytes=64 * 1024 * 1024, ttl_seconds=24 * 3600):
+        self.embedding = embedding
+        self.similarity_threshold = similarity_threshold
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+
+        self._entries = OrderedDict()  # (scope, normalized answer) -> _Entry
+        self._scopes = {}  # scope -> set of normalized answers
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+        self._exact_hits = 0
+        self._similar_hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def lookup(self, scope, user_answer, vector=None):
+        """
+        Return (value, vector). value is None on a miss; vector is the answer
+        embedding (if one was computed) and can be passed back to store().
+        """
+        if scope is None:
+            return None, vector
+        normalized = normalize_answer(user_answer)
+        now = time.monotonic()
+
+        with self._lock:
+            entry = self._entries.get((scope, normalized))
+            if entry is not None and entry.expires_at > now:
+                self._entries.move_to_end((scope, normalized))
+                self._exact_hits += 1
+                record_cache("evaluation", True)
+                return entry.value, entry.vector
+            if entry is not None:
+                self._remove((scope, normalized))
+            has_candidates = bool(self._scopes.get(scope))
+
+        if not has_candidates or self.similarity_threshold > 1:
+            with self._lock:
+                self._misses += 1
+            record_cache("evaluation", False)
+            return None, vector
+
+        if vector is None:
+            vector = self._embed(normalized)
+        terms = critical_terms(user_answer)
+
+        with self._lock:
+            best_key, best_score = None, self.similarity_threshold
+            for candidate in self._scopes.get(scope, ()):
+                key = (scope, candidate)
+                entry = self._entries[key]
+                if entry.expires_at <= now or entry.vector is None or entry.terms != terms:
+                    continue
+                score = float(np.dot(entry.vector, vector))
+                if score >= best_score:
+                    best_key, best_score = key, score
+
+            if best_key is None:
+                self._misses += 1
+                record_cache("evaluation", False)
+                return None, vector
+
+            self._entries.move_to_end(best_key)
+            self._similar_hits += 1
+            record_cache("evaluation", True)
+            return self._entries[best_key].value, vector
+
+    def store(self, scope, user_answer, value, vector=None):
+        if scope is None:
+            return
+        normalized = normalize_answer(user_answer)
+        if vector is None and self.similarity_threshold <= 1:
+            vector = self._embed(normalized)
+
+        size = sum(len(str(v)) for v in value.values()) + len(normalized)
+        if vector is not None:
+            size += vector.nbytes
+
+        with self._lock:
+            key = (scope, normalized)
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = _Entry(
+                value, vector, critical_terms(user_answer), size, time.monotonic() + self.ttl_seconds
+            )
+            self._scopes.setdefault(scope, set()).add(normalized)
+            self._bytes += size
+
+            while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self._evictions += 1
+
+    def invalidate(self, session_id=None, question_number=None):
+        """Drop cached grades for a session (or one of its questions); everything if session_id is None."""
+        with self._lock:
+            for scope in list(self._scopes):
+                if session_id is not None and scope[0] != session_id:
+                    continue
+                if question_number is not None and scope[1] != question_number:
+                    continue
+                for normalized in list(self._scopes.get(scope, ())):
+                    self._remove((scope, normalized))
+
+    def stats(self):
+        with self._lock:
+            lookups = self._exact_hits + self._similar_hits + self._misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "exact_hits": self._exact_hits,
+                "similar_hits": self._similar_hits,
+                "misses": self._misses,
+                "evictions": self._evictions,
+                "hit_rate": round((self._exact_hits + self._similar_hits) / lookups, 4) if lookups else 0.0,
+            }
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        self._bytes -= entry.size
+        scope, normalized = key
+        answers = self._scopes.get(scope)
+        if answers is not None:
+            answers.discard(normalized)
+            if not answers:
+                del self._scopes[scope]
+
+    def _embed(self, normalized):
+        vector = np.asarray(self.embedding.embed_query(normalized), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_evaluation_cache():
+    """Process-wide evaluation cache shared by every session."""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = EvaluationCache(
+                    embedding=get_embedding_service(),
+                    similarity_threshold=float(os.getenv("EVAL_CACHE_SIMILARITY", "0.97")),
+                    max_entries=int(os.getenv("EVAL_CACHE_MAX_ENTRIES", "5000")),
+                    max_bytes=int(float(os.getenv("EVAL_CACHE_MAX_MB", "64")) * 1024 * 1024),
+                    ttl_seconds=float(os.getenv("EVAL_CACHE_TTL_SECONDS", str(24 * 3600))),
+                )
+    return _cache
@@ -0,0 +1,117 @@
+import asyncio
+import hashlib
+import re
+import time
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+_WORD = re.compile(r"\w+")
+_NUMBERED = re.compile(r"^\s*(\d+)\.\s+(.+)")
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    Deterministic offline stand-in for ChatOpenAI, for benchmarks and local
+    runs. Recognises this app's prompts (question / answer extraction,
+    grading) and answers in the format the agents parse. `latency_ms` is
+    time to first token; `tokens_per_second` paces the rest of the output.
+    """
+
+    latency_ms: float = 200.0
+    tokens_per_second: float = 50.0
+
+    @property
+    def _llm_type(self):
+        return "fake-chat"
+
+    def _respond(self, messages):
+        prompt = "\n".join(str(m.content) for m in messages)
+        return _fake_response(prompt), len(_WORD.findall(prompt))
+
+    def _delay(self, text):
+        completion = len(_WORD.findall(text))
+        return self.latency_ms / 1000.0 + (completion / self.tokens_per_second if self.tokens_per_second else 0)
+
+    def _result(self, text, prompt_tokens):
+        usage = {
+            "input_tokens": prompt_tokens,
+            "output_tokens": len(_WORD.findall(text)),
+            "total_tokens": prompt_tokens + len(_WORD.findall(text)),
+        }
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=text, usage_metadata=usage))])
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        text, prompt_tokens = self._respond(messages)
+        time.sleep(self._delay(text))
+        return self._result(text, prompt_tokens)
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        text, prompt_tokens = self._respond(messages)
+        await asyncio.sleep(self._delay(text))
+        return self._result(text, prompt_tokens)
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        text, _ = self._respond(messages)
+        time.sleep(self.latency_ms / 1000.0)
+        for token in re.findall(r"\S+\s*", text):
+            if self.tokens_per_second:
+                time.sleep(1 / self.tokens_per_second)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token))
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        text, _ = self._respond(messages)
+        await asyncio.sleep(self.latency_ms / 1000.0)
+        for token in re.findall(r"\S+\s*", text):
+            if self.tokens_per_second:
+                await asyncio.sleep(1 / self.tokens_per_second)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token))
+
+
+def _fake_response(prompt):
+    if "Extract all clear and complete questions" in prompt or "Extract all numbered answers" in prompt:
+        # Echo numbered lines from the source text: they are the questions / answers
+        lines = [m.group(0).strip() for m in map(_NUMBERED.match, prompt.splitlines()) if m]
+        return "\n".join(lines) or "1. What is the main topic of these notes?"
+
+    digest = int(hashlib.sha256(prompt.encode("utf-8")).hexdigest(), 16)
+    if "Accuracy" in prompt and "Feedback" in prompt:
+        accuracy = 30 + digest % 71
+        return f"Feedback: The answer covers some key points but misses details.\nAccuracy: {accuracy}%"
+    if "Generate a complete and factual answer" in prompt:
+        return "This is a generated reference answer based on the provided lecture context."
+    return (
+        "Review the relevant section of the lecture notes, focus on the key definitions, "
+        "and make sure your answer names the main facts the question asks about."
+    )
+
+
+class FakeEmbeddings(Embeddings):
+    """
+    Deterministic hashed bag-of-words embeddings: texts sharing words get
+    similar vectors, so retrieval and near-duplicate matching behave
+    plausibly. `latency_ms_per_text` simulates model cost.
+    """
+
+    def __init__(self, size=768, latency_ms_per_text=0.0):
+        self.size = size
+        self.latency_ms_per_text = latency_ms_per_text
+
+    def _embed(self, text):
+        vector = np.zeros(self.size, dtype=np.float32)
+        for word in _WORD.findall(text.lower()):
+            index = int(hashlib.md5(word.encode("utf-8")).hexdigest()[:8], 16) % self.size
+            vector[index] += 1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def embed_documents(self, texts):
+        if self.latency_ms_per_text:
+            time.sleep(self.latency_ms_per_text * len(texts) / 1000.0)
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
@@ -0,0 +1,266 @@
+import json
+import os
+import shutil
+import tempfile
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.vectorstores import VectorStore
+
+EMBEDDINGS_FILE = "embeddings.npy"
+CHUNKS_FILE = "chunks.json"
+# Names the snapshot directory readers should open; replaced atomically on every save
+CURRENT_FILE = "CURRENT"
+VERSION_PREFIX = "v-"
+
+
+class FlatVectorStore(VectorStore):
+    """
+    Exact-search vector store for small per-session corpora. Normalized
+    embeddings live in one .npy file opened with mmap; chunk ids, texts and
+    metadata live in a JSON side file. A query is one matrix-vector product
+    over all chunks, with no database or ANN index to open.
+
+    Every save writes both files into a new snapshot directory and then
+    swaps the CURRENT pointer, so a reader in any process sees either the
+    old pair or the new one, never a mix. Writes inside bulk() are saved
+    once, at the end of the block.
+    """
+
+    def __init__(self, persist_directory, embedding_function):
+        self.persist_directory = persist_directory
+        self._embedding = embedding_function
+        self._lock = threading.RLock()
+        self._loaded_pointer = None
+        self._bulk_depth = 0
+        self._dirty = False
+
+        self._ids = []
+        self._documents = []
+        self._metadatas = []
+        self._matrix = np.zeros((0, 0), dtype=np.float32)
+        # Rows added since the matrix was last assembled; concatenated once when needed
+        self._appended = []
+        self._load()
+
+    @property
+    def embeddings(self):
+        return self._embedding
+
+    # ---- persistence ----
+
+    def _pointer_path(self):
+        return os.path.join(self.persist_directory, CURRENT_FILE)
+
+    def _pointer_stamp(self):
+        try:
+            st = os.stat(self._pointer_path())
+        except OSError:
+            return None
+        return st.st_ino, st.st_mtime_ns
+
+    def _load(self, attempts=3):
+        for attempt in range(attempts):
+            try:
+                return self._load_snapshot()
+            except FileNotFoundError:
+                # Two saves went by while this snapshot was being opened; read the pointer again
+                if attempt == attempts - 1:
+                    raise
+
+    def _load_snapshot(self):
+        stamp = self._pointer_stamp()
+        if stamp is not None:
+            with open(self._pointer_path(), "r") as f:
+                snapshot_dir = os.path.join(self.persist_directory, f.read().strip())
+        else:
+            # Stores written before snapshots keep both files at the top level
+            snapshot_dir = self.persist_directory
+        chunks_path = os.path.join(snapshot_dir, CHUNKS_FILE)
+        if not os.path.exists(chunks_path):
+            return
+        with open(chunks_path, "r") as f:
+            chunks = json.load(f)
+        matrix_path = os.path.join(snapshot_dir, EMBEDDINGS_FILE)
+        matrix = np.load(matrix_path, mmap_mode="r") if chunks["ids"] else np.zeros((0, 0), dtype=np.float32)
+
+        self._ids = chunks["ids"]
+        self._documents = chunks["documents"]
+        self._metadatas = chunks["metadatas"]
+        self._matrix = matrix
+        self._appended = []
+        self._loaded_pointer = stamp
+
+    def _reload_if_changed(self):
+        # Another worker may have saved a new snapshot since we opened it
+        stamp = self._pointer_stamp()
+        if stamp is not None and stamp != self._loaded_pointer:
+            with self._lock:
+                if not self._dirty:
+                    self._load()
+
+    def _save(self):
+        # Caller holds self._lock
+        if self._bulk_depth:
+            self._dirty = True
+            return
+        os.makedirs(self.persist_directory, exist_ok=True)
+        snapshot_dir = tempfile.mkdtemp(prefix=VERSION_PREFIX, dir=self.persist_directory)
+        os.chmod(snapshot_dir, 0o755)
+
+        np.save(os.path.join(snapshot_dir, EMBEDDINGS_FILE), np.ascontiguousarray(self._assembled(), dtype=np.float32))
+        with open(os.path.join(snapshot_dir, CHUNKS_FILE), "w") as f:
+            json.dump({"ids": self._ids, "documents": self._documents, "metadatas": self._metadatas}, f)
+
+        previous = None
+        if self._pointer_stamp() is not None:
+            with open(self._pointer_path(), "r") as f:
+                previous = f.read().strip()
+        tmp_pointer = f"{self._pointer_path()}.tmp"
+        with open(tmp_pointer, "w") as f:
+            f.write(os.path.basename(snapshot_dir))
+        os.replace(tmp_pointer, self._pointer_path())
+
+        # Keep the previous snapshot for readers that are opening it right now
+        keep = {os.path.basename(snapshot_dir), previous}
+        for name in os.listdir(self.persist_directory):
+            if name.startswith(VERSION_PREFIX) and name not in keep:
+                shutil.rmtree(os.path.join(self.persist_directory, name), ignore_errors=True)
+        for name in (EMBEDDINGS_FILE, CHUNKS_FILE):
+            try:
+                os.remove(os.path.join(self.persist_directory, name))
+            except FileNotFoundError:
+                pass
+
+        self._dirty = False
+        self._load()
+
+    def _assembled(self):
+        # Caller holds self._lock
+        if self._appended:
+            parts = [np.asarray(self._matrix)] if len(self._matrix) else []
+            self._matrix = np.vstack(parts + self._appended)
+            self._appended = []
+        return self._matrix
+
+    @contextmanager
+    def bulk(self):
+        """Group writes: everything added or deleted inside the block is saved once, at the end."""
+        with self._lock:
+            self._bulk_depth += 1
+        try:
+            yield self
+        finally:
+            with self._lock:
+                self._bulk_depth -= 1
+                if not self._bulk_depth and self._dirty:
+                    self._save()
+
+    # ---- writes ----
+
+    def add_texts(self, texts, metadatas=None, ids=None, **kwargs):
+        texts = list(texts)
+        if not texts:
+            return []
+        metadatas = list(metadatas) if metadatas else [{} for _ in texts]
+        ids = list(ids) if ids else [str(i) for i in range(len(self._ids), len(self._ids) + len(texts))]
+        vectors = normalize_rows(np.asarray(self._embedding.embed_documents(texts), dtype=np.float32))
+
+        with self._lock:
+            # Upsert: rows whose id already exists are replaced
+            replaced = set(ids).intersection(self._ids)
+            if replaced:
+                self._drop(replaced)
+            self._ids = self._ids + ids
+            self._documents = self._documents + texts
+            self._metadatas = self._metadatas + metadatas
+            self._appended.append(vectors)
+            self._save()
+        return ids
+
+    def delete(self, ids=None, **kwargs):
+        if not ids:
+            return False
+        with self._lock:
+            if not self._drop(set(ids)):
+                return False
+            self._save()
+        return True
+
+    def _drop(self, drop):
+        # Caller holds self._lock
+        keep = [i for i, chunk_id in enumerate(self._ids) if chunk_id not in drop]
+        if len(keep) == len(self._ids):
+            return False
+        matrix = self._assembled()
+        self._matrix = np.asarray(matrix)[keep] if keep else np.zeros((0, matrix.shape[1]), dtype=np.float32)
+        self._ids = [self._ids[i] for i in keep]
+        self._documents = [self._documents[i] for i in keep]
+        self._metadatas = [self._metadatas[i] for i in keep]
+        return True
+
+    def reset_collection(self):
+        with self._lock:
+            self._ids, self._documents, self._metadatas = [], [], []
+            self._matrix = np.zeros((0, 0), dtype=np.float32)
+            self._appended = []
+            self._save()
+
+    # ---- reads ----
+
+    def get(self, include=("documents", "metadatas")):
+        """Same shape as Chroma.get(), so ContextAgent can treat both backends alike."""
+        self._reload_if_changed()
+        with self._lock:
+            result = {"ids": list(self._ids)}
+            if "documents" in include:
+                result["documents"] = list(self._documents)
+            if "metadatas" in include:
+                result["metadatas"] = list(self._metadatas)
+            if "embeddings" in include:
+                result["embeddings"] = self._assembled()
+        return result
+
+    def similarity_search(self, query, k=4, **kwargs):
+        return [doc for doc, _ in self.similarity_search_with_score(query, k)]
+
+    def similarity_search_with_score(self, query, k=4, **kwargs):
+        vector = np.asarray(self._embedding.embed_query(query), dtype=np.float32)
+        return self.similarity_search_by_vector_with_score(vector, k)
+
+    def similarity_search_by_vector(self, embedding, k=4, **kwargs):
+        return [doc for doc, _ in self.similarity_search_by_vector_with_score(embedding, k)]
+
+    def similarity_search_by_vector_with_score(self, embedding, k=4):
+        self._reload_if_changed()
+        with self._lock:
+            matrix = self._assembled()
+            documents, metadatas = self._documents, self._metadatas
+        if not len(matrix):
+            return []
+
+        query = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        scores = matrix @ (query / norm if norm else query)
+
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [
+            (Document(page_content=documents[i], metadata=metadatas[i] or {}), float(scores[i]))
+            for i in top
+        ]
+
+    @classmethod
+    def from_texts(cls, texts, embedding, metadatas=None, ids=None, persist_directory=None, **kwargs):
+        store = cls(persist_directory, embedding)
+        store.add_texts(texts, metadatas=metadatas, ids=ids)
+        return store
+
+
+def normalize_rows(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
@@ -0,0 +1,113 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+
+from filelock import FileLock
+
+MANIFEST_NAME = "index_manifest.json"
+LOCK_NAME = ".index.lock"
+
+# persist_directory -> (notes content hash, backend, embedding) of the index that is known to be built
+_ready_indexes = {}
+_registry_lock = threading.Lock()
+
+
+def file_sha256(path, block_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def notes_index_path(notes_digest):
+    """Vector index directory shared by every session whose notes have this sha256."""
+    return f"chroma_db/notes-{notes_digest[:24]}"
+
+
+def index_lock(persist_directory):
+    """
+    Lock guarding (re)indexing of a single persist directory.
+    File based, so it also serialises other worker processes on the same host.
+    """
+    os.makedirs(persist_directory, exist_ok=True)
+    return FileLock(os.path.join(persist_directory, LOCK_NAME))
+
+
+def seed_index(persist_directory, source_directory, backend="chroma"):
+    """
+    Start an index as a copy of another one, typically the previous version of
+    the same notes, so a sync only embeds the chunks that changed. Copies only
+    into a directory with no index yet, from an index built by the same
+    backend. The caller holds index_lock(persist_directory). Returns True if
+    the source was copied.
+    """
+    if os.path.abspath(persist_directory) == os.path.abspath(source_directory):
+        return False
+    if read_manifest(persist_directory) is not None:
+        return False
+    manifest = read_manifest(source_directory)
+    if not manifest or manifest.get("backend", "chroma") != backend:
+        return False
+    # The copied manifest names the old notes, so the copy is synced rather than used as is
+    with index_lock(source_directory):
+        shutil.copytree(source_directory, persist_directory, dirs_exist_ok=True,
+                        ignore=shutil.ignore_patterns(LOCK_NAME))
+    return True
+
+
+def read_manifest(persist_directory):
+    path = os.path.join(persist_directory, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_manifest(persist_directory, manifest):
+    path = os.path.join(persist_directory, MANIFEST_NAME)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f)
+    os.replace(tmp_path, path)
+    mark_ready(persist_directory, manifest["notes_hash"], manifest.get("backend", "chroma"), manifest.get("embedding"))
+
+
+def is_ready(persist_directory, notes_hash, backend="chroma", embedding=None):
+    """
+    True if the index in persist_directory was built by this backend from
+    notes with this hash, with vectors from this embedding model. Vectors from
+    another model (or from before the model was recorded) are not comparable
+    with the queries, so such an index is not ready.
+    """
+    with _registry_lock:
+        known = _ready_indexes.get(persist_directory) == (notes_hash, backend, embedding)
+    # The directory may have been garbage collected by another worker since
+    if known and os.path.exists(os.path.join(persist_directory, MANIFEST_NAME)):
+        return True
+    manifest = read_manifest(persist_directory)
+    if (
+        manifest and manifest.get("notes_hash") == notes_hash
+        and manifest.get("backend", "chroma") == backend and manifest.get("embedding") == embedding
+    ):
+        mark_ready(persist_directory, notes_hash, backend, embedding)
+        return True
+    return False
+
+
+def mark_ready(persist_directory, notes_hash, backend="chroma", embedding=None):
+    with _registry_lock:
+        _ready_indexes[persist_directory] = (notes_hash, backend, embedding)
+
+
+def forget(persist_directory=None):
+    with _registry_lock:
+        if persist_directory is None:
+            _ready_indexes.clear()
+        else:
+            _ready_indexes.pop(persist_directory, None)
@@ -0,0 +1,208 @@
+import asyncio
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+SKIPPED = "skipped"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+
+class IngestionCancelled(Exception):
+    """A job's future fails with this once a newer job for the same session replaces it."""
+
+
+class Stage:
+    """One unit of ingestion work. `fn(results)` receives the results of the stages it depends on."""
+
+    def __init__(self, name, fn, depends_on=()):
+        self.name = name
+        self.fn = fn
+        self.depends_on = tuple(depends_on)
+
+
+class IngestionJob:
+    """
+    Runs a small DAG of stages on a shared executor: every stage whose
+    dependencies are done is started immediately, so independent stages run
+    in parallel. Progress is pushed to `on_update` after each transition,
+    and `future` resolves with the stage results once all stages finish, or
+    with the first stage failure. A cancelled job starts no more stages,
+    drops the results of the ones still running and stops publishing.
+    """
+
+    def __init__(self, session_id, stages, on_update=None, job_id=None):
+        self.session_id = session_id
+        self.job_id = job_id or uuid.uuid4().hex
+        self.stages = {stage.name: stage for stage in stages}
+        self.on_update = on_update
+        self.results = {}
+        self.state = PENDING
+        self.error = None
+        self.created_at = time.time()
+        self.future = Future()
+
+        self._stage_status = {
+            name: {"state": PENDING, "started_at": None, "seconds": None, "error": None}
+            for name in self.stages
+        }
+        self._scheduled = set()
+        self._lock = threading.Lock()
+
+    def start(self, executor):
+        with self._lock:
+            self.state = RUNNING
+            self._schedule_ready(executor)
+        self._notify()
+
+    def _schedule_ready(self, executor):
+        # Caller holds self._lock
+        for name, stage in self.stages.items():
+            if name in self._scheduled:
+                continue
+            if all(self._stage_status[dep]["state"] in (DONE, SKIPPED) for dep in stage.depends_on):
+                self._scheduled.add(name)
+                executor.submit(self._run_stage, stage, executor)
+
+    def _run_stage(self, stage, executor):
+        started = time.time()
+        with self._lock:
+            self._stage_status[stage.name].update(state=RUNNING, started_at=started)
+        self._notify()
+
+        try:
+            result = stage.fn(self.results)
+        except Exception as err:
+            print(f"❌ Ingestion stage '{stage.name}' failed for {self.session_id}: {err}")
+            with self._lock:
+                self._stage_status[stage.name].update(
+                    state=FAILED, error=str(err), seconds=round(time.time() - started, 3)
+                )
+                # Parallel stages can fail together; only the first failure settles the job
+                first = self.state == RUNNING
+                if first:
+                    self.state = FAILED
+                    self.error = f"{stage.name}: {err}"
+            self._notify()
+            if first:
+                self.future.set_exception(err)
+            return
+
+        with self._lock:
+            if self.state == CANCELLED:
+                return
+            self.results[stage.name] = result
+            self._stage_status[stage.name].update(
+                state=SKIPPED if result is None else DONE, seconds=round(time.time() - started, 3)
+            )
+            finished = all(s["state"] in (DONE, SKIPPED) for s in self._stage_status.values())
+            if finished:
+                self.state = DONE
+            elif self.state != FAILED:
+                self._schedule_ready(executor)
+        self._notify()
+
+        if finished:
+            self.future.set_result(self.results)
+
+    def cancel(self):
+        """Stop the job in favour of a newer one. Returns False if it had already finished."""
+        with self._lock:
+            if self.state not in (PENDING, RUNNING):
+                return False
+            self.state = CANCELLED
+            self.error = "Superseded by a newer upload."
+        self.future.set_exception(IngestionCancelled(self.session_id))
+        return True
+
+    def _notify(self):
+        # A cancelled job must not overwrite the status of the job that replaced it
+        if self.on_update and self.state != CANCELLED:
+            try:
+                self.on_update(self.session_id, self.status())
+            except Exception as err:
+                print(f"Failed to publish ingestion status for {self.session_id}: {err}")
+
+    def status(self):
+        with self._lock:
+            stages = {name: dict(status) for name, status in self._stage_status.items()}
+            finished = sum(1 for s in stages.values() if s["state"] in (DONE, SKIPPED))
+            return {
+                "session_id": self.session_id,
+                "job_id": self.job_id,
+                "state": self.state,
+                "error": self.error,
+                "progress": round(finished / len(stages), 3) if stages else 1.0,
+                "stages": stages,
+                "created_at": self.created_at,
+            }
+
+
+class IngestionManager:
+    """Owns the worker pool and the latest ingestion job per session in this process."""
+
+    def __init__(self, max_workers=None, on_update=None):
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers or int(os.getenv("INGESTION_WORKERS", "4")),
+            thread_name_prefix="ingestion"
+        )
+        self.on_update = on_update
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def new_job(self, session_id, stages, job_id=None):
+        return IngestionJob(session_id, stages, on_update=self.on_update, job_id=job_id)
+
+    def submit(self, job):
+        """Start `job`; this process's previous job for the same session is cancelled."""
+        with self._lock:
+            previous = self._jobs.get(job.session_id)
+            self._jobs[job.session_id] = job
+        if previous is not None:
+            previous.cancel()
+        job.start(self.executor)
+        return job
+
+    def get(self, session_id):
+        with self._lock:
+            return self._jobs.get(session_id)
+
+    async def wait(self, session_id, timeout=None):
+        """
+        Await this process's job for the session, if any, following any job
+        that replaces it meanwhile. Returns the final status or None.
+        """
+        job = self.get(session_id)
+        if job is None:
+            return None
+        loop = asyncio.get_running_loop()
+        deadline = None if timeout is None else loop.time() + timeout
+        while True:
+            remaining = None if deadline is None else max(0.0, deadline - loop.time())
+            try:
+                await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(job.future)), remaining)
+            except asyncio.TimeoutError:
+                return job.status()
+            except Exception:
+                # Failure is reported through the job status
+                pass
+            latest = self.get(session_id)
+            if job.state != CANCELLED or latest is None or latest is job:
+                return job.status()
+            job = latest
+
+    def forget(self, session_id=None):
+        """Drop (and cancel) the jobs of one session, or of all sessions."""
+        with self._lock:
+            if session_id is None:
+                jobs = list(self._jobs.values())
+                self._jobs.clear()
+            else:
+                jobs = [job for job in [self._jobs.pop(session_id, None)] if job is not None]
+        for job in jobs:
+            job.cancel()
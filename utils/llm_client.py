@@ -0,0 +1,427 @@
+import asyncio
+import itertools
+import os
+import random
+import threading
+import time
+import weakref
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from email.utils import parsedate_to_datetime
+
+import httpx
+import openai
+from langchain_openai import ChatOpenAI
+
+# Errors worth retrying; everything else (bad request, auth, ...) is raised at once
+RETRYABLE_ERRORS = (openai.RateLimitError, openai.APIConnectionError, openai.InternalServerError)
+
+
+class TokenBucket:
+    """
+    Refills at `per_minute / 60` units per second up to `capacity`. Reservations
+    may drive the balance negative; the caller then waits until its share has
+    refilled, which keeps concurrent callers in arrival order.
+    """
+
+    def __init__(self, per_minute, capacity=None):
+        self.rate = per_minute / 60.0
+        # Default burst: ten seconds' worth of quota
+        self.capacity = capacity or max(1.0, per_minute / 6.0)
+        self._balance = self.capacity
+        self._updated = time.monotonic()
+
+    def reserve(self, amount, now):
+        """Take `amount` units; returns how many seconds to wait before using them."""
+        self._refill(now)
+        self._balance -= amount
+        return 0.0 if self._balance >= 0 else -self._balance / self.rate
+
+    def adjust(self, amount, now):
+        """Correct an earlier reservation by `amount` units (negative gives units back)."""
+        self._refill(now)
+        self._balance = min(self.capacity, self._balance - amount)
+
+    def _refill(self, now):
+        self._balance = min(self.capacity, self._balance + (now - self._updated) * self.rate)
+        self._updated = now
+
+
+class SlotPool:
+    """
+    Counting semaphore shared by threads and event loops. A released slot is
+    handed straight to the longest waiter: a thread is woken through its
+    Event, a coroutine through its future on its own loop, so async callers
+    wait without blocking or polling the loop.
+    """
+
+    def __init__(self, size):
+        self._free = size
+        self._waiters = deque()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            if self._free and not self._waiters:
+                self._free -= 1
+                return
+            event = threading.Event()
+            self._waiters.append(event)
+        event.wait()
+
+    async def aacquire(self):
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self._free and not self._waiters:
+                self._free -= 1
+                return
+            future = loop.create_future()
+            self._waiters.append((loop, future))
+        try:
+            await future
+        except asyncio.CancelledError:
+            with self._lock:
+                try:
+                    self._waiters.remove((loop, future))
+                    granted = False
+                except ValueError:
+                    granted = future.done() and not future.cancelled()
+            # Granted just as we were cancelled: pass the slot on
+            if granted:
+                self.release()
+            raise
+
+    def release(self):
+        with self._lock:
+            while self._waiters:
+                waiter = self._waiters.popleft()
+                if isinstance(waiter, threading.Event):
+                    waiter.set()
+                    return
+                loop, future = waiter
+                try:
+                    loop.call_soon_threadsafe(self._grant, future)
+                    return
+                except RuntimeError:
+                    # Its loop has closed; try the next waiter
+                    continue
+            self._free += 1
+
+    def _grant(self, future):
+        # Runs on the waiter's loop; a waiter cancelled meanwhile gives the slot back
+        if future.cancelled():
+            self.release()
+        else:
+            future.set_result(None)
+
+
+class LLMGate:
+    """
+    Process-wide admission control for LLM calls: at most `max_concurrency`
+    calls in flight, request and token rates held under the RPM/TPM quotas,
+    and one shared backoff window. When any call gets a 429 every caller
+    pauses until the server's Retry-After has passed, instead of each one
+    retrying on its own schedule.
+    """
+
+    def __init__(self, max_concurrency=16, requests_per_minute=0, tokens_per_minute=0,
+                 max_retries=5, base_delay=1.0, max_delay=60.0):
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+        self._slots = SlotPool(max_concurrency)
+        self._lock = threading.Lock()
+        self._requests = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self._tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self._paused_until = 0.0
+
+        self._calls = 0
+        self._in_flight = 0
+        self._retries = 0
+        self._rate_limited = 0
+        self._throttled_seconds = 0.0
+
+    @contextmanager
+    def slot(self, estimated_tokens):
+        delay = self._reserve(estimated_tokens)
+        if delay > 0:
+            time.sleep(delay)
+        self._slots.acquire()
+        try:
+            # A 429 elsewhere may have opened a backoff window while we waited
+            pause = self._pause_remaining()
+            if pause > 0:
+                time.sleep(pause)
+            self._enter()
+            try:
+                yield
+            finally:
+                self._leave()
+        finally:
+            self._slots.release()
+
+    @asynccontextmanager
+    async def aslot(self, estimated_tokens):
+        delay = self._reserve(estimated_tokens)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        await self._slots.aacquire()
+        try:
+            pause = self._pause_remaining()
+            if pause > 0:
+                await asyncio.sleep(pause)
+            self._enter()
+            try:
+                yield
+            finally:
+                self._leave()
+        finally:
+            self._slots.release()
+
+    def settle(self, estimated_tokens, actual_tokens):
+        """Replace the token estimate reserved for a call with its real usage."""
+        if self._tokens is None or not actual_tokens:
+            return
+        with self._lock:
+            self._tokens.adjust(actual_tokens - estimated_tokens, time.monotonic())
+
+    def backoff(self, attempt, err):
+        """
+        Seconds to wait before retry number `attempt + 1`, or None when retries
+        are exhausted. A 429 opens the shared pause window, so its delay is
+        served by the next slot() reservation rather than returned here.
+        """
+        if attempt >= self.max_retries:
+            return None
+
+        delay = min(self.max_delay, self.base_delay * (2 ** attempt))
+        delay *= random.uniform(0.5, 1.0)
+        rate_limited = isinstance(err, openai.RateLimitError)
+        with self._lock:
+            self._retries += 1
+            if rate_limited:
+                self._rate_limited += 1
+                delay = max(delay, retry_after_seconds(err) or 0.0)
+                self._paused_until = max(self._paused_until, time.monotonic() + delay)
+
+        scope = "all LLM calls paused" if rate_limited else "retrying"
+        print(f"LLM call failed ({type(err).__name__}), {scope} for {delay:.1f}s (retry {attempt + 1})")
+        return 0.0 if rate_limited else delay
+
+    def stats(self):
+        with self._lock:
+            return {
+                "max_concurrency": self.max_concurrency,
+                "in_flight": self._in_flight,
+                "calls": self._calls,
+                "retries": self._retries,
+                "rate_limited": self._rate_limited,
+                "throttled_seconds": round(self._throttled_seconds, 3),
+                "paused_for_seconds": round(max(0.0, self._paused_until - time.monotonic()), 3),
+            }
+
+    def _reserve(self, estimated_tokens):
+        with self._lock:
+            now = time.monotonic()
+            delay = max(0.0, self._paused_until - now)
+            if self._requests is not None:
+                delay = max(delay, self._requests.reserve(1, now))
+            if self._tokens is not None:
+                delay = max(delay, self._tokens.reserve(estimated_tokens, now))
+            self._throttled_seconds += delay
+            return delay
+
+    def _pause_remaining(self):
+        with self._lock:
+            return self._paused_until - time.monotonic()
+
+    def _enter(self):
+        with self._lock:
+            self._calls += 1
+            self._in_flight += 1
+
+    def _leave(self):
+        with self._lock:
+            self._in_flight -= 1
+
+
+def retry_after_seconds(err):
+    """Server-requested delay from a 429 response (Retry-After / retry-after-ms), if any."""
+    response = getattr(err, "response", None)
+    if response is None:
+        return None
+    headers = response.headers
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000.0
+        value = headers.get("retry-after")
+        if not value:
+            return None
+        try:
+            return float(value)
+        except ValueError:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def estimate_tokens(messages):
+    # ~4 characters per token, plus room for the completion
+    chars = sum(len(str(getattr(message, "content", message))) for message in messages)
+    return chars // 4 + int(os.getenv("LLM_EXPECTED_COMPLETION_TOKENS", "300"))
+
+
+def _total_tokens(result):
+    usage = (result.llm_output or {}).get("token_usage") or {}
+    return usage.get("total_tokens", 0)
+
+
+class PooledChatOpenAI(ChatOpenAI):
+    """ChatOpenAI whose calls pass through the shared LLMGate, with coordinated retries."""
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        gate = get_llm_gate()
+        estimate = estimate_tokens(messages)
+        for attempt in itertools.count():
+            try:
+                with gate.slot(estimate):
+                    result = super()._generate(messages, stop=stop, run_manager=run_manager, **kwargs)
+            except RETRYABLE_ERRORS as err:
+                delay = gate.backoff(attempt, err)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+                continue
+            gate.settle(estimate, _total_tokens(result))
+            return result
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        gate = get_llm_gate()
+        estimate = estimate_tokens(messages)
+        for attempt in itertools.count():
+            try:
+                async with gate.aslot(estimate):
+                    result = await super()._agenerate(messages, stop=stop, run_manager=run_manager, **kwargs)
+            except RETRYABLE_ERRORS as err:
+                delay = gate.backoff(attempt, err)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+                continue
+            gate.settle(estimate, _total_tokens(result))
+            return result
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        gate = get_llm_gate()
+        estimate = estimate_tokens(messages)
+        for attempt in itertools.count():
+            started = False
+            try:
+                with gate.slot(estimate):
+                    for chunk in super()._stream(messages, stop=stop, run_manager=run_manager, **kwargs):
+                        started = True
+                        yield chunk
+                return
+            except RETRYABLE_ERRORS as err:
+                # Tokens already went to the client; a retry would repeat them
+                delay = None if started else gate.backoff(attempt, err)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        gate = get_llm_gate()
+        estimate = estimate_tokens(messages)
+        for attempt in itertools.count():
+            started = False
+            try:
+                async with gate.aslot(estimate):
+                    async for chunk in super()._astream(messages, stop=stop, run_manager=run_manager, **kwargs):
+                        started = True
+                        yield chunk
+                return
+            except RETRYABLE_ERRORS as err:
+                delay = None if started else gate.backoff(attempt, err)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+
+
+_gate = None
+_http_clients = None
+_registry_lock = threading.Lock()
+
+
+def get_llm_gate():
+    """Process-wide gate, configured from LLM_MAX_CONCURRENCY / LLM_RPM / LLM_TPM / LLM_MAX_RETRIES."""
+    global _gate
+    if _gate is None:
+        with _registry_lock:
+            if _gate is None:
+                _gate = LLMGate(
+                    max_concurrency=int(os.getenv("LLM_MAX_CONCURRENCY", "16")),
+                    requests_per_minute=int(os.getenv("LLM_RPM", "0")),
+                    tokens_per_minute=int(os.getenv("LLM_TPM", "0")),
+                    max_retries=int(os.getenv("LLM_MAX_RETRIES", "5")),
+                )
+    return _gate
+
+
+class LoopLocalAsyncClient(httpx.AsyncClient):
+    """
+    The async client given to the process-wide LLM clients. An AsyncClient's
+    connection pool belongs to the event loop that opened it, so requests are
+    sent through one pooled client per running loop (the server's, or a CLI
+    run's asyncio.run()), each created on first use with the same settings.
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._settings = kwargs
+        self._loop_clients = weakref.WeakKeyDictionary()
+        self._loop_clients_lock = threading.Lock()
+
+    async def send(self, request, **kwargs):
+        return await self.for_running_loop().send(request, **kwargs)
+
+    def for_running_loop(self):
+        loop = asyncio.get_running_loop()
+        with self._loop_clients_lock:
+            client = self._loop_clients.get(loop)
+            if client is None or client.is_closed:
+                client = self._loop_clients[loop] = httpx.AsyncClient(**self._settings)
+        return client
+
+    async def aclose(self):
+        """Close the running loop's connections; other loops keep theirs."""
+        with self._loop_clients_lock:
+            client = self._loop_clients.pop(asyncio.get_running_loop(), None)
+        if client is not None:
+            await client.aclose()
+
+
+def get_http_clients():
+    """
+    One pooled keep-alive HTTP client pair (sync, async) for every LLM client in
+    the process. The async one keeps a separate pool per event loop.
+    """
+    global _http_clients
+    if _http_clients is None:
+        with _registry_lock:
+            if _http_clients is None:
+                connections = int(os.getenv("LLM_MAX_CONNECTIONS", "32"))
+                limits = httpx.Limits(max_connections=connections, max_keepalive_connections=connections)
+                timeout = httpx.Timeout(float(os.getenv("LLM_TIMEOUT_SECONDS", "60")), connect=10.0)
+                _http_clients = (
+                    httpx.Client(limits=limits, timeout=timeout),
+                    LoopLocalAsyncClient(limits=limits, timeout=timeout),
+                )
+    return _http_clients
+
+
+async def aclose_http_clients():
+    """Close the running loop's LLM connections, e.g. when the app shuts down."""
+    if _http_clients is not None:
+        await _http_clients[1].aclose()
@@ -0,0 +1,202 @@
+"""
+ONNX Runtime embedding backend for e5-base-v2 on CPU.
+
+Pools like the sentence-transformers path (mean over the attention mask,
+then L2 normalisation), and by default adds the "query: " / "passage: "
+prefixes e5 was trained with. The vectors therefore differ from the
+huggingface backend's, and the index manifest records the embedding
+identity, so switching backends rebuilds indexes instead of mixing vectors.
+Select it with EMBEDDING_BACKEND=onnx.
+
+Prepare the model directory once (needs network, and optimum for an export):
+
+    python -m utils.onnx_embeddings prepare --output models/e5-base-v2 [--quantize]
+"""
+import argparse
+import os
+import threading
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+DEFAULT_MODEL_NAME = "intfloat/e5-base-v2"
+DEFAULT_MODEL_DIR = "models/e5-base-v2"
+MODEL_FILE = "model.onnx"
+QUANTIZED_MODEL_FILE = "model.int8.onnx"
+TOKENIZER_FILE = "tokenizer.json"
+
+
+class OnnxE5Embeddings(Embeddings):
+    """
+    e5 encoder run through onnxruntime. Texts are tokenized with the fast
+    `tokenizers` library, sorted by length so each batch pads as little as
+    possible, and run `batch_size` at a time on the CPU execution provider.
+    With `quantize=True` an int8 dynamically quantized copy of the model is
+    created next to the original (once) and used instead.
+    """
+
+    def __init__(self, model_dir=DEFAULT_MODEL_DIR, batch_size=32, max_length=512,
+                 intra_op_threads=0, quantize=False, query_prefix="query: ", passage_prefix="passage: "):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        self.model_dir = model_dir
+        self.batch_size = batch_size
+        self.query_prefix = query_prefix
+        self.passage_prefix = passage_prefix
+
+        model_path = os.path.join(model_dir, MODEL_FILE)
+        if not os.path.exists(model_path):
+            raise FileNotFoundError(
+                f"No ONNX model at {model_path}; run: python -m utils.onnx_embeddings prepare --output {model_dir}"
+            )
+        if quantize:
+            model_path = quantize_model(model_dir)
+
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, TOKENIZER_FILE))
+        self.tokenizer.enable_truncation(max_length=max_length)
+        pad_id = self.tokenizer.token_to_id("[PAD]") or 0
+        self.tokenizer.enable_padding(pad_id=pad_id, pad_token="[PAD]")
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        # 0 lets onnxruntime use every physical core
+        options.intra_op_num_threads = intra_op_threads
+        options.inter_op_num_threads = 1
+        self.session = ort.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        self.model_path = model_path
+        self._input_names = {node.name for node in self.session.get_inputs()}
+
+    @staticmethod
+    def settings_from_env():
+        return {
+            "model_dir": os.getenv("ONNX_MODEL_DIR", DEFAULT_MODEL_DIR),
+            "batch_size": int(os.getenv("ONNX_BATCH_SIZE", "32")),
+            "max_length": int(os.getenv("EMBEDDING_MAX_LENGTH", "512")),
+            "intra_op_threads": int(os.getenv("ONNX_THREADS", "0")),
+            "quantize": os.getenv("ONNX_QUANTIZE", "0") == "1",
+            "query_prefix": os.getenv("EMBEDDING_QUERY_PREFIX", "query: "),
+            "passage_prefix": os.getenv("EMBEDDING_PASSAGE_PREFIX", "passage: "),
+        }
+
+    @classmethod
+    def from_env(cls):
+        return cls(**cls.settings_from_env())
+
+    @classmethod
+    def identity_from_env(cls):
+        """What the vectors depend on: model, quantization and prefixes (not batching or threads)."""
+        settings = cls.settings_from_env()
+        return "onnx:{}{}|query={!r}|passage={!r}".format(
+            os.path.basename(os.path.normpath(settings["model_dir"])),
+            ":int8" if settings["quantize"] else "",
+            settings["query_prefix"],
+            settings["passage_prefix"],
+        )
+
+    def embed_documents(self, texts):
+        return self._embed([self.passage_prefix + text for text in texts]).tolist()
+
+    def embed_queries(self, texts):
+        return self._embed([self.query_prefix + text for text in texts]).tolist()
+
+    def embed_query(self, text):
+        return self.embed_queries([text])[0]
+
+    def _embed(self, texts):
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+
+        # Longest first, so padding within a batch is minimal; restored below
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]), reverse=True)
+        vectors = [None] * len(texts)
+        for start in range(0, len(order), self.batch_size):
+            batch = order[start:start + self.batch_size]
+            for i, vector in zip(batch, self._run([texts[i] for i in batch])):
+                vectors[i] = vector
+        return np.stack(vectors)
+
+    def _run(self, texts):
+        encodings = self.tokenizer.encode_batch(texts)
+        input_ids = np.array([e.ids for e in encodings], dtype=np.int64)
+        attention_mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+
+        feeds = {"input_ids": input_ids, "attention_mask": attention_mask}
+        if "token_type_ids" in self._input_names:
+            feeds["token_type_ids"] = np.array([e.type_ids for e in encodings], dtype=np.int64)
+
+        hidden = self.session.run(None, feeds)[0]
+        return mean_pool(hidden, attention_mask)
+
+
+def mean_pool(hidden, attention_mask):
+    """Average token vectors over the attention mask, then L2-normalise (as e5 expects)."""
+    mask = attention_mask[..., None].astype(np.float32)
+    summed = (hidden * mask).sum(axis=1)
+    pooled = summed / np.clip(mask.sum(axis=1), 1e-9, None)
+    norms = np.linalg.norm(pooled, axis=1, keepdims=True)
+    return (pooled / np.clip(norms, 1e-12, None)).astype(np.float32)
+
+
+_quantize_lock = threading.Lock()
+
+
+def quantize_model(model_dir):
+    """int8 dynamic quantization of model.onnx; done once, the result is reused."""
+    source = os.path.join(model_dir, MODEL_FILE)
+    target = os.path.join(model_dir, QUANTIZED_MODEL_FILE)
+    with _quantize_lock:
+        if os.path.exists(target) and os.path.getmtime(target) >= os.path.getmtime(source):
+            return target
+        try:
+            from onnxruntime.quantization import QuantType, quantize_dynamic
+        except ImportError as err:
+            raise RuntimeError(f"int8 quantization needs the 'onnx' package: {err}") from err
+
+        print(f"Quantizing {source} to int8...")
+        tmp = target + ".tmp"
+        quantize_dynamic(source, tmp, weight_type=QuantType.QInt8)
+        os.replace(tmp, target)
+    return target
+
+
+def prepare_model(output_dir, model_name=DEFAULT_MODEL_NAME):
+    """
+    Put model.onnx and tokenizer.json for `model_name` into `output_dir`.
+    Exports with optimum when it is installed, otherwise downloads the ONNX
+    file published in the model repository.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    try:
+        from optimum.exporters.onnx import main_export
+    except ImportError:
+        main_export = None
+
+    if main_export is not None:
+        main_export(model_name, output=output_dir, task="feature-extraction")
+    else:
+        import shutil
+        from huggingface_hub import hf_hub_download
+
+        for remote, local in (("onnx/model.onnx", MODEL_FILE), (TOKENIZER_FILE, TOKENIZER_FILE)):
+            shutil.copyfile(hf_hub_download(model_name, remote), os.path.join(output_dir, local))
+    return output_dir
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Prepare the ONNX e5 embedding model.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    prepare = commands.add_parser("prepare", help="export or download model.onnx and tokenizer.json")
+    prepare.add_argument("--model", default=DEFAULT_MODEL_NAME)
+    prepare.add_argument("--output", default=DEFAULT_MODEL_DIR)
+    prepare.add_argument("--quantize", action="store_true", help="also write the int8 model")
+    args = parser.parse_args(argv)
+
+    prepare_model(args.output, args.model)
+    if args.quantize:
+        quantize_model(args.output)
+    print(f"ONNX model ready in {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,63 @@
 from dotenv import load_dotenv
 import os
-from langchain_openai import ChatOpenAI
+import threading
+from utils.telemetry import llm_usage_callback
+
+_llms = {}
+_llms_lock = threading.Lock()
+_env_loaded = False
+
 
 def get_openai_llm():
-    load_dotenv()
+    """
+    Process-wide LLM client registry: every agent of every session shares one
+    client per model, so connections are pooled and kept alive across sessions
+    and all calls go through the same concurrency and rate limits.
+    """
+    global _env_loaded
+    if not _env_loaded:
+        load_dotenv()
+        _env_loaded = True
+
+    backend = os.getenv("LLM_BACKEND", "openai")
     model = os.getenv("OPENAI_MODEL", "gpt-3.5-turbo")
+    key = (backend, model)
+
+    llm = _llms.get(key)
+    if llm is None:
+        with _llms_lock:
+            llm = _llms.get(key)
+            if llm is None:
+                llm = _llms[key] = _create_llm(backend, model)
+    return llm
+
+
+def _create_llm(backend, model):
+    # Offline stand-in for benchmarks and local runs; no API key needed
+    if backend == "fake":
+        from utils.fake_models import FakeChatModel
+        return FakeChatModel(
+            latency_ms=float(os.getenv("FAKE_LLM_LATENCY_MS", "200")),
+            tokens_per_second=float(os.getenv("FAKE_LLM_TOKENS_PER_SECOND", "50")),
+            callbacks=[llm_usage_callback]
+        )
+
+    from utils.llm_client import PooledChatOpenAI, get_http_clients
+
     api_key = os.getenv("OPENAI_API_KEY")
 
     if not api_key:
         raise ValueError("Missing OPENAI_API_KEY in .env")
 
     os.environ["OPENAI_API_KEY"] = api_key
-    return ChatOpenAI(model=model)
\ No newline at end of file
+    http_client, http_async_client = get_http_clients()
+    # Usage callback attributes token counts to the calling stage; stream_usage keeps counts for astream.
+    # Retries are done by the shared gate (coordinated, Retry-After aware), not per client.
+    return PooledChatOpenAI(
+        model=model,
+        callbacks=[llm_usage_callback],
+        stream_usage=True,
+        max_retries=0,
+        http_client=http_client,
+        http_async_client=http_async_client
+    )
@@ -1,6 +1,137 @@
-from langchain_community.document_loaders import PyPDFLoader
+import json
+import multiprocessing
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from filelock import FileLock
+from langchain_core.documents import Document
+from pypdf import PdfReader
+
+from utils.index_registry import file_sha256
+from utils.telemetry import record_cache, traced
+
+PDF_CACHE_DIR = os.getenv("PDF_TEXT_CACHE_DIR", "state/pdf_text")
+# Below this many pages process start-up costs more than it saves
+PARALLEL_PAGE_THRESHOLD = int(os.getenv("PDF_PARALLEL_PAGE_THRESHOLD", "64"))
+PARSE_WORKERS = min(os.cpu_count() or 1, 8)
+MEMO_SIZE = 32
+
+# content hash -> list of page texts, for files parsed recently in this process
+_memo = OrderedDict()
+_memo_lock = threading.Lock()
+
 
 def load_pdf_text(path):
-    loader = PyPDFLoader(path)
-    pages = loader.load()
-    return "\n".join([p.page_content for p in pages])
\ No newline at end of file
+    return "\n".join(load_pdf_pages(path))
+
+
+def load_pdf_documents(path):
+    """One Document per page, shaped like PyPDFLoader output."""
+    pages = load_pdf_pages(path)
+    return [
+        Document(page_content=text, metadata={"source": path, "page": i, "total_pages": len(pages)})
+        for i, text in enumerate(pages)
+    ]
+
+
+@traced("pdf_loader.load_pdf_pages")
+def load_pdf_pages(path):
+    """
+    Page texts of a PDF, parsed at most once per file content. Results are
+    cached in memory and on disk under PDF_CACHE_DIR keyed by the file's
+    sha256, so every agent (and every worker) reads the same extraction.
+    """
+    digest = file_sha256(path)
+
+    with _memo_lock:
+        if digest in _memo:
+            _memo.move_to_end(digest)
+            record_cache("pdf_text", True)
+            return _memo[digest]
+
+    os.makedirs(PDF_CACHE_DIR, exist_ok=True)
+    cache_path = os.path.join(PDF_CACHE_DIR, f"{digest}.json")
+
+    pages = _read_cache(cache_path)
+    record_cache("pdf_text", pages is not None)
+    if pages is None:
+        # Concurrent callers for the same file wait here and then hit the cache
+        with FileLock(f"{cache_path}.lock"):
+            pages = _read_cache(cache_path)
+            if pages is None:
+                pages = _extract_pages(path)
+                tmp_path = f"{cache_path}.tmp"
+                with open(tmp_path, "w") as f:
+                    json.dump(pages, f)
+                os.replace(tmp_path, cache_path)
+
+    with _memo_lock:
+        _memo[digest] = pages
+        while len(_memo) > MEMO_SIZE:
+            _memo.popitem(last=False)
+    return pages
+
+
+def _read_cache(cache_path):
+    if not os.path.exists(cache_path):
+        return None
+    try:
+        with open(cache_path, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _extract_pages(path):
+    page_count = len(PdfReader(path).pages)
+    if page_count < PARALLEL_PAGE_THRESHOLD:
+        return _extract_range(path, 0, page_count)
+
+    step = -(-page_count // PARSE_WORKERS)
+    ranges = [(start, min(start + step, page_count)) for start in range(0, page_count, step)]
+
+    pool = _get_parse_pool()
+    try:
+        parts = list(pool.map(_extract_range, [path] * len(ranges), *zip(*ranges)))
+    except BrokenProcessPool:
+        # A worker died (out of memory, killed); the next large PDF gets a fresh pool
+        _discard_parse_pool(pool)
+        raise
+    return [text for part in parts for text in part]
+
+
+_parse_pool = None
+_parse_pool_lock = threading.Lock()
+
+
+def _get_parse_pool():
+    """
+    One page-parsing process pool per process, started on first use. Workers
+    are spawned rather than forked: the server already runs threads (ingestion
+    pool, embedding batcher) whose locks a forked child could inherit held.
+    """
+    global _parse_pool
+    if _parse_pool is None:
+        with _parse_pool_lock:
+            if _parse_pool is None:
+                _parse_pool = ProcessPoolExecutor(
+                    max_workers=PARSE_WORKERS, mp_context=multiprocessing.get_context("spawn")
+                )
+    return _parse_pool
+
+
+def _discard_parse_pool(pool):
+    global _parse_pool
+    with _parse_pool_lock:
+        if _parse_pool is pool:
+            _parse_pool = None
+    pool.shutdown(wait=False)
+
+
+def _extract_range(path, start, end):
+    # Runs in worker processes; each opens its own reader
+    reader = PdfReader(path)
+    return [reader.pages[i].extract_text() or "" for i in range(start, end)]
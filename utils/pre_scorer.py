@@ -0,0 +1,186 @@
+import os
+import re
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from utils.embedding_service import get_embedding_service
+from utils.evaluation_cache import NEGATIONS, answer_words, critical_terms, normalize_answer
+from utils.telemetry import PRESCORE_DECISIONS
+
+ACCEPT = "accept"
+REJECT = "reject"
+AMBIGUOUS = "ambiguous"
+
+# Shown instead of LLM feedback; the session skips the reflection call for local accepts
+ACCEPT_FEEDBACK = "Your answer covers the key points of the reference answer."
+REJECT_FEEDBACK = "Your answer does not address the question."
+EMPTY_FEEDBACK = "Your answer is empty or does not contain any content to grade."
+
+_STOPWORDS = frozenset(
+    "a an and are as at be by for from has have in is it its of on or that the this to was were "
+    "which with what who when where why how i you he she they we".split()
+)
+_SENTENCE_END = re.compile(r"[.!?:;]\s+")
+_WORD = re.compile(r"[^\W\d_][\w'’-]*")
+
+
+class PreScore:
+    __slots__ = ("decision", "accuracy", "feedback", "cosine", "coverage")
+
+    def __init__(self, decision, accuracy=None, feedback=None, cosine=None, coverage=None):
+        self.decision = decision
+        self.accuracy = accuracy
+        self.feedback = feedback
+        self.cosine = cosine
+        self.coverage = coverage
+
+    def as_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+def is_local_feedback(feedback):
+    """True if the feedback came from the pre-scorer rather than the LLM."""
+    return feedback.startswith((ACCEPT_FEEDBACK, REJECT_FEEDBACK, EMPTY_FEEDBACK))
+
+
+def key_terms(text):
+    """Content words of an answer. Negations and numbers are kept, however short."""
+    return {
+        word for word in answer_words(text)
+        if word not in _STOPWORDS and (len(word) > 1 or word.isdigit())
+    } | critical_terms(text)
+
+
+def entity_terms(text):
+    """Names and acronyms: capitalised words that do not start a sentence, and all-caps words."""
+    terms = set()
+    for sentence in _SENTENCE_END.split(text or ""):
+        for position, word in enumerate(_WORD.findall(sentence)):
+            if (position > 0 and word[0].isupper()) or (len(word) > 1 and word.isupper()):
+                terms.update(normalize_answer(word).split())
+    return terms - _STOPWORDS
+
+
+def conflicting_terms(user_answer, reference_answer):
+    """
+    Terms that rule out a local accept, however similar the texts: numbers and
+    names of the reference the answer leaves out, and negations on one side only.
+    """
+    reference_critical = critical_terms(reference_answer)
+    answer_critical = critical_terms(user_answer)
+    required = {term for term in reference_critical if term not in NEGATIONS} | entity_terms(reference_answer)
+    return (required - set(answer_words(user_answer))) | ((reference_critical ^ answer_critical) & NEGATIONS)
+
+
+class PreScorer:
+    """
+    Grades clear-cut answers locally so only ambiguous ones pay for an LLM call.
+    Two signals compare the answer to the reference answer: cosine similarity
+    of their embeddings (the already loaded e5 model) and coverage, the share
+    of the reference's key terms that appear in the answer.
+
+    - accept: cosine >= accept_cosine and coverage >= accept_coverage, and
+      the answer has every number and name of the reference and the same
+      negations (conflicting_terms)
+    - reject: no key terms at all, or cosine < reject_cosine and coverage <= reject_coverage
+    - anything else is ambiguous and goes to the LLM
+
+    Thresholds depend on the embedding model; check them with
+    `python -m benchmarks.calibrate_prescorer` before changing them. The
+    process-wide scorer is off unless PRESCORE_ENABLED=1.
+    """
+
+    def __init__(self, embedding, accept_cosine=0.95, accept_coverage=0.8,
+                 reject_cosine=0.75, reject_coverage=0.1, enabled=True, cache_size=1024):
+        self.embedding = embedding
+        self.accept_cosine = accept_cosine
+        self.accept_coverage = accept_coverage
+        self.reject_cosine = reject_cosine
+        self.reject_coverage = reject_coverage
+        self.enabled = enabled
+        self.cache_size = cache_size
+        # Reference answers are scored against many times; keep their vectors
+        self._reference_vectors = OrderedDict()
+        self._lock = threading.Lock()
+
+    def score(self, user_answer, reference_answer):
+        if not self.enabled or not reference_answer.strip():
+            return PreScore(AMBIGUOUS)
+
+        reference_terms = key_terms(reference_answer)
+        answer_terms = key_terms(user_answer)
+
+        if not answer_terms:
+            result = PreScore(
+                REJECT, accuracy=0, cosine=0.0, coverage=0.0,
+                feedback=EMPTY_FEEDBACK
+            )
+        else:
+            coverage = len(reference_terms & answer_terms) / len(reference_terms) if reference_terms else 0.0
+            cosine = self._cosine(user_answer, reference_answer)
+            conflicts = conflicting_terms(user_answer, reference_answer)
+            result = self.decide(cosine, coverage, reference_terms - answer_terms, conflicts)
+
+        PRESCORE_DECISIONS.inc(decision=result.decision)
+        return result
+
+    def decide(self, cosine, coverage, missing_terms, conflicts=()):
+        """Decision for already computed signals (also used by the calibration sweep)."""
+        cosine, coverage = round(cosine, 4), round(coverage, 4)
+
+        if cosine >= self.accept_cosine and coverage >= self.accept_coverage and not conflicts:
+            accuracy = min(100, max(85, round(100 * coverage)))
+            return PreScore(ACCEPT, accuracy, ACCEPT_FEEDBACK, cosine, coverage)
+
+        if cosine < self.reject_cosine and coverage <= self.reject_coverage:
+            missing = ", ".join(sorted(missing_terms)[:5])
+            feedback = REJECT_FEEDBACK
+            if missing:
+                feedback += f" Key points to cover include: {missing}."
+            return PreScore(REJECT, min(20, round(100 * coverage)), feedback, cosine, coverage)
+
+        return PreScore(AMBIGUOUS, cosine=cosine, coverage=coverage)
+
+    def _cosine(self, user_answer, reference_answer):
+        with self._lock:
+            reference_vector = self._reference_vectors.get(reference_answer)
+            if reference_vector is not None:
+                self._reference_vectors.move_to_end(reference_answer)
+
+        if reference_vector is None:
+            # Both sides embedded as queries, so a cached reference vector matches a fresh one
+            reference_vector, answer_vector = np.asarray(
+                self.embedding.embed_queries([reference_answer, user_answer]), dtype=np.float32
+            )
+            with self._lock:
+                self._reference_vectors[reference_answer] = reference_vector
+                while len(self._reference_vectors) > self.cache_size:
+                    self._reference_vectors.popitem(last=False)
+        else:
+            answer_vector = np.asarray(self.embedding.embed_query(user_answer), dtype=np.float32)
+
+        denominator = float(np.linalg.norm(reference_vector) * np.linalg.norm(answer_vector))
+        return float(reference_vector @ answer_vector) / denominator if denominator else 0.0
+
+
+_pre_scorer = None
+_pre_scorer_lock = threading.Lock()
+
+
+def get_pre_scorer():
+    """Process-wide pre-scorer, configured from PRESCORE_* environment variables."""
+    global _pre_scorer
+    if _pre_scorer is None:
+        with _pre_scorer_lock:
+            if _pre_scorer is None:
+                _pre_scorer = PreScorer(
+                    embedding=get_embedding_service(),
+                    accept_cosine=float(os.getenv("PRESCORE_ACCEPT_COSINE", "0.95")),
+                    accept_coverage=float(os.getenv("PRESCORE_ACCEPT_COVERAGE", "0.8")),
+                    reject_cosine=float(os.getenv("PRESCORE_REJECT_COSINE", "0.75")),
+                    reject_coverage=float(os.getenv("PRESCORE_REJECT_COVERAGE", "0.1")),
+                    enabled=os.getenv("PRESCORE_ENABLED", "0") == "1",
+                )
+    return _pre_scorer
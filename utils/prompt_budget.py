@@ -0,0 +1,131 @@
+import os
+import threading
+
+import tiktoken
+
+from utils.telemetry import PROMPT_CONTEXT_TOKENS
+
+# Longest chunk overlap we look for; the splitter uses chunk_overlap=50
+MAX_OVERLAP_CHARS = 200
+MIN_OVERLAP_CHARS = 20
+
+
+class PromptAssembler:
+    """
+    Fits the notes context and retrieved chunks of a prompt into a token
+    budget. Spans repeated between chunks (from the splitter's overlap) and
+    duplicate chunks are removed first, then notes and chunks are trimmed
+    to the budget, notes capped at `notes_share` of it.
+    """
+
+    def __init__(self, model="gpt-3.5-turbo", max_context_tokens=1500, notes_share=0.3):
+        self.max_context_tokens = max_context_tokens
+        self.notes_share = notes_share
+        self.encoding = _load_encoding(model)
+
+    def count(self, text):
+        return len(self.encoding.encode(text or ""))
+
+    def truncate(self, text, max_tokens):
+        tokens = self.encoding.encode(text or "")
+        if len(tokens) <= max_tokens:
+            return text
+        return self.encoding.decode(tokens[:max(max_tokens, 0)])
+
+    def dedupe_chunks(self, chunks):
+        kept = []
+        for chunk in chunks:
+            chunk = chunk.strip()
+            if not chunk or any(chunk in other for other in kept):
+                continue
+            for other in kept:
+                # other ... | overlap | ... chunk  -> drop the overlap from chunk's head
+                overlap = _overlap(other, chunk)
+                if overlap:
+                    chunk = chunk[overlap:].lstrip()
+                    continue
+                # chunk ... | overlap | ... other  -> drop it from chunk's tail
+                overlap = _overlap(chunk, other)
+                if overlap:
+                    chunk = chunk[:-overlap].rstrip()
+            if chunk:
+                kept.append(chunk)
+        return kept
+
+    def fit(self, notes_context, chunks, label="prompt"):
+        """
+        Returns (notes_context, similar_context) trimmed to the budget.
+        `chunks` may be a list of texts or an already joined string.
+        """
+        if isinstance(chunks, str):
+            chunks = [chunks]
+        chunks = list(chunks)
+        before = self.count(notes_context) + self.count("\n\n".join(chunks))
+
+        notes_budget = int(self.max_context_tokens * self.notes_share)
+        notes_context = self.truncate(notes_context, notes_budget)
+        remaining = self.max_context_tokens - self.count(notes_context)
+
+        fitted = []
+        for chunk in self.dedupe_chunks(chunks):
+            if remaining <= 0:
+                break
+            tokens = self.count(chunk)
+            if tokens > remaining:
+                chunk = self.truncate(chunk, remaining)
+                tokens = remaining
+            fitted.append(chunk)
+            remaining -= tokens
+
+        similar_context = "\n\n".join(fitted)
+        after = self.count(notes_context) + self.count(similar_context)
+        PROMPT_CONTEXT_TOKENS.inc(before, prompt=label, stage="before")
+        PROMPT_CONTEXT_TOKENS.inc(after, prompt=label, stage="after")
+        return notes_context, similar_context
+
+
+class _ApproxEncoding:
+    """~4 characters per token; used when the tiktoken vocabulary cannot be loaded (offline)."""
+
+    def encode(self, text):
+        return [text[i:i + 4] for i in range(0, len(text), 4)]
+
+    def decode(self, tokens):
+        return "".join(tokens)
+
+
+def _load_encoding(model):
+    try:
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding("cl100k_base")
+    except Exception as err:
+        print(f"tiktoken encoding unavailable ({err}); approximating token counts")
+        return _ApproxEncoding()
+
+
+def _overlap(first, second):
+    """Length of the longest suffix of `first` that is also a prefix of `second`."""
+    longest = min(len(first), len(second), MAX_OVERLAP_CHARS)
+    for size in range(longest, MIN_OVERLAP_CHARS - 1, -1):
+        if first.endswith(second[:size]):
+            return size
+    return 0
+
+
+_assembler = None
+_assembler_lock = threading.Lock()
+
+
+def get_prompt_assembler():
+    global _assembler
+    if _assembler is None:
+        with _assembler_lock:
+            if _assembler is None:
+                _assembler = PromptAssembler(
+                    model=os.getenv("OPENAI_MODEL", "gpt-3.5-turbo"),
+                    max_context_tokens=int(os.getenv("PROMPT_CONTEXT_TOKEN_BUDGET", "1500")),
+                    notes_share=float(os.getenv("PROMPT_NOTES_SHARE", "0.3")),
+                )
+    return _assembler
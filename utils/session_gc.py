@@ -0,0 +1,336 @@
+import os
+import threading
+import time
+import uuid
+
+from utils import index_registry
+
+TRASH_NAME = ".trash"
+
+
+def move_to_trash(path):
+    """
+    Rename `path` into <parent>/.trash/ for the GC to delete later. A rename on
+    the same filesystem, so it is instant whatever the size. Returns the new
+    path, or None if there was nothing to move.
+    """
+    if not os.path.lexists(path):
+        return None
+    trash = os.path.join(os.path.dirname(os.path.abspath(path)), TRASH_NAME)
+    os.makedirs(trash, exist_ok=True)
+    target = os.path.join(trash, f"{os.path.basename(path)}-{uuid.uuid4().hex[:8]}")
+    try:
+        os.rename(path, target)
+    except FileNotFoundError:
+        return None
+    return target
+
+
+def tree_size(path, seen=None):
+    """Bytes and file count under path. Hard links are counted once per `seen` set."""
+    seen = set() if seen is None else seen
+    total = files = 0
+    if os.path.isfile(path):
+        paths = [path]
+    else:
+        paths = (os.path.join(root, name) for root, _, names in os.walk(path) for name in names)
+    for file_path in paths:
+        try:
+            st = os.lstat(file_path)
+        except FileNotFoundError:
+            continue
+        if (st.st_dev, st.st_ino) in seen:
+            continue
+        seen.add((st.st_dev, st.st_ino))
+        total += st.st_size
+        files += 1
+    return total, files
+
+
+class IOThrottle:
+    """Paces deletions to at most bytes_per_second and files_per_second (0 means no limit)."""
+
+    def __init__(self, bytes_per_second, files_per_second, stop_event):
+        self.bytes_per_second = bytes_per_second
+        self.files_per_second = files_per_second
+        self.stop_event = stop_event
+        self._started = time.monotonic()
+        self._budget = 0.0
+
+    def spend(self, nbytes):
+        if self.bytes_per_second:
+            self._budget += nbytes / self.bytes_per_second
+        if self.files_per_second:
+            self._budget += 1 / self.files_per_second
+        wait = self._started + self._budget - time.monotonic()
+        if wait > 0:
+            self.stop_event.wait(wait)
+
+
+class SessionGC:
+    """
+    Lifecycle of sessions' on-disk data.
+
+    retire() makes a session unusable at once: its rows leave the session
+    store and its directories are renamed into .trash. collect() is one
+    background pass that:
+
+    - retires sessions past their expiry, or idle longer than idle_ttl_seconds
+    - deletes trash, paced by IOThrottle so the disk keeps serving requests
+    - removes shared artifacts no session references any more: blobs, notes
+      indexes, parsed PDF text and extracted artifacts. References are
+      counted from the blob store's per-session refs. Anything newer than
+      grace_seconds is left alone, as an upload may be about to reference it.
+    """
+
+    def __init__(self, session_store, blob_store, index_path, upload_dir="data", index_dir="chroma_db",
+                 batch_dir="state/batch", pdf_cache_dir="state/pdf_text", artifact_cache=None,
+                 idle_ttl_seconds=0, grace_seconds=3600, bytes_per_second=0, files_per_second=0,
+                 max_sessions_per_pass=50):
+        self.session_store = session_store
+        self.blob_store = blob_store
+        # session_id -> the vector index directory the session uses
+        self.index_path = index_path
+        self.upload_dir = upload_dir
+        self.index_dir = index_dir
+        self.batch_dir = batch_dir
+        self.pdf_cache_dir = pdf_cache_dir
+        self.artifact_cache = artifact_cache
+        self.idle_ttl_seconds = idle_ttl_seconds
+        self.grace_seconds = grace_seconds
+        self.bytes_per_second = bytes_per_second
+        self.files_per_second = files_per_second
+        self.max_sessions_per_pass = max_sessions_per_pass
+
+        self._stop = threading.Event()
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            "passes": 0,
+            "sessions_retired": 0,
+            "files_removed": 0,
+            "bytes_removed": 0,
+            "last_pass_at": None,
+            "last_pass_seconds": None,
+        }
+
+    # ---- per session ----
+
+    def retire(self, session_id):
+        """Delete a session now; its files are queued in .trash for the next pass."""
+        self.session_store.delete_session(session_id)
+        self.blob_store.delete_refs(session_id)
+        for root in (self.upload_dir, self.index_dir, self.batch_dir):
+            move_to_trash(os.path.join(root, session_id))
+        self._count(sessions_retired=1)
+
+    def trash_everything(self):
+        """
+        Queue all sessions' files for deletion (the store must be cleared
+        separately). The blob store's temp directory stays: uploads still
+        being received write there and commit from it. Leftovers of dead
+        uploads are removed by collect() once past the grace period.
+        """
+        uploading = os.path.abspath(self.blob_store.tmp_dir)
+        for root in self._roots():
+            if os.path.isdir(root):
+                for name in os.listdir(root):
+                    path = os.path.join(root, name)
+                    if name != TRASH_NAME and os.path.abspath(path) != uploading:
+                        move_to_trash(path)
+
+    def usage(self, session_id):
+        """Disk used by one session; shared files and indexes are also split by their number of users."""
+        refcounts = self.blob_store.refcounts()
+        refs = self.blob_store.refs(session_id)
+        seen = set()
+
+        files = {}
+        for name, digest in refs.items():
+            size, _ = tree_size(self.blob_store.path(digest), seen)
+            files[name] = {"sha256": digest, "bytes": size, "shared_by": max(1, refcounts.get(digest, 0))}
+
+        index_path = self.index_path(session_id)
+        notes_digest = refs.get("notes")
+        index_users = sum(
+            1 for other in self.blob_store.sessions() if self.blob_store.refs(other).get("notes") == notes_digest
+        ) if notes_digest else 1
+        index_bytes, _ = tree_size(index_path, seen) if os.path.isdir(index_path) else (0, 0)
+        batch_bytes, _ = tree_size(os.path.join(self.batch_dir, session_id), seen)
+
+        total = sum(file["bytes"] for file in files.values()) + index_bytes + batch_bytes
+        attributed = (
+            sum(file["bytes"] / file["shared_by"] for file in files.values())
+            + index_bytes / max(1, index_users) + batch_bytes
+        )
+        return {
+            "session_id": session_id,
+            "lifecycle": self.session_store.load_session(session_id),
+            "files": files,
+            "index": {"path": index_path, "bytes": index_bytes, "shared_by": max(1, index_users)},
+            "batch_bytes": batch_bytes,
+            "total_bytes": total,
+            "attributed_bytes": round(attributed),
+        }
+
+    def disk_usage(self):
+        """Totals per storage area; every file is counted once, however many hard links it has."""
+        seen = set()
+        areas = {}
+        for name, root in (
+            ("blobs", self.blob_store.directory), ("uploads", self.upload_dir), ("indexes", self.index_dir),
+            ("batch", self.batch_dir), ("pdf_text", self.pdf_cache_dir),
+            ("artifacts", self.artifact_cache.directory if self.artifact_cache else None),
+        ):
+            if root and os.path.isdir(root):
+                size, files = tree_size(root, seen)
+                areas[name] = {"bytes": size, "files": files}
+        trash = [0, 0]
+        for root in self._roots():
+            size, files = tree_size(os.path.join(root, TRASH_NAME), set())
+            trash[0] += size
+            trash[1] += files
+        return {
+            "areas": areas,
+            "trash": {"bytes": trash[0], "files": trash[1]},
+            "sessions": len(self.blob_store.sessions()),
+            "gc": self.stats(),
+        }
+
+    # ---- background pass ----
+
+    def collect(self):
+        started = time.monotonic()
+        now = time.time()
+        throttle = IOThrottle(self.bytes_per_second, self.files_per_second, self._stop)
+
+        self._adopt_untracked_sessions()
+        idle_cutoff = now - self.idle_ttl_seconds if self.idle_ttl_seconds else None
+        for session_id in self.session_store.expired_sessions(now, idle_cutoff, self.max_sessions_per_pass):
+            print(f"Session {session_id} expired; removing its data")
+            self.retire(session_id)
+
+        for root in self._roots():
+            trash = os.path.join(root, TRASH_NAME)
+            if os.path.isdir(trash):
+                for name in os.listdir(trash):
+                    if self._stop.is_set():
+                        return
+                    self._remove_tree(os.path.join(trash, name), throttle)
+
+        self._sweep_unreferenced(now, throttle)
+
+        with self._stats_lock:
+            self._stats["passes"] += 1
+            self._stats["last_pass_at"] = now
+            self._stats["last_pass_seconds"] = round(time.monotonic() - started, 3)
+
+    def stop(self):
+        """Make a running pass return early (at shutdown)."""
+        self._stop.set()
+
+    def stats(self):
+        with self._stats_lock:
+            return dict(self._stats)
+
+    def _adopt_untracked_sessions(self):
+        # Uploads from before lifecycle tracking: idle time counts from their last change
+        if not os.path.isdir(self.upload_dir):
+            return
+        for session_id in os.listdir(self.upload_dir):
+            path = os.path.join(self.upload_dir, session_id)
+            if session_id.startswith(".") or not os.path.isdir(path):
+                continue
+            if self.session_store.load_session(session_id) is None:
+                self.session_store.touch_session(session_id, at=os.path.getmtime(path))
+
+    def _sweep_unreferenced(self, now, throttle):
+        cutoff = now - self.grace_seconds
+        live = set(self.blob_store.refcounts())
+
+        for digest in list(self.blob_store.blob_digests()):
+            if digest not in live and not self._stop.is_set():
+                path = self.blob_store.path(digest)
+                self._remove_if_older(path, cutoff, throttle)
+                # Fails while the prefix directory still holds other blobs
+                _rmdir(os.path.dirname(path))
+
+        if os.path.isdir(self.blob_store.tmp_dir):
+            # Uploads that died half way
+            for name in os.listdir(self.blob_store.tmp_dir):
+                self._remove_if_older(os.path.join(self.blob_store.tmp_dir, name), cutoff, throttle)
+
+        if os.path.isdir(self.index_dir):
+            live_prefixes = {digest[:24] for digest in live}
+            for name in os.listdir(self.index_dir):
+                if name.startswith("notes-") and name[len("notes-"):] not in live_prefixes:
+                    path = os.path.join(self.index_dir, name)
+                    if os.path.getmtime(path) < cutoff and not self._stop.is_set():
+                        index_registry.forget(path)
+                        trashed = move_to_trash(path)
+                        if trashed:
+                            self._remove_tree(trashed, throttle)
+
+        if os.path.isdir(self.pdf_cache_dir):
+            for name in os.listdir(self.pdf_cache_dir):
+                digest = name.split(".", 1)[0]
+                if digest not in live:
+                    self._remove_if_older(os.path.join(self.pdf_cache_dir, name), cutoff, throttle)
+
+        if self.artifact_cache is not None:
+            stale = {
+                entry["file_sha256"] for entry in self.artifact_cache.entries()
+                if entry["file_sha256"] not in live and entry.get("created_at", 0) < cutoff
+            }
+            if stale:
+                self.artifact_cache.invalidate(file_hashes=stale)
+
+    def _remove_if_older(self, path, cutoff, throttle):
+        try:
+            if os.path.getmtime(path) >= cutoff:
+                return
+        except FileNotFoundError:
+            return
+        self._remove_tree(path, throttle)
+
+    def _remove_tree(self, path, throttle):
+        if os.path.isdir(path) and not os.path.islink(path):
+            for root, dirs, files in os.walk(path, topdown=False):
+                for name in files:
+                    if self._stop.is_set():
+                        return
+                    self._unlink(os.path.join(root, name), throttle)
+                for name in dirs:
+                    dir_path = os.path.join(root, name)
+                    if os.path.islink(dir_path):
+                        self._unlink(dir_path, throttle)
+                    else:
+                        _rmdir(dir_path)
+            _rmdir(path)
+        else:
+            self._unlink(path, throttle)
+
+    def _unlink(self, path, throttle):
+        try:
+            st = os.lstat(path)
+            os.unlink(path)
+        except FileNotFoundError:
+            return
+        # Space only comes back when the last hard link goes
+        freed = st.st_size if st.st_nlink <= 1 else 0
+        self._count(files_removed=1, bytes_removed=freed)
+        throttle.spend(freed)
+
+    def _count(self, **deltas):
+        with self._stats_lock:
+            for name, delta in deltas.items():
+                self._stats[name] += delta
+
+    def _roots(self):
+        return [self.upload_dir, self.index_dir, self.batch_dir, self.blob_store.directory]
+
+
+def _rmdir(path):
+    try:
+        os.rmdir(path)
+    except OSError:
+        pass
@@ -0,0 +1,539 @@
+import abc
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from contextlib import asynccontextmanager, contextmanager
+
+from filelock import FileLock, Timeout
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS user_sessions (
+    session_key TEXT PRIMARY KEY,
+    session_id TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    current_index INTEGER NOT NULL DEFAULT 0,
+    results TEXT NOT NULL DEFAULT '[]',
+    waiting_for_retry INTEGER NOT NULL DEFAULT 0,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_user_sessions_session_id ON user_sessions(session_id);
+CREATE TABLE IF NOT EXISTS session_artifacts (
+    session_id TEXT PRIMARY KEY,
+    questions TEXT NOT NULL,
+    reference_answers TEXT NOT NULL,
+    notes_context TEXT NOT NULL,
+    index_path TEXT,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS ingestion_jobs (
+    session_id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS sessions (
+    session_id TEXT PRIMARY KEY,
+    created_at REAL NOT NULL,
+    last_used_at REAL NOT NULL,
+    expires_at REAL
+);
+"""
+
+
+class SessionBackend(abc.ABC):
+    """
+    Shared persistence for session state and artifacts. Every worker process
+    on a host talks to the same backend, so any worker can serve any request.
+    """
+
+    @abc.abstractmethod
+    def save_state(self, session_key, session_id, user_id, state):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def load_state(self, session_key):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def save_artifacts(self, session_id, artifacts):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def load_artifacts(self, session_id):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def has_artifacts(self, session_id):
+        """True if artifacts are stored for the session; cheaper than loading them."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def delete_artifacts(self, session_id):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def recent_artifacts(self, limit):
+        """(session_id, index_path) of the most recently stored artifacts, newest first."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def merge_reference_answers(self, session_id, reference_answers):
+        """Merge answers into the stored set and return the union."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def save_job_status(self, session_id, status):
+        """Store a job's status, unless a newer job (by created_at) already stored its own."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def load_job_status(self, session_id):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def touch_session(self, session_id, at=None):
+        """Record use of a session (created on first use); idle expiry counts from the last use."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def set_session_expiry(self, session_id, expires_at):
+        """Absolute expiry time (epoch seconds) for a session, or None for none."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def load_session(self, session_id):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def expired_sessions(self, now, idle_cutoff=None, limit=100):
+        """Ids of sessions past their expiry, or unused since idle_cutoff (if given)."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def delete_session(self, session_id):
+        """Remove everything stored for a session: progress, artifacts, job status, lifecycle row."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def lock(self, name):
+        """Cross-process lock (sync context manager) for the given name."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def try_lock(self, name):
+        """Non-blocking acquire; returns a release callable, or None if held elsewhere."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def clear(self):
+        raise NotImplementedError
+
+
+class SQLiteSessionBackend(SessionBackend):
+    """
+    SQLite in WAL mode plus file locks, shareable by processes on one host.
+    Each thread keeps one connection open and reuses it for every call.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._local = threading.local()
+        db_dir = os.path.dirname(db_path) or "."
+        self.lock_dir = os.path.join(db_dir, "locks")
+        os.makedirs(self.lock_dir, exist_ok=True)
+
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(session_artifacts)")}
+            if "index_path" not in columns:
+                conn.execute("ALTER TABLE session_artifacts ADD COLUMN index_path TEXT")
+
+    @contextmanager
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = sqlite3.connect(self.db_path, timeout=30)
+        # One transaction per call: committed on success, rolled back on error
+        with conn:
+            yield conn
+
+    def save_state(self, session_key, session_id, user_id, state):
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO user_sessions "
+                "(session_key, session_id, user_id, current_index, results, waiting_for_retry, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    session_key,
+                    session_id,
+                    user_id,
+                    state["current_index"],
+                    json.dumps(state["results"]),
+                    int(state["waiting_for_retry"]),
+                    time.time(),
+                )
+            )
+
+    def load_state(self, session_key):
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT current_index, results, waiting_for_retry FROM user_sessions WHERE session_key = ?",
+                (session_key,)
+            ).fetchone()
+        if row is None:
+            return None
+        return {
+            "current_index": row[0],
+            "results": json.loads(row[1]),
+            "waiting_for_retry": bool(row[2]),
+        }
+
+    def save_artifacts(self, session_id, artifacts):
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO session_artifacts "
+                "(session_id, questions, reference_answers, notes_context, index_path, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    session_id,
+                    json.dumps(artifacts["questions"]),
+                    _dump_answers(artifacts["reference_answers"]),
+                    artifacts["notes_context"],
+                    artifacts.get("index_path"),
+                    time.time(),
+                )
+            )
+
+    def load_artifacts(self, session_id):
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT questions, reference_answers, notes_context, index_path "
+                "FROM session_artifacts WHERE session_id = ?",
+                (session_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        return {
+            "questions": [(int(number), text) for number, text in json.loads(row[0])],
+            "reference_answers": _load_answers(row[1]),
+            "notes_context": row[2],
+            "index_path": row[3],
+        }
+
+    def has_artifacts(self, session_id):
+        with self._connect() as conn:
+            row = conn.execute("SELECT 1 FROM session_artifacts WHERE session_id = ?", (session_id,)).fetchone()
+        return row is not None
+
+    def delete_artifacts(self, session_id):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM session_artifacts WHERE session_id = ?", (session_id,))
+
+    def recent_artifacts(self, limit):
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT session_id, index_path FROM session_artifacts ORDER BY updated_at DESC LIMIT ?",
+                (limit,)
+            ).fetchall()
+        return [(session_id, index_path) for session_id, index_path in rows]
+
+    def merge_reference_answers(self, session_id, reference_answers):
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT reference_answers FROM session_artifacts WHERE session_id = ?",
+                (session_id,)
+            ).fetchone()
+            if row is None:
+                return dict(reference_answers)
+
+            stored = _load_answers(row[0])
+            merged = {**reference_answers, **stored}
+            if merged != stored:
+                conn.execute(
+                    "UPDATE session_artifacts SET reference_answers = ?, updated_at = ? WHERE session_id = ?",
+                    (_dump_answers(merged), time.time(), session_id)
+                )
+            return merged
+
+    def save_job_status(self, session_id, status):
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO ingestion_jobs (session_id, status, updated_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(session_id) DO UPDATE SET status = excluded.status, updated_at = excluded.updated_at "
+                "WHERE json_extract(excluded.status, '$.created_at') >= "
+                "COALESCE(json_extract(ingestion_jobs.status, '$.created_at'), 0)",
+                (session_id, json.dumps(status), time.time())
+            )
+
+    def load_job_status(self, session_id):
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT status FROM ingestion_jobs WHERE session_id = ?", (session_id,)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def touch_session(self, session_id, at=None):
+        at = at or time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO sessions (session_id, created_at, last_used_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(session_id) DO UPDATE SET last_used_at = MAX(last_used_at, excluded.last_used_at)",
+                (session_id, at, at)
+            )
+
+    def set_session_expiry(self, session_id, expires_at):
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO sessions (session_id, created_at, last_used_at, expires_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(session_id) DO UPDATE SET expires_at = excluded.expires_at",
+                (session_id, now, now, expires_at)
+            )
+
+    def load_session(self, session_id):
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT created_at, last_used_at, expires_at FROM sessions WHERE session_id = ?", (session_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        return {"session_id": session_id, "created_at": row[0], "last_used_at": row[1], "expires_at": row[2]}
+
+    def expired_sessions(self, now, idle_cutoff=None, limit=100):
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT session_id FROM sessions "
+                "WHERE (expires_at IS NOT NULL AND expires_at <= ?) OR (? IS NOT NULL AND last_used_at < ?) "
+                "ORDER BY last_used_at LIMIT ?",
+                (now, idle_cutoff, idle_cutoff, limit)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def delete_session(self, session_id):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM user_sessions WHERE session_id = ?", (session_id,))
+            conn.execute("DELETE FROM session_artifacts WHERE session_id = ?", (session_id,))
+            conn.execute("DELETE FROM ingestion_jobs WHERE session_id = ?", (session_id,))
+            conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+
+    def _file_lock(self, name):
+        # Names come from URLs; hash them into safe file names
+        digest = hashlib.sha1(name.encode("utf-8")).hexdigest()
+        return FileLock(os.path.join(self.lock_dir, f"{digest}.lock"), thread_local=False)
+
+    def lock(self, name):
+        return self._file_lock(name)
+
+    def try_lock(self, name):
+        lock = self._file_lock(name)
+        try:
+            lock.acquire(blocking=False)
+        except Timeout:
+            return None
+        return lock.release
+
+    def clear(self):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM user_sessions")
+            conn.execute("DELETE FROM session_artifacts")
+            conn.execute("DELETE FROM ingestion_jobs")
+            conn.execute("DELETE FROM sessions")
+
+
+BACKENDS = {
+    "sqlite": lambda: SQLiteSessionBackend(os.getenv("SESSION_DB_PATH", "state/sessions.db")),
+}
+
+
+def create_session_backend(name=None):
+    """Backend named by SESSION_BACKEND; register others in BACKENDS."""
+    name = name or os.getenv("SESSION_BACKEND", "sqlite")
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown session backend: {name}")
+    return BACKENDS[name]()
+
+
+class SessionStore:
+    """
+    Bounded in-memory cache of live OrchestratorSession objects in front of a
+    shared SessionBackend holding everything needed to rebuild one without
+    LLM calls: per-user progress (current_index, results, waiting_for_retry)
+    and per-session artifacts (parsed questions, reference answers, notes
+    context, index location).
+
+    Live sessions are evicted LRU-first past `capacity` and after
+    `idle_ttl_seconds` without a request. The backend is the source of
+    truth: a live session is refreshed from it before each request, so
+    other workers' updates are never lost.
+    """
+
+    def __init__(self, backend, capacity=256, idle_ttl_seconds=1800):
+        self.backend = backend
+        self.capacity = capacity
+        self.idle_ttl_seconds = idle_ttl_seconds
+
+        self._sessions = OrderedDict()  # session_key -> (session, last_access)
+        self._lock = threading.Lock()
+        # (event loop, lock name) -> asyncio.Lock held or awaited by this process's alock() callers
+        self._async_locks = weakref.WeakValueDictionary()
+
+    # ---- live sessions ----
+
+    def get(self, session_key):
+        with self._lock:
+            self._evict_idle()
+            item = self._sessions.get(session_key)
+            if item is None:
+                return None
+            self._sessions[session_key] = (item[0], time.monotonic())
+            self._sessions.move_to_end(session_key)
+            return item[0]
+
+    def put(self, session_key, session):
+        with self._lock:
+            self._sessions[session_key] = (session, time.monotonic())
+            self._sessions.move_to_end(session_key)
+            while len(self._sessions) > self.capacity:
+                self._sessions.popitem(last=False)
+            self._evict_idle()
+
+    def discard(self, session_key):
+        with self._lock:
+            self._sessions.pop(session_key, None)
+
+    def _evict_idle(self):
+        cutoff = time.monotonic() - self.idle_ttl_seconds
+        while self._sessions:
+            key, (_, last_access) = next(iter(self._sessions.items()))
+            if last_access >= cutoff:
+                break
+            del self._sessions[key]
+
+    def discard_session(self, session_id):
+        """Drop every user's live session object for session_id."""
+        with self._lock:
+            for key in [key for key, (session, _) in self._sessions.items() if session.session_id == session_id]:
+                del self._sessions[key]
+
+    def live_count(self):
+        with self._lock:
+            return len(self._sessions)
+
+    # ---- shared state ----
+
+    def refresh(self, session_key, session):
+        """
+        Bring a live session up to date with the backend. Returns False if the
+        session's artifacts are gone (cleared by any worker), in which case
+        the live object is discarded and must be rebuilt.
+        """
+        if not self.backend.has_artifacts(session.session_id):
+            self.discard(session_key)
+            return False
+
+        state = self.backend.load_state(session_key)
+        if state:
+            session.restore_state(state)
+        return True
+
+    def save(self, session_key, session):
+        """Persist a user's progress, and share reference answers generated on the fly."""
+        self.backend.save_state(session_key, session.session_id, session.user_id, session.to_state())
+        self.share_reference_answers(session)
+
+    def share_reference_answers(self, session):
+        """Store reference answers the session generated, and pick up ones other workers stored."""
+        agent_answers = session.orchestrator.e_agent.reference_answers
+        agent_answers.update(self.backend.merge_reference_answers(session.session_id, agent_answers))
+
+    def load_state(self, session_key):
+        return self.backend.load_state(session_key)
+
+    def save_artifacts(self, session_id, questions, reference_answers, notes_context, index_path=None):
+        self.backend.save_artifacts(session_id, {
+            "questions": questions,
+            "reference_answers": reference_answers,
+            "notes_context": notes_context,
+            "index_path": index_path,
+        })
+
+    def load_artifacts(self, session_id):
+        return self.backend.load_artifacts(session_id)
+
+    def delete_artifacts(self, session_id):
+        self.backend.delete_artifacts(session_id)
+
+    def recent_artifacts(self, limit):
+        return self.backend.recent_artifacts(limit)
+
+    def save_job_status(self, session_id, status):
+        self.backend.save_job_status(session_id, status)
+
+    def load_job_status(self, session_id):
+        return self.backend.load_job_status(session_id)
+
+    def touch_session(self, session_id, at=None):
+        self.backend.touch_session(session_id, at)
+
+    def set_session_expiry(self, session_id, expires_at):
+        self.backend.set_session_expiry(session_id, expires_at)
+
+    def load_session(self, session_id):
+        return self.backend.load_session(session_id)
+
+    def expired_sessions(self, now, idle_cutoff=None, limit=100):
+        return self.backend.expired_sessions(now, idle_cutoff, limit)
+
+    def delete_session(self, session_id):
+        self.discard_session(session_id)
+        self.backend.delete_session(session_id)
+
+    def lock(self, name):
+        return self.backend.lock(name)
+
+    def try_lock(self, name):
+        return self.backend.try_lock(name)
+
+    @asynccontextmanager
+    async def alock(self, name, poll_interval=0.05):
+        """
+        Async cross-process lock. Callers in this process queue on an
+        asyncio.Lock, so only the one at the head touches the backend lock;
+        it polls only while another worker process holds it.
+        """
+        key = (asyncio.get_running_loop(), name)
+        with self._lock:
+            local = self._async_locks.get(key)
+            if local is None:
+                local = self._async_locks[key] = asyncio.Lock()
+
+        async with local:
+            while True:
+                release = await asyncio.to_thread(self.backend.try_lock, name)
+                if release is not None:
+                    break
+                await asyncio.sleep(poll_interval)
+            try:
+                yield
+            finally:
+                await asyncio.to_thread(release)
+
+    def clear(self):
+        with self._lock:
+            self._sessions.clear()
+        self.backend.clear()
+
+
+def _dump_answers(reference_answers):
+    # JSON object keys are strings; _load_answers turns them back into ints
+    return json.dumps({str(k): v for k, v in reference_answers.items()}, sort_keys=True)
+
+
+def _load_answers(text):
+    return {int(k): v for k, v in json.loads(text).items()}
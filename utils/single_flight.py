@@ -0,0 +1,106 @@
+import asyncio
+import hashlib
+import threading
+from concurrent.futures import Future
+
+
+class SingleFlight:
+    """
+    Collapses concurrent calls for the same key into one execution. The first
+    caller (the leader) runs the work; callers arriving while it is in flight
+    wait on the leader's future and get the same result or exception. Nothing
+    is cached: once the call finishes, the next caller runs it again.
+
+    Works from threads (do) and coroutines (ado) alike, sharing one key space.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._calls = {}
+        self._tasks = set()
+        self._lock = threading.Lock()
+        self._executed = 0
+        self._coalesced = 0
+
+    def do(self, key, fn, *args, **kwargs):
+        future, leader = self._join(key)
+        if not leader:
+            return future.result()
+        self._run(key, future, fn, args, kwargs)
+        return future.result()
+
+    async def ado(self, key, fn, *args, **kwargs):
+        """`fn` is a coroutine function. A cancelled caller never cancels the shared work."""
+        future, leader = self._join(key)
+        if leader:
+            task = asyncio.create_task(self._arun(key, future, fn, args, kwargs))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        return await asyncio.shield(asyncio.wrap_future(future))
+
+    def stats(self):
+        with self._lock:
+            return {
+                "in_flight": len(self._calls),
+                "executed": self._executed,
+                "coalesced": self._coalesced,
+            }
+
+    def _join(self, key):
+        with self._lock:
+            future = self._calls.get(key)
+            if future is not None:
+                self._coalesced += 1
+                return future, False
+            future = self._calls[key] = Future()
+            self._executed += 1
+            return future, True
+
+    def _run(self, key, future, fn, args, kwargs):
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException as err:
+            self._finish(key)
+            future.set_exception(err)
+        else:
+            self._finish(key)
+            future.set_result(result)
+
+    async def _arun(self, key, future, fn, args, kwargs):
+        try:
+            result = await fn(*args, **kwargs)
+        except BaseException as err:
+            self._finish(key)
+            future.set_exception(err)
+        else:
+            self._finish(key)
+            future.set_result(result)
+
+    def _finish(self, key):
+        # Removed before the result is published, so late arrivals start a fresh call
+        with self._lock:
+            self._calls.pop(key, None)
+
+
+# Identical prompts sent to the same model while one is already in flight
+llm_calls = SingleFlight("llm_calls")
+# Session construction, keyed by session id (artifacts) and per-user session key
+session_builds = SingleFlight("session_builds")
+
+
+def _llm_key(llm, prompt):
+    model = getattr(llm, "model_name", None) or type(llm).__name__
+    return model, hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+
+
+def invoke_once(llm, prompt):
+    """llm.invoke(prompt).content, shared with any identical call already in flight."""
+    return llm_calls.do(_llm_key(llm, prompt), lambda: llm.invoke(prompt).content)
+
+
+async def ainvoke_once(llm, prompt):
+    """Async invoke_once()."""
+    async def call():
+        return (await llm.ainvoke(prompt)).content
+
+    return await llm_calls.ado(_llm_key(llm, prompt), call)
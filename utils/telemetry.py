@@ -0,0 +1,231 @@
+import contextvars
+import functools
+import inspect
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+try:
+    from opentelemetry import trace
+    _tracer = trace.get_tracer("cognix")
+except ImportError:  # tracing is optional; metrics still work
+    trace = None
+    _tracer = None
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60)
+
+# Name of the innermost instrumented stage, so LLM token usage can be attributed to it
+_current_stage = contextvars.ContextVar("cognix_stage", default="unknown")
+
+
+class Histogram:
+    def __init__(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(buckets)
+        self._series = {}  # sorted label items -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._series.setdefault(key, [0] * len(self.buckets) + [0.0, 0])
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                for bound, count in zip(self.buckets, series):
+                    lines.append(f"{self.name}_bucket{_labels(key, le=str(bound))} {count}")
+                lines.append(f"{self.name}_bucket{_labels(key, le='+Inf')} {series[-1]}")
+                lines.append(f"{self.name}_sum{_labels(key)} {series[-2]:.6f}")
+                lines.append(f"{self.name}_count{_labels(key)} {series[-1]}")
+        return lines
+
+
+class Counter:
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help_text = help_text
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._series[key] = self._series.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._series.items()):
+                lines.append(f"{self.name}{_labels(key)} {value}")
+        return lines
+
+
+class Gauge:
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help_text = help_text
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def set(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._series[key] = value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} gauge"]
+        with self._lock:
+            for key, value in sorted(self._series.items()):
+                lines.append(f"{self.name}{_labels(key)} {value}")
+        return lines
+
+
+def _labels(key, **extra):
+    items = list(key) + list(extra.items())
+    if not items:
+        return ""
+    body = ",".join(f'{k}="{str(v)}"' for k, v in items)
+    return "{" + body + "}"
+
+
+STAGE_DURATION = Histogram("cognix_stage_duration_seconds", "Duration of instrumented agent stages.")
+STAGE_ERRORS = Counter("cognix_stage_errors_total", "Instrumented stages that raised.")
+HTTP_DURATION = Histogram("cognix_http_request_duration_seconds", "HTTP request latency by route.")
+LLM_TOKENS = Counter("cognix_llm_tokens_total", "LLM tokens by stage and kind (prompt/completion).")
+LLM_CALLS = Counter("cognix_llm_calls_total", "LLM calls by stage.")
+CACHE_REQUESTS = Counter("cognix_cache_requests_total", "Cache lookups by cache and result.")
+PRESCORE_DECISIONS = Counter("cognix_prescore_decisions_total", "Local pre-scorer decisions (accept/reject/ambiguous).")
+PROMPT_CONTEXT_TOKENS = Counter("cognix_prompt_context_tokens_total", "Prompt context tokens by prompt, before and after fitting to the budget.")
+STARTUP_SECONDS = Gauge("cognix_startup_seconds", "Cold start cost by phase (module import, warm-up steps).")
+
+METRICS = [STAGE_DURATION, STAGE_ERRORS, HTTP_DURATION, LLM_TOKENS, LLM_CALLS, CACHE_REQUESTS, PRESCORE_DECISIONS, PROMPT_CONTEXT_TOKENS, STARTUP_SECONDS]
+
+
+def render_prometheus():
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+@contextmanager
+def span(name, **attributes):
+    """Time a block: OpenTelemetry span plus the stage duration histogram."""
+    token = _current_stage.set(name)
+    started = time.perf_counter()
+    try:
+        if _tracer:
+            with _tracer.start_as_current_span(name, attributes=attributes) as current:
+                yield current
+        else:
+            yield None
+    except Exception:
+        STAGE_ERRORS.inc(stage=name)
+        raise
+    finally:
+        STAGE_DURATION.observe(time.perf_counter() - started, stage=name)
+        _current_stage.reset(token)
+
+
+def traced(name):
+    """Decorator form of span() for sync functions, coroutines and async generators."""
+
+    def decorator(fn):
+        if inspect.isasyncgenfunction(fn):
+            @functools.wraps(fn)
+            async def agen_wrapper(*args, **kwargs):
+                # The span must not stay "current" across yields, so it is not attached to the context
+                otel_span = _tracer.start_span(name) if _tracer else None
+                started = time.perf_counter()
+                try:
+                    async for item in fn(*args, **kwargs):
+                        yield item
+                except Exception:
+                    STAGE_ERRORS.inc(stage=name)
+                    raise
+                finally:
+                    STAGE_DURATION.observe(time.perf_counter() - started, stage=name)
+                    if otel_span:
+                        otel_span.end()
+            return agen_wrapper
+
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with span(name):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+
+    return decorator
+
+
+def record_cache(cache, hit):
+    CACHE_REQUESTS.inc(cache=cache, result="hit" if hit else "miss")
+    if trace is not None:
+        trace.get_current_span().set_attribute(f"cache.{cache}.hit", bool(hit))
+
+
+class LLMUsageCallback(BaseCallbackHandler):
+    """Attributes prompt/completion token counts of every LLM call to the current stage."""
+
+    run_inline = True
+
+    def on_llm_end(self, response, **kwargs):
+        stage = _current_stage.get()
+        prompt_tokens, completion_tokens = _token_usage(response)
+        LLM_CALLS.inc(stage=stage)
+        LLM_TOKENS.inc(prompt_tokens, stage=stage, kind="prompt")
+        LLM_TOKENS.inc(completion_tokens, stage=stage, kind="completion")
+        if trace is not None:
+            current = trace.get_current_span()
+            current.set_attribute("llm.prompt_tokens", prompt_tokens)
+            current.set_attribute("llm.completion_tokens", completion_tokens)
+
+
+def _token_usage(response):
+    for generations in response.generations or []:
+        for generation in generations:
+            usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+            if usage:
+                return usage.get("input_tokens", 0), usage.get("output_tokens", 0)
+    usage = (response.llm_output or {}).get("token_usage") or {}
+    return usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0)
+
+
+llm_usage_callback = LLMUsageCallback()
+
+
+def configure_tracing():
+    """Export spans over OTLP when OTEL_EXPORTER_OTLP_ENDPOINT is set; otherwise spans are no-ops."""
+    if trace is None or not os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT"):
+        return False
+    try:
+        from opentelemetry.exporter.otlp.proto.grpc.trace_exporter import OTLPSpanExporter
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor
+    except ImportError as err:
+        print(f"OpenTelemetry SDK/exporter not available, tracing disabled: {err}")
+        return False
+
+    provider = TracerProvider(resource=Resource.create({"service.name": os.getenv("OTEL_SERVICE_NAME", "cognix")}))
+    provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter()))
+    trace.set_tracer_provider(provider)
+    return True
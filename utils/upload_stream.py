@@ -0,0 +1,140 @@
+import asyncio
+
+from python_multipart.multipart import MultipartParser, parse_options_header
+
+# Parsed bytes are handed to a worker thread in batches of about this size
+WRITE_BATCH_BYTES = 1 << 20
+
+
+class UploadError(ValueError):
+    pass
+
+
+class _Part:
+    __slots__ = ("name", "filename", "writer", "pending", "pending_bytes", "done", "digest")
+
+    def __init__(self):
+        self.name = None
+        self.filename = None
+        self.writer = None
+        self.pending = []
+        self.pending_bytes = 0
+        self.done = False
+        self.digest = None
+
+
+class StreamingUploadParser:
+    """
+    Reads a multipart/form-data request body chunk by chunk and writes each
+    file part straight into the blob store: no spooled copy of the request,
+    hashing as the bytes arrive, and file writes done in a worker thread so
+    the event loop never blocks on disk. A part larger than max_file_bytes
+    fails the upload as soon as the limit is crossed.
+    """
+
+    def __init__(self, store, fields, max_file_bytes):
+        self.store = store
+        self.fields = set(fields)
+        self.max_file_bytes = max_file_bytes
+        self._parts = []
+        self._current = None
+        self._header_name = b""
+        self._header_value = b""
+        self._disposition = b""
+
+    async def parse(self, content_type, stream):
+        """Returns {field: {"sha256", "size", "filename"}} for every uploaded file field."""
+        _, params = parse_options_header(content_type or "")
+        boundary = params.get(b"boundary")
+        if not boundary:
+            raise UploadError("Expected a multipart/form-data body.")
+
+        parser = MultipartParser(boundary, {
+            "on_part_begin": self._on_part_begin,
+            "on_part_data": self._on_part_data,
+            "on_part_end": self._on_part_end,
+            "on_header_field": self._on_header_field,
+            "on_header_value": self._on_header_value,
+            "on_header_end": self._on_header_end,
+            "on_headers_finished": self._on_headers_finished,
+        })
+        try:
+            async for chunk in stream:
+                parser.write(chunk)
+                if any((part.done and part.digest is None) or part.pending_bytes >= WRITE_BATCH_BYTES for part in self._parts):
+                    await asyncio.to_thread(self._flush)
+            parser.finalize()
+            await asyncio.to_thread(self._flush)
+        except BaseException:
+            await asyncio.to_thread(self._abort)
+            raise
+
+        files = {}
+        for part in self._parts:
+            if part.digest is None:
+                raise UploadError(f"Upload of '{part.name}' was incomplete.")
+            if not part.digest:
+                continue
+            files[part.name] = {"sha256": part.digest, "size": part.writer.size, "filename": part.filename}
+        return files
+
+    def _on_part_begin(self):
+        self._current = _Part()
+        self._disposition = b""
+
+    def _on_header_field(self, data, start, end):
+        self._header_name += data[start:end]
+
+    def _on_header_value(self, data, start, end):
+        self._header_value += data[start:end]
+
+    def _on_header_end(self):
+        if self._header_name.lower() == b"content-disposition":
+            self._disposition = self._header_value
+        self._header_name = b""
+        self._header_value = b""
+
+    def _on_headers_finished(self):
+        _, options = parse_options_header(self._disposition)
+        part = self._current
+        part.name = options.get(b"name", b"").decode("utf-8", "replace")
+        if part.name not in self.fields:
+            raise UploadError(f"Unexpected form field '{part.name}'.")
+        if any(existing.name == part.name for existing in self._parts):
+            raise UploadError(f"Form field '{part.name}' was sent twice.")
+        filename = options.get(b"filename")
+        part.filename = filename.decode("utf-8", "replace") if filename is not None else None
+        # Creating the temp file is a few syscalls; cheap enough for the loop
+        part.writer = self.store.writer(self.max_file_bytes)
+        self._parts.append(part)
+
+    def _on_part_data(self, data, start, end):
+        part = self._current
+        # Checked here, so an oversized upload is refused before it is written
+        part.writer.check_size(part.writer.size + part.pending_bytes + (end - start))
+        part.pending.append(data[start:end])
+        part.pending_bytes += end - start
+
+    def _on_part_end(self):
+        self._current.done = True
+
+    def _flush(self):
+        # Runs in a worker thread
+        for part in self._parts:
+            if part.pending:
+                part.writer.write(b"".join(part.pending))
+                part.pending = []
+                part.pending_bytes = 0
+            if part.done and part.digest is None:
+                if part.writer.size:
+                    part.digest = part.writer.commit()
+                else:
+                    # Browsers send an empty part for a file input left blank
+                    part.writer.abort()
+                    part.digest = ""
+
+    def _abort(self):
+        for part in self._parts:
+            if part.digest is None and part.writer is not None:
+                part.writer.abort()
+